@@ -1,29 +1,35 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
 from werkzeug.utils import secure_filename
-from services.image_processor import ImageProcessor
+from services.image_processor import ImageProcessor, remove_files
 from services.ocr_service import OCRService
 from services.knowledge_service import KnowledgeService
 from services.ai_grading_service import AIGradingService
+from services.pipeline import HomeworkPipeline
+from services.job_manager import JobManager
+from services.concurrency import get_concurrency_stats, get_executor
+from services.async_engine import get_async_engine, get_async_engine_stats
+from services.http_client import get_http_pool_stats
+from services.resilience import get_resilience_stats
+from services.hedging import get_hedge_stats
+from services.rate_limiter import get_rate_limit_stats
+from services.deadline import Deadline
+from services.disk_cache import DiskCache
+from services.response_archive import ResponseArchiveStore
+from services.image_buffer import ImageBuffer
+from services.metrics import REGISTRY, gauge_family
 from config import Config
+from services.log_utils import configure_logging
 import logging
-from logging.handlers import RotatingFileHandler
 
 # 创建logger对象
 logger = logging.getLogger(__name__)
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s %(message)s',
-    handlers=[
-        RotatingFileHandler('app.log', maxBytes=10*1024*1024, backupCount=5, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 配置日志（production模式下由后台线程写文件，见Config.LOG_MODE）
+configure_logging()
 
 
 
@@ -33,9 +39,46 @@ CORS(app)
 
 # 初始化服务
 image_processor = ImageProcessor()
-ocr_service = OCRService()
+ocr_cache = DiskCache(
+    'OCR结果',
+    Config.OCR_CACHE_DIR,
+    max_entries=Config.OCR_CACHE_MAX_ENTRIES,
+    ttl=Config.OCR_CACHE_TTL,
+    max_bytes=Config.OCR_CACHE_MAX_BYTES,
+    compresslevel=Config.OCR_CACHE_COMPRESSLEVEL
+) if Config.OCR_CACHE_ENABLED else None
+ocr_service = OCRService(ocr_cache)
 knowledge_service = KnowledgeService()
 ai_grading_service = AIGradingService()
+result_cache = DiskCache(
+    '批改结果',
+    Config.RESULT_CACHE_DIR,
+    max_entries=Config.RESULT_CACHE_MAX_ENTRIES,
+    ttl=Config.RESULT_CACHE_TTL
+) if Config.RESULT_CACHE_ENABLED else None
+response_archive = ResponseArchiveStore(
+    Config.RESPONSE_ARCHIVE_DIR,
+    compresslevel=Config.RESPONSE_ARCHIVE_COMPRESSLEVEL,
+    ttl=Config.RESPONSE_ARCHIVE_TTL
+) if Config.RESPONSE_ARCHIVE_ENABLED else None
+pipeline = HomeworkPipeline(
+    image_processor, ocr_service, knowledge_service, ai_grading_service, result_cache,
+    engine=get_async_engine() if Config.PIPELINE_ENGINE == 'asyncio' else None,
+    response_archive=response_archive
+)
+job_manager = JobManager(
+    pipeline,
+    max_workers=Config.JOB_WORKERS,
+    max_pending=Config.JOB_QUEUE_SIZE,
+    result_ttl=Config.JOB_RESULT_TTL
+)
+disk_caches = {name: cache for name, cache in (('result', result_cache), ('ocr', ocr_cache)) if cache is not None}
+if disk_caches:
+    REGISTRY.register_collector(
+        lambda: gauge_family(
+            'pigai_cache', '磁盘缓存状态', 'cache', {name: cache.stats() for name, cache in disk_caches.items()}
+        )
+    )
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -78,8 +121,13 @@ def upload_image():
 
 @app.route('/api/process', methods=['POST'])
 def process_homework():
-    """处理作业批改"""
-    import time
+    """提交作业批改任务
+
+    默认将任务放入后台队列并立即返回job_id，通过/api/results/<job_id>查询进度和结果；
+    请求体中传入wait=true时同步执行并直接返回批改结果，传入force=true时跳过结果缓存，
+    传入deadline_ms时整个请求（含排队）限时完成，到期时返回已完成的题目，其余题目标记timed_out。
+    segmenter指定题目分割引擎（remote、local、auto或layout），默认取SEGMENTATION_ENGINE配置。
+    """
     start_time = time.time()
     
     try:
@@ -102,157 +150,260 @@ def process_homework():
         file_size = os.path.getsize(filepath)
         logger.info(f"文件大小: {file_size} 字节")
         
-        # 步骤1: 题目分割
-        step1_start = time.time()
-        logger.info("=== 步骤1: 开始题目分割 ===")
-        segmentation_result = image_processor.segment_questions(filepath)
-        step1_time = time.time() - step1_start
-        
-        if not segmentation_result['success']:
-            logger.error(f"题目分割失败: {segmentation_result['error']}")
-            return jsonify({'error': f'题目分割失败: {segmentation_result["error"]}'}), 500
-        
-        logger.info(f"题目分割完成，用时: {step1_time:.2f}秒，检测到{len(segmentation_result.get('coordinates', []))}个题目")
-        
-        # 步骤2: OCR识别
-        step2_start = time.time()
-        logger.info("=== 步骤2: 开始OCR识别 ===")
-        ocr_result = ocr_service.extract_text(filepath)
-        step2_time = time.time() - step2_start
-        
-        if not ocr_result['success']:
-            logger.error(f"OCR识别失败: {ocr_result['error']}")
-            return jsonify({'error': f'OCR识别失败: {ocr_result["error"]}'}), 500
-        
-        text_length = len(ocr_result.get('text_content', ''))
-        logger.info(f"OCR识别完成，用时: {step2_time:.2f}秒，识别文本长度: {text_length}")
-        
-        # 获取字符级坐标信息用于批改
-        text_items = ocr_service.get_text_with_coordinates(ocr_result)
-        char_details = ocr_service.get_character_coordinates(text_items)
-        logger.info(f"提取字符级坐标信息: {len(text_items)}个文本块，{len(char_details)}个字符")
-        
-        # 步骤3: 题目分割与处理
-        step3_start = time.time()
-        logger.info("=== 步骤3: 开始题目分割与处理 ===")
-        questions = image_processor.split_questions(filepath, segmentation_result['coordinates'], ocr_result, char_details)
-        step3_time = time.time() - step3_start
-        
-        logger.info(f"题目分割处理完成，用时: {step3_time:.2f}秒，处理了{len(questions)}个题目")
-        
-        # 步骤4: 原题检索和批改
-        step4_start = time.time()
-        logger.info("=== 步骤4: 开始原题检索和AI批改（并发模式）===")
-        results = [None] * len(questions)  # 预分配结果数组
-        successful_grading = 0
-        
-        def process_question(i, question):
-            """处理单个题目的函数"""
-            question_start = time.time()
-            logger.info(f"--- 并发处理第{i+1}题，文本: {question['text'][:50]}... ---")
-            
-            # 知识库检索（传递图片路径）
-            search_start = time.time()
-            search_result = knowledge_service.search_similar_question(
-                question['text'], 
-                question['image_path']
-            )
-            search_time = time.time() - search_start
-            
-            logger.info(f"第{i+1}题知识库检索完成，用时: {search_time:.2f}秒，相似度: {search_result.get('similarity_score', 0)}")
-            
-            # AI批改
-            grading_start = time.time()
-            grading_result = ai_grading_service.grade_question(
-                question['image_path'],
-                question['text'],
-                search_result,  # 传递整个知识库检索结果
-                question.get('char_details', [])  # 传递字符级坐标信息
-            )
-            grading_time = time.time() - grading_start
+        try:
+            deadline = parse_deadline(data.get('deadline_ms'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'deadline_ms参数无效'}), 400
+        
+        segmenter = data.get('segmenter')
+        if not valid_segmenter(segmenter):
+            return jsonify({'error': 'segmenter参数无效'}), 400
+        
+        force = bool(data.get('force'))
+        if data.get('wait'):
+            result = pipeline.process(filepath, force=force, deadline=deadline, segmenter=segmenter)
+            if not result['success']:
+                return failure_response(result)
+            return jsonify(result)
+        
+        job = job_manager.submit(filepath, filename, force=force, deadline=deadline, segmenter=segmenter)
+        if job is None:
+            return jsonify({'error': '批改任务过多，请稍后重试'}), 503
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': f'/api/results/{job.job_id}'
+        }), 202
+        
+    except Exception as e:
+        total_time = time.time() - start_time
+        logger.error(f"作业处理失败: {str(e)}, 用时: {total_time:.2f}秒")
+        logger.error(f"异常类型: {type(e).__name__}")
+        import traceback
+        logger.error(f"异常堆栈: {traceback.format_exc()}")
+        return jsonify({'error': f'处理失败: {str(e)}'}), 500
+
+@app.route('/api/batch', methods=['POST'])
+def process_batch():
+    """批量作业批改接口
+
+    接收多张图片（files字段，可重复）或一个多页PDF，按页流水线执行批改：
+    下一页的题目分割与OCR与当前页的检索批改重叠进行。默认返回job_id，
+    通过/api/results/<job_id>查询逐页结果；表单参数wait=true时同步返回，force=true时跳过结果缓存，
+    deadline_ms为整个批次的限时，segmenter指定题目分割引擎。
+    """
+    start_time = time.time()
+    rendered_paths = []  # PDF渲染出的页面图片，未交给流水线就返回时删除
+    
+    try:
+        try:
+            deadline = parse_deadline(request.form.get('deadline_ms'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'deadline_ms参数无效'}), 400
+        
+        segmenter = request.form.get('segmenter')
+        if not valid_segmenter(segmenter):
+            return jsonify({'error': 'segmenter参数无效'}), 400
+        
+        files = [file for file in request.files.getlist('files') if file and file.filename]
+        if not files:
+            return jsonify({'error': '没有上传文件'}), 400
+        for file in files:
+            if not allowed_file(file.filename, app.config['ALLOWED_EXTENSIONS'] | {'pdf'}):
+                return jsonify({'error': f'不支持的文件格式: {file.filename}'}), 400
+        
+        # 图片每个文件一页，先扣除；PDF在渲染前按页数（fitz只读取页数）检查剩余名额，超限时不渲染
+        max_pages = app.config['BATCH_MAX_PAGES']
+        page_count = sum(1 for file in files if not file.filename.lower().endswith('.pdf'))
+        if page_count > max_pages:
+            return jsonify({'error': f'页数超过上限: {page_count}/{max_pages}'}), 400
+        
+        batch_id = uuid.uuid4().hex[:8]
+        page_paths = []
+        for file in files:
+            filename = f"{batch_id}_{secure_filename(file.filename)}"
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            file.save(filepath)
             
-            success = grading_result.get('success', False)
-            if success:
-                logger.info(f"第{i+1}题AI批改完成，用时: {grading_time:.2f}秒，得分: {grading_result.get('score', '未知')}")
+            if filename.lower().endswith('.pdf'):
+                render_result = image_processor.render_pdf_pages(
+                    filepath, app.config['UPLOAD_FOLDER'], max_pages=max_pages - page_count
+                )
+                if not render_result['success']:
+                    remove_files(rendered_paths)
+                    if 'page_count' in render_result:
+                        total = page_count + render_result['page_count']
+                        return jsonify({'error': f'页数超过上限: {total}/{max_pages}'}), 400
+                    return jsonify({'error': render_result['error']}), 400
+                rendered_paths.extend(render_result['page_paths'])
+                page_paths.extend(render_result['page_paths'])
+                page_count += len(render_result['page_paths'])
             else:
-                logger.error(f"第{i+1}题AI批改失败: {grading_result.get('error', '未知错误')}")
-            
-            question_time = time.time() - question_start
-            logger.info(f"第{i+1}题总处理时间: {question_time:.2f}秒")
-            
-            return i, {
-                'question_id': i + 1,
-                'coordinates': question['coordinates'],
-                'text': question['text'],
-                'reference_answer': search_result.get('reference_answer', ''),
-                'similarity_score': search_result.get('similarity_score', 0),
-                'grading_result': grading_result,
-                'image_path': question['image_path']
-            }, success
-        
-        # 检查是否有题目需要处理
-        if not questions:
-            logger.warning("没有检测到任何题目，跳过批改步骤")
-            return []
-        
-        # 使用线程池并发处理所有题目
-        max_workers = min(len(questions), 20)  # 最多20个并发线程，适应一页最多20道题目的处理需求
-        logger.info(f"启动{max_workers}个并发线程处理{len(questions)}道题目")
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_question = {executor.submit(process_question, i, question): i 
-                                for i, question in enumerate(questions)}
-            
-            # 收集结果
-            for future in as_completed(future_to_question):
-                try:
-                    i, result, success = future.result()
-                    results[i] = result  # 按原序号放置结果
-                    if success:
-                        successful_grading += 1
-                except Exception as exc:
-                    question_idx = future_to_question[future]
-                    logger.error(f'第{question_idx+1}题处理时发生异常: {exc}')
-                    # 创建错误结果
-                    results[question_idx] = {
-                        'question_id': question_idx + 1,
-                        'coordinates': questions[question_idx]['coordinates'],
-                        'text': questions[question_idx]['text'],
-                        'reference_answer': '',
-                        'similarity_score': 0,
-                        'grading_result': {'success': False, 'error': str(exc)},
-                        'image_path': questions[question_idx]['image_path']
-                    }
-        
-        step4_time = time.time() - step4_start
+                page_paths.append(filepath)
+        
+        name = ', '.join(file.filename for file in files)
+        logger.info(f"批量批改请求: {name}，共{len(page_paths)}页，批次: {batch_id}")
+        
+        force = request.form.get('force', '').lower() in ('1', 'true')
+        if request.form.get('wait', '').lower() in ('1', 'true'):
+            result = pipeline.process_batch(page_paths, force=force, deadline=deadline, segmenter=segmenter)
+            return jsonify(result), (200 if result['success'] else 500)
+        
+        job = job_manager.submit_batch(page_paths, name, force=force, deadline=deadline, segmenter=segmenter)
+        if job is None:
+            remove_files(rendered_paths)
+            return jsonify({'error': '批改任务过多，请稍后重试'}), 503
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.job_id,
+            'status': job.status,
+            'total_pages': len(page_paths),
+            'status_url': f'/api/results/{job.job_id}'
+        }), 202
+        
+    except Exception as e:
         total_time = time.time() - start_time
+        logger.error(f"批量批改失败: {str(e)}, 用时: {total_time:.2f}秒")
+        import traceback
+        logger.error(f"异常堆栈: {traceback.format_exc()}")
+        remove_files(rendered_paths)
+        return jsonify({'error': f'批量处理失败: {str(e)}'}), 500
+
+@app.route('/api/process/stream', methods=['GET', 'POST'])
+def process_homework_stream():
+    """流式作业批改接口（Server-Sent Events）
+
+    先推送题目分割框（segmentation_ready），随后每道题批改完成即推送question_completed，
+    最后推送completed或failed结束事件。GET请求通过查询参数传入filename，便于EventSource使用。
+    """
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args
+    filename = (data or {}).get('filename')
+    
+    logger.info(f"开始流式作业批改请求，文件名: {filename}")
+    
+    if not filename:
+        return jsonify({'error': '缺少文件名参数'}), 400
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        logger.error(f"文件不存在: {filepath}")
+        return jsonify({'error': '文件不存在'}), 404
+    
+    try:
+        deadline = parse_deadline((data or {}).get('deadline_ms'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'deadline_ms参数无效'}), 400
+    
+    segmenter = (data or {}).get('segmenter')
+    if not valid_segmenter(segmenter):
+        return jsonify({'error': 'segmenter参数无效'}), 400
+    
+    force = str((data or {}).get('force', '')).lower() in ('1', 'true')
+    job = job_manager.submit(filepath, filename, force=force, deadline=deadline, segmenter=segmenter)
+    if job is None:
+        return jsonify({'error': '批改任务过多，请稍后重试'}), 503
+    
+    return stream_job_events(job)
+
+@app.route('/api/grade', methods=['POST'])
+def upload_and_grade():
+    """上传并批改（单次请求）
+
+    multipart上传的图片只读入内存一次，题目分割、OCR、题目切分和结果缓存共用同一份数据，
+    省去先/api/upload再/api/process的往返和重复读盘。表单参数：wait=true时同步返回批改结果，
+    stream=true时以Server-Sent Events推送进度，force=true时跳过结果缓存，
+    persist=true/false控制是否在后台线程中把原图保存到uploads/（默认取UPLOAD_PERSIST配置），
+    deadline_ms为整个请求的限时，segmenter指定题目分割引擎（remote、local、auto或layout）。
+    """
+    start_time = time.time()
+    
+    try:
+        try:
+            deadline = parse_deadline(request.form.get('deadline_ms'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'deadline_ms参数无效'}), 400
         
-        logger.info(f"原题检索和批改完成，用时: {step4_time:.2f}秒，成功批改: {successful_grading}/{len(questions)}题")
-        logger.info(f"=== 作业处理完成，总用时: {total_time:.2f}秒 ===")
-        logger.info(f"处理统计: 题目分割({step1_time:.2f}s) + OCR识别({step2_time:.2f}s) + 题目处理({step3_time:.2f}s) + 检索批改({step4_time:.2f}s)")
+        segmenter = request.form.get('segmenter')
+        if not valid_segmenter(segmenter):
+            return jsonify({'error': 'segmenter参数无效'}), 400
+        
+        if 'file' not in request.files:
+            return jsonify({'error': '没有上传文件'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': '没有选择文件'}), 400
+        if not allowed_file(file.filename):
+            return jsonify({'error': '不支持的文件格式'}), 400
+        
+        filename = secure_filename(file.filename)
+        image = ImageBuffer(file.read(), filename)
+        logger.info(f"收到上传并批改请求: {filename}，大小: {len(image.data)} 字节")
+        
+        persist = request.form.get('persist', str(Config.UPLOAD_PERSIST)).lower() in ('1', 'true')
+        if persist:
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex[:8]}_{filename}")
+            get_executor('persist').submit(save_upload, filepath, image.data)
+        
+        force = request.form.get('force', '').lower() in ('1', 'true')
+        if request.form.get('wait', '').lower() in ('1', 'true'):
+            result = pipeline.process(image, force=force, deadline=deadline, segmenter=segmenter)
+            if not result['success']:
+                return failure_response(result)
+            return jsonify(result)
+        
+        job = job_manager.submit(image, filename, force=force, deadline=deadline, segmenter=segmenter)
+        if job is None:
+            return jsonify({'error': '批改任务过多，请稍后重试'}), 503
+        
+        if request.form.get('stream', '').lower() in ('1', 'true'):
+            return stream_job_events(job)
         
         return jsonify({
             'success': True,
-            'results': results,
-            'total_questions': len(results),
-            'processing_time': total_time,
-            'successful_grading': successful_grading
-        })
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': f'/api/results/{job.job_id}'
+        }), 202
         
     except Exception as e:
         total_time = time.time() - start_time
-        logger.error(f"作业处理失败: {str(e)}, 用时: {total_time:.2f}秒")
-        logger.error(f"异常类型: {type(e).__name__}")
+        logger.error(f"上传并批改失败: {str(e)}, 用时: {total_time:.2f}秒")
         import traceback
         logger.error(f"异常堆栈: {traceback.format_exc()}")
         return jsonify({'error': f'处理失败: {str(e)}'}), 500
 
-@app.route('/api/results/<filename>')
-def get_results(filename):
-    """获取处理结果"""
-    # 这里可以实现结果缓存和查询逻辑
-    pass
+@app.route('/api/results/<job_id>')
+def get_results(job_id):
+    """获取批改任务状态、阶段进度和（部分）结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    
+    return jsonify(job.to_dict())
+
+@app.route('/api/status')
+def get_status():
+    """服务运行状态：共享线程池和下游舱壁的并发与饱和统计、结果缓存和OCR缓存命中情况、下游连接复用情况、重试预算、熔断和请求对冲状态、下游限流和OCR当日剩余额度、原始响应归档统计"""
+    status = get_concurrency_stats()
+    status['result_cache'] = result_cache.stats() if result_cache else None
+    status['ocr_cache'] = ocr_cache.stats() if ocr_cache else None
+    status['response_archive'] = response_archive.stats() if response_archive else None
+    status['pipeline_engine'] = Config.PIPELINE_ENGINE
+    status['async_engine'] = get_async_engine_stats()
+    status['http_pools'] = get_http_pool_stats()
+    status['resilience'] = get_resilience_stats()
+    status['hedging'] = get_hedge_stats()
+    status['rate_limits'] = get_rate_limit_stats()
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus指标：各步骤和各下游服务的延迟分布、重试和错误次数、在途请求数"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/knowledge/search', methods=['POST'])
 def knowledge_search_detail():
@@ -351,10 +502,71 @@ def knowledge_search_detail():
         logger.error(f"异常堆栈: {traceback.format_exc()}")
         return jsonify({'error': f'检索失败: {str(e)}'}), 500
 
-def allowed_file(filename):
+def stream_job_events(job):
+    """以Server-Sent Events推送任务的进度事件，直到任务结束"""
+    def generate():
+        yield format_sse('job', {'job_id': job.job_id})
+        cursor = 0
+        while True:
+            events, cursor, finished = job.wait_events(cursor, timeout=15)
+            if not events and not finished:
+                # 保持连接，避免代理因长时间无数据而断开
+                yield ': keep-alive\n\n'
+                continue
+            for event, payload in events:
+                yield format_sse(event, payload)
+            if finished:
+                break
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def parse_deadline(deadline_ms):
+    """根据deadline_ms参数创建请求截止时间
+
+    Returns:
+        Deadline: 截止时间；未传入时使用DEFAULT_DEADLINE_MS，不限时为None
+
+    Raises:
+        TypeError, ValueError: deadline_ms不是整数
+    """
+    if deadline_ms in (None, ''):
+        deadline_ms = Config.DEFAULT_DEADLINE_MS
+    return Deadline.from_ms(int(deadline_ms))
+
+def valid_segmenter(segmenter):
+    """segmenter参数是否有效：未传入（使用Config.SEGMENTATION_ENGINE）或为remote、local、auto、layout之一"""
+    return segmenter in (None, '') or segmenter in Config.SEGMENTATION_ENGINES
+
+def failure_response(result):
+    """同步批改失败时的响应，超过截止时间时返回504"""
+    body = {'error': result['error'], 'stage_timings': result.get('timings', {})}
+    if result.get('timed_out'):
+        body['timed_out'] = True
+        return jsonify(body), 504
+    return jsonify(body), 500
+
+def save_upload(filepath, data):
+    """保存上传原图（在后台线程中执行，失败只记录日志）"""
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        logger.info(f"上传原图已保存: {filepath}")
+    except OSError as e:
+        logger.error(f"保存上传原图失败: {filepath}, {str(e)}")
+
+def format_sse(event, payload):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def allowed_file(filename, allowed_extensions=None):
     """检查文件扩展名是否允许"""
+    allowed_extensions = allowed_extensions or app.config['ALLOWED_EXTENSIONS']
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,145 @@
+"""对比本地题目分割（OpenCV或OCR版面）与归档中记录的远程YOLOX分割结果
+
+从原始响应归档中读取远程分割的原始响应和耗时，对同一页运行本地分割，
+按IoU一对一匹配题目框，输出每页及汇总的耗时和框一致性（精确率、召回率、平均IoU）。
+不发起任何网络请求。--engine local对同一页图片运行OpenCV分割，归档中没有记录图片路径的页面
+（/api/grade内存上传且未保存原图）需用--image指定；--engine layout使用归档中同一页的OCR原始响应，不需要图片。
+
+用法:
+    python benchmark_segmenter.py cache/archives
+    python benchmark_segmenter.py cache/archives/<任务ID>.jsonl.gz --image 0=uploads/page.jpg --repeat 5
+    python benchmark_segmenter.py cache/archives --engine layout
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from functools import partial
+
+from config import Config
+from services.image_processor import ImageProcessor
+from services.layout_segmenter import compare_segmentations
+from services.ocr_service import OCRService
+from services.response_archive import ARCHIVE_SUFFIX, read_archive
+
+
+def parse_images(values):
+    """解析--image参数（页码=图片路径，页码从0开始）"""
+    filepaths = {}
+    for value in values:
+        page, _, path = value.partition('=')
+        filepaths[int(page)] = path
+    return filepaths
+
+
+def archive_paths(paths):
+    """展开参数中的归档文件和目录"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(ARCHIVE_SUFFIX):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比本地题目分割与归档中的远程分割结果')
+    parser.add_argument('archives', nargs='+', help='归档文件或归档目录')
+    parser.add_argument('--engine', choices=('local', 'layout'), default='local',
+                        help='对比的本地分割引擎：local为OpenCV图片分割，layout为OCR版面划分')
+    parser.add_argument('--image', action='append', default=[], metavar='PAGE=PATH',
+                        help='指定页面图片路径（默认使用归档中记录的路径，只对单个归档有意义），可多次指定')
+    parser.add_argument('--iou', type=float, default=0.5, help='判定两个框一致的IoU阈值')
+    parser.add_argument('--repeat', type=int, default=1, help='本地分割重复次数，耗时取中位数')
+    parser.add_argument('--output', help='结果写入的JSON文件（默认输出到标准输出）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    image_processor = ImageProcessor()
+    ocr_service = OCRService()
+    filepaths = parse_images(args.image)
+    pages = []
+    skipped = 0
+
+    for path in archive_paths(args.archives):
+        records = {}
+        for record in read_archive(path):
+            if record['type'] in ('segmentation', 'ocr'):
+                records.setdefault(record.get('page', 0), {})[record['type']] = record
+
+        for page, page_records in sorted(records.items()):
+            record = page_records.get('segmentation')
+            if record is None or record.get('engine', 'remote') != 'remote':
+                continue
+            if args.engine == 'layout':
+                if 'ocr' not in page_records:
+                    skipped += 1
+                    continue
+                source = page_records['ocr']['raw_result']
+                segment = lambda: image_processor.segment_questions_layout(ocr_service._build_ocr_result(source))
+            else:
+                source = filepaths.get(page) or record.get('source')
+                if not source or not os.path.exists(source):
+                    skipped += 1
+                    continue
+                segment = partial(image_processor.segment_questions_local, source)
+
+            remote = image_processor._parse_coordinates(record['raw_result'])
+            samples = []
+            for _ in range(max(1, args.repeat)):
+                start = time.perf_counter()
+                local_result = segment()
+                samples.append(time.perf_counter() - start)
+            entry = {'archive': path, 'page': page, 'image': record.get('source')}
+            if not local_result['success']:
+                entry['error'] = local_result['error']
+                pages.append(entry)
+                continue
+
+            local = local_result['coordinates']
+            agreement = compare_segmentations(remote, local, args.iou)
+            entry.update({
+                'remote_elapsed': record.get('elapsed'),
+                'local_elapsed': statistics.median(samples),
+                'remote_boxes': len(remote),
+                'local_boxes': len(local),
+                **agreement
+            })
+            pages.append(entry)
+
+    compared = [page for page in pages if 'error' not in page]
+    summary = {
+        'engine': args.engine, 'pages': len(compared), 'failed': len(pages) - len(compared),
+        'skipped': skipped, 'iou_threshold': args.iou
+    }
+    if compared:
+        remote_elapsed = [page['remote_elapsed'] for page in compared if page['remote_elapsed'] is not None]
+        total_remote = sum(page['remote_boxes'] for page in compared)
+        total_local = sum(page['local_boxes'] for page in compared)
+        total_matched = sum(page['matched'] for page in compared)
+        summary.update({
+            'remote_elapsed_median': statistics.median(remote_elapsed) if remote_elapsed else None,
+            'local_elapsed_median': statistics.median(page['local_elapsed'] for page in compared),
+            'precision': total_matched / total_local if total_local else 0.0,
+            'recall': total_matched / total_remote if total_remote else 0.0,
+            'exact_count_pages': sum(1 for page in compared if page['remote_boxes'] == page['local_boxes'])
+        })
+        if args.engine == 'local':
+            summary['local_work_width'] = Config.LOCAL_SEGMENTER_WORK_WIDTH
+        else:
+            summary['layout_gap_ratio'] = Config.LAYOUT_SEGMENTER_GAP_RATIO
+
+    output = json.dumps({'summary': summary, 'pages': pages}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,12 +13,45 @@ class Config:
     PROCESSED_FOLDER = 'processed'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+    UPLOAD_PERSIST = os.getenv('UPLOAD_PERSIST', 'true').lower() == 'true'  # /api/grade是否在后台保存上传原图
+    
+    # 上传前图片规范化：按EXIF方向摆正，长边超过服务上限时缩小并重新编码为JPEG，
+    # 题目分割框和OCR坐标换算回原图空间后再使用（长边上限为0表示不缩小）
+    IMAGE_NORMALIZE_ENABLED = os.getenv('IMAGE_NORMALIZE_ENABLED', 'true').lower() == 'true'
+    IMAGE_MAX_SIDE = {
+        'segmentation': int(os.getenv('SEGMENTATION_MAX_SIDE', 1600)),
+        'ocr': int(os.getenv('OCR_MAX_SIDE', 2560))
+    }
+    IMAGE_NORMALIZE_JPEG_QUALITY = int(os.getenv('IMAGE_NORMALIZE_JPEG_QUALITY', 90))
+    
+    # 题目切图配置：切图在内存中并行编码为JPEG后直接上传OBS，开启QUESTION_IMAGE_PERSIST时同时保存到PROCESSED_FOLDER
+    QUESTION_IMAGE_JPEG_QUALITY = int(os.getenv('QUESTION_IMAGE_JPEG_QUALITY', 75))
+    QUESTION_IMAGE_JPEG_SUBSAMPLING = os.getenv('QUESTION_IMAGE_JPEG_SUBSAMPLING', '4:2:0')  # 4:4:4、4:2:2或4:2:0
+    QUESTION_IMAGE_PERSIST = os.getenv('QUESTION_IMAGE_PERSIST', 'false').lower() == 'true'
+    
+    # 批量批改配置
+    BATCH_MAX_PAGES = int(os.getenv('BATCH_MAX_PAGES', 50))  # 单次批量批改的最大页数
+    PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', 200))  # PDF页面渲染分辨率
     
     # API配置
     
     # 接口2: 题目分割API
     SEGMENTATION_API_URL = 'http://1265037983932887.cn-shanghai.pai-eas.aliyuncs.com/api/predict/yolox250701'
     SEGMENTATION_API_TOKEN = 'YjkwZTdlM2EzYTE5ZTgyOGQwMGRlOWI1NzE0ZDk2NjcwNGNlNzI5ZA=='
+    # 题目分割引擎：remote为远程YOLOX接口，local为进程内OpenCV分割，auto为优先远程，
+    # 熔断中、失败或超过SEGMENTATION_FALLBACK_AFTER秒未完成时改用本地分割；
+    # layout为不调用分割接口，由OCR版面信息划分题目（没有划分出题目时回退到本配置的引擎，配置为layout时回退到remote）。可按请求用segmenter参数指定。
+    # 本地分割在样例页面上与远程结果差异较大（题目数常少一半、单框覆盖大半页），降级结果会导致批改错误且不报错，
+    # 因此默认只用远程分割，auto需显式开启
+    SEGMENTATION_ENGINE = os.getenv('SEGMENTATION_ENGINE', 'remote')
+    SEGMENTATION_ENGINES = ('remote', 'local', 'auto', 'layout')
+    SEGMENTATION_FALLBACK_AFTER = float(os.getenv('SEGMENTATION_FALLBACK_AFTER', 10))  # 0为不限时
+    LOCAL_SEGMENTER_WORK_WIDTH = int(os.getenv('LOCAL_SEGMENTER_WORK_WIDTH', 1000))  # 本地分割时缩放到的宽度
+    LOCAL_SEGMENTER_GAP_RATIO = float(os.getenv('LOCAL_SEGMENTER_GAP_RATIO', 1.5))  # 题间留白与行高之比
+    LAYOUT_SEGMENTER_GAP_RATIO = float(os.getenv('LAYOUT_SEGMENTER_GAP_RATIO', 1.5))  # 版面分割：没有题号时题间留白与行高之比
+    # 灰度验证：使用远程分割的页面同时由OCR版面划分题目并比较两者（不增加远程调用），一致性计入pigai_layout_agreement指标
+    LAYOUT_AGREEMENT_CHECK = os.getenv('LAYOUT_AGREEMENT_CHECK', 'true').lower() == 'true'
+    LAYOUT_AGREEMENT_IOU = float(os.getenv('LAYOUT_AGREEMENT_IOU', 0.5))  # 判定两个题目框一致的IoU阈值
     
     # 接口3: OCR识别API（注意，试用账号，仅100页额度 https://www.textin.com/console/dashboard/overview）
     OCR_API_URL = 'https://api.textin.com/ai/service/v1/pdf_to_markdown?char_details=1'
@@ -68,10 +101,117 @@ class Config:
     KNOWLEDGE_READ_TIMEOUT = int(os.getenv('KNOWLEDGE_READ_TIMEOUT', 45))
     KNOWLEDGE_CONNECT_TIMEOUT = int(os.getenv('KNOWLEDGE_CONNECT_TIMEOUT', 15))
 
-    # 重试配置
-    MAX_RETRIES = 3
-    RETRY_DELAY = 1  # 秒
+    # 重试配置（连接失败、超时和5xx/429按指数退避加随机抖动重试，其余4xx不重试）
+    MAX_RETRIES = 3  # 最多尝试次数
+    RETRY_DELAY = 1  # 秒，首次重试的退避上限，之后每次翻倍
+    RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 10))  # 秒，单次退避上限
+    RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', 0.2))  # 全局重试量不超过请求量的比例
+    RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv('RETRY_BUDGET_MIN_PER_SECOND', 1))  # 低流量时每秒保底重试数
+    RETRY_BUDGET_MAX_TOKENS = int(os.getenv('RETRY_BUDGET_MAX_TOKENS', 20))  # 重试预算可累积的上限
+    
+    # 请求截止时间配置：deadline_ms参数未传入时使用DEFAULT_DEADLINE_MS，0为不限时
+    DEFAULT_DEADLINE_MS = int(os.getenv('DEFAULT_DEADLINE_MS', 0))
+    DEADLINE_MIN_ATTEMPT_TIME = float(os.getenv('DEADLINE_MIN_ATTEMPT_TIME', 1))  # 剩余时间低于此值（秒）时不再重试
+    
+    # 熔断配置（按下游服务）
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))  # 连续失败次数达到后熔断
+    CIRCUIT_RECOVERY_TIMEOUT = int(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', 30))  # 熔断后多久放行探测请求（秒）
+    
+    # 批改请求对冲配置（默认关闭）：请求超过近期耗时的指定分位数仍未返回时再发一份，取先返回的结果
+    GRADING_HEDGE_ENABLED = os.getenv('GRADING_HEDGE_ENABLED', 'false').lower() == 'true'
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))  # 对冲阈值取近期成功请求耗时的分位数
+    HEDGE_INITIAL_DELAY = float(os.getenv('HEDGE_INITIAL_DELAY', 20))  # 样本不足时的对冲阈值（秒）
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 2))  # 对冲阈值下限（秒）
+    HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', 200))  # 计算分位数使用的最近样本数
+    HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))  # 样本数达到后才使用自适应阈值
+    HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', 0.1))  # 对冲请求数不超过请求总数的比例
+    HEDGE_MAX_BURST = int(os.getenv('HEDGE_MAX_BURST', 5))  # 对冲预算可累积的上限
+    
+    # 后台批改任务配置
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # 同时执行的批改任务数
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))  # 排队及执行中任务上限
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 3600))  # 已结束任务结果保留时间（秒）
+    
+    # 进程级共享线程池配置（所有请求共用，避免每个请求新建线程池）
+    SHARED_EXECUTOR_WORKERS = {
+        'recognition': int(os.getenv('RECOGNITION_WORKERS', 16)),  # 题目分割与OCR识别
+        'questions': int(os.getenv('QUESTION_WORKERS', 40)),  # 单题检索与批改
+        'persist': int(os.getenv('PERSIST_WORKERS', 2)),  # 上传原图后台落盘
+        'encode': int(os.getenv('ENCODE_WORKERS', os.cpu_count() or 4)),  # 题目切图JPEG编码
+        'hedge': int(os.getenv('HEDGE_WORKERS', 32))  # 开启对冲时执行批改请求（原请求与对冲请求）
+    }
+    
+    # 下游服务并发上限（舱壁隔离），超出时排队等待
+    BULKHEAD_LIMITS = {
+        'segmentation': int(os.getenv('SEGMENTATION_CONCURRENCY', 8)),
+        'ocr': int(os.getenv('OCR_CONCURRENCY', 4)),
+        'knowledge': int(os.getenv('KNOWLEDGE_CONCURRENCY', 16)),
+        'obs_upload': int(os.getenv('OBS_UPLOAD_CONCURRENCY', 16)),
+        'ai_grading': int(os.getenv('AI_GRADING_CONCURRENCY', 16))
+    }
+    BULKHEAD_WAIT_TIMEOUT = int(os.getenv('BULKHEAD_WAIT_TIMEOUT', 120))  # 排队等待并发名额的最长时间（秒）
+    
+    # Textin OCR限流配置（令牌桶 + 每日页数额度）。状态保存在SQLite文件中，同一台机器上的所有worker进程共享；
+    # 令牌不足时排队等待（最长RATE_LIMIT_MAX_WAIT秒），当日额度用完时直接失败
+    RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'cache/rate_limits.sqlite3')
+    RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 60))
+    RATE_LIMITS = {
+        'ocr': {
+            'qps': float(os.getenv('OCR_RATE_LIMIT_QPS', 2)),  # 不大于0为不限速
+            'burst': int(os.getenv('OCR_RATE_LIMIT_BURST', 2)),
+            'daily_budget': int(os.getenv('OCR_DAILY_PAGE_BUDGET', 0))  # 每日最多识别页数，0为不限
+        }
+    }
+    
+    # 下游keep-alive连接池大小（每个下游服务一个连接池，所有线程共用），默认与并发上限一致
+    HTTP_POOL_SIZES = {
+        'segmentation': int(os.getenv('SEGMENTATION_POOL_SIZE', 8)),
+        'ocr': int(os.getenv('OCR_POOL_SIZE', 4)),
+        'knowledge': int(os.getenv('KNOWLEDGE_POOL_SIZE', 16)),
+        'obs_upload': int(os.getenv('OBS_UPLOAD_POOL_SIZE', 16)),
+        'ai_grading': int(os.getenv('AI_GRADING_POOL_SIZE', 16)),
+        'download': int(os.getenv('DOWNLOAD_POOL_SIZE', 4))  # 远程图片下载
+    }
+    
+    # 流水线执行引擎：thread为线程池模式；asyncio为异步模式，所有下游调用在同一个事件循环中并发执行
+    PIPELINE_ENGINE = os.getenv('PIPELINE_ENGINE', 'thread')
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', 1000))  # 异步连接池总连接数上限
+    ASYNC_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS_PER_HOST', 0))  # 单主机连接数上限，0为不限
+    
+    # 批改结果缓存配置（按上传图片内容SHA-256缓存完整结果，重复上传直接返回）
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', 'cache/results')
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 1000))
+    RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 7 * 24 * 3600))  # 秒
+    
+    # OCR结果缓存配置（按图片内容SHA-256和OCR请求参数缓存Textin原始响应，重试、重新批改和重复上传不再消耗OCR额度）
+    OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+    OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', 'cache/ocr')
+    OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 5000))
+    OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 0为不限
+    OCR_CACHE_TTL = int(os.getenv('OCR_CACHE_TTL', 30 * 24 * 3600))  # 秒
+    OCR_CACHE_COMPRESSLEVEL = int(os.getenv('OCR_CACHE_COMPRESSLEVEL', 6))  # 0为不压缩
+    
+    # OCR字符归属题目区域的判定规则：top_left为字符第一个坐标点在区域内，center为中心点在区域内，
+    # overlap为字符框与区域的相交面积不低于字符面积的CHAR_ASSIGNMENT_MIN_OVERLAP
+    CHAR_ASSIGNMENT_RULE = os.getenv('CHAR_ASSIGNMENT_RULE', 'top_left')
+    CHAR_ASSIGNMENT_MIN_OVERLAP = float(os.getenv('CHAR_ASSIGNMENT_MIN_OVERLAP', 0.5))
+    CHAR_GRID_CELL_SIZE = int(os.getenv('CHAR_GRID_CELL_SIZE', 0))  # 字符网格索引的单元边长（像素），0为按字符高度自动选择
+    
+    # 下游原始响应归档（每个批改任务一个gzip压缩的JSON Lines文件，以任务ID命名，可用replay_archive.py离线重放）
+    RESPONSE_ARCHIVE_ENABLED = os.getenv('RESPONSE_ARCHIVE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_ARCHIVE_DIR = os.getenv('RESPONSE_ARCHIVE_DIR', 'cache/archives')
+    RESPONSE_ARCHIVE_COMPRESSLEVEL = int(os.getenv('RESPONSE_ARCHIVE_COMPRESSLEVEL', 6))
+    RESPONSE_ARCHIVE_TTL = int(os.getenv('RESPONSE_ARCHIVE_TTL', 7 * 24 * 3600))  # 秒，0为永久保留
     
     # 日志配置
-    LOG_LEVEL = 'INFO'
-    LOG_FILE = 'app.log'
\ No newline at end of file
+    # production：日志经内存队列由后台线程写出，热路径（services.*）的DEBUG/INFO日志按LOG_SAMPLE_RATE采样；
+    # debug：同步写出全部日志
+    LOG_MODE = os.getenv('LOG_MODE', 'production')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_PAYLOAD_PREVIEW_CHARS = int(os.getenv('LOG_PAYLOAD_PREVIEW_CHARS', 500))  # 请求体、响应等大数据在日志中最多保留的字符数，0为不截断
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))  # 热路径DEBUG/INFO日志保留比例，1为全部保留
+    LOG_SAMPLED_LOGGERS = ('services.',)
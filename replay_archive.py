@@ -0,0 +1,77 @@
+"""从下游原始响应归档离线重放批改任务的解析和题目切分
+
+不发起任何网络请求：重新解析题目分割、OCR、知识库检索和AI批改的原始响应，并重新执行题目切分，
+用于复现结果异常的页面，或对解析和切分代码做基准测试。开启QUESTION_IMAGE_PERSIST时题目切图会照常写入PROCESSED_FOLDER。
+
+用法:
+    python replay_archive.py cache/archives/<任务ID>.jsonl.gz
+    python replay_archive.py <归档路径> --image 0=uploads/page.jpg --repeat 20
+"""
+import argparse
+import json
+import logging
+import statistics
+
+from config import Config
+from services.ai_grading_service import AIGradingService
+from services.image_processor import ImageProcessor
+from services.knowledge_service import KnowledgeService
+from services.ocr_service import OCRService
+from services.pipeline import HomeworkPipeline
+
+
+def parse_images(values):
+    """解析--image参数（页码=图片路径，页码从0开始）"""
+    filepaths = {}
+    for value in values:
+        page, _, path = value.partition('=')
+        filepaths[int(page)] = path
+    return filepaths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从原始响应归档离线重放题目切分和响应解析')
+    parser.add_argument('archive', help='归档文件路径')
+    parser.add_argument('--image', action='append', default=[], metavar='PAGE=PATH',
+                        help='指定页面图片路径（默认使用归档中记录的路径），可多次指定')
+    parser.add_argument('--repeat', type=int, default=1, help='重复次数，大于1时输出各步骤耗时统计')
+    parser.add_argument('--output', help='重放结果写入的JSON文件（默认输出到标准输出）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    pipeline = HomeworkPipeline(ImageProcessor(), OCRService(), KnowledgeService(), AIGradingService())
+    filepaths = parse_images(args.image)
+
+    runs = [pipeline.replay(args.archive, filepaths) for _ in range(max(1, args.repeat))]
+    result = runs[-1]
+
+    if args.repeat > 1:
+        # 按页、按步骤汇总多次重放的耗时
+        benchmark = {}
+        for page_index, page in enumerate(result['pages']):
+            if not page['success']:
+                continue
+            stage_stats = {}
+            for stage in page['stage_timings']:
+                samples = [run['pages'][page_index]['stage_timings'][stage] for run in runs]
+                stage_stats[stage] = {
+                    'mean': statistics.mean(samples),
+                    'median': statistics.median(samples),
+                    'min': min(samples),
+                    'max': max(samples)
+                }
+            benchmark[page['page']] = stage_stats
+        result['benchmark'] = {'repeat': args.repeat, 'pages': benchmark}
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
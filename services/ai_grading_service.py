@@ -1,8 +1,16 @@
 import requests
 import json
 import base64
+import functools
 import requests
 from config import Config
+from .async_engine import get_async_engine
+from .char_table import char_detail_dicts
+from .hedging import get_hedge_policy, hedged_call, hedged_call_async
+from .http_client import get_http_client
+from .image_buffer import image_exists
+from .log_utils import preview
+from .resilience import DownstreamError, call_downstream
 import logging
 import time
 import os
@@ -11,6 +19,10 @@ from .obs_service import OBSService
 
 logger = logging.getLogger(__name__)
 
+def _is_grading_response_ok(response):
+    """对冲时只有200响应才算可用结果，错误响应会继续等待另一份请求"""
+    return response.status_code == 200
+
 class AIGradingService:
     """AI批改服务"""
     
@@ -19,17 +31,17 @@ class AIGradingService:
         self.api_token = Config.AI_GRADING_API_TOKEN
         self.timeout = Config.REQUEST_TIMEOUT
         self.max_retries = Config.MAX_RETRIES
-        self.retry_delay = Config.RETRY_DELAY
         self.obs_service = OBSService()
     
-    def grade_question(self, question_image_path, question_text, knowledge_result=None, char_details=None):
+    def grade_question(self, question_image_path, question_text, knowledge_result=None, char_details=None, deadline=None):
         """批改单个题目
         
         Args:
-            question_image_path: 题目图片路径
+            question_image_path: 题目图片路径或ImageBuffer
             question_text: 题目OCR文字
             knowledge_result: 知识库检索结果（可选）
             char_details: 字符级坐标信息（用于获取作答区坐标）
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
         
         Returns:
             dict: 批改结果
@@ -38,23 +50,14 @@ class AIGradingService:
             logger.info(f"开始AI批改，题目文本: {question_text[:100]}...")
             logger.info(f"题目图片路径: {question_image_path}")
             
-            # 从knowledge_result中提取信息
-            if isinstance(knowledge_result, dict):
-                reference_answer = knowledge_result.get('reference_answer', '')
-                answer_image_url = knowledge_result.get('answer_image_url', '')
-                question_image_url = knowledge_result.get('question_image_url', '')
-            else:
-                # 向后兼容：如果传入的是字符串
-                reference_answer = str(knowledge_result) if knowledge_result else ''
-                answer_image_url = ''
-                question_image_url = ''
+            reference_answer, question_image_url, answer_image_url = self._unpack_knowledge_result(knowledge_result)
             
             logger.info(f"参考答案长度: {len(reference_answer)}")
             logger.info(f"答案图片URL: {answer_image_url}")
             logger.info(f"题目图片URL: {question_image_url}")
             
             # 检查文件是否存在
-            if not os.path.exists(question_image_path):
+            if not image_exists(question_image_path):
                 logger.error(f"题目图片文件不存在: {question_image_path}")
                 return {
                     'success': False,
@@ -62,17 +65,10 @@ class AIGradingService:
                     'question_text': question_text
                 }
             
-            headers = {
-                'Accept': '*/*',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Authorization': f'Bearer {self.api_token}',
-                'Connection': 'keep-alive',
-                'Content-Type': 'application/json',
-                'User-Agent': 'PostmanRuntime-ApipostRuntime/1.1.0'
-            }
+            headers = self._build_headers()
             
             # 获取图片URL
-            image_result = self.obs_service.process_image_path(question_image_path)
+            image_result = self.obs_service.process_image_path(question_image_path, deadline=deadline)
             if not image_result['success']:
                 logger.error(f"图片处理失败: {image_result.get('error', '未知错误')}")
                 return {
@@ -82,135 +78,64 @@ class AIGradingService:
                 }
             
             image_url = image_result['url']
+            payload = self._build_grading_payload(image_url, question_image_url, answer_image_url, char_details)
             
-            # 构建请求数据
-            # 将char_details直接转换为JSON字符串
-            user_question_ocr = ""
-            if char_details and len(char_details) > 0:
-                import json
-                # 将字符级坐标信息转换为JSON字符串
-                user_question_ocr = json.dumps(char_details, ensure_ascii=False)
-                logger.info(f"使用字符级OCR信息JSON格式，包含{len(char_details)}个字符")
-                logger.debug(f"JSON字符串长度: {len(user_question_ocr)}")
-            else:
-                logger.warning("没有字符级坐标信息可用")
+            # 请求体包含全部字符坐标，只在DEBUG级别输出截断后的预览（请求头含密钥，不记录）
+            logger.info("AI批改API调用，图片URL: %s", image_url)
+            logger.debug("AI批改请求体: %s", preview(payload))
             
-            payload = {
-                "inputs": {
-                    "user_question_ocr": user_question_ocr
-                },
-                "user": "abc-123",
-                "response_mode": "blocking",
-                "files": [
-                    {
-                        "type": "image",
-                        "transfer_method": "remote_url",
-                        "url": image_url
-                    }
-                ]
-            }
+            # 发送请求，重试、退避和熔断由弹性层处理
+            start_time = time.time()
+            logger.debug("请求超时设置: %s秒", self.timeout)
+            try:
+                response = self._post_grading_request(headers, payload, deadline)
+            except (requests.exceptions.RequestException, DownstreamError) as e:
+                logger.error(f"AI批改请求异常: {str(e)}")
+                logger.error(f"异常类型: {type(e).__name__}")
+                return {
+                    'success': False,
+                    'error': f'AI批改网络请求失败: {str(e)}',
+                    'question_text': question_text
+                }
             
-            # 添加知识库中的题目图片
-            if question_image_url and question_image_url.strip():
-                payload["files"].append({
-                    "type": "image",
-                    "transfer_method": "remote_url",
-                    "url": question_image_url
-                })
+            response_time = time.time() - start_time
+            logger.info(f"AI批改API响应时间: {response_time:.2f}秒")
+            logger.info(f"AI批改API响应状态码: {response.status_code}")
             
-            # 只有当answer_image_url不为空时才添加答案图片
-            if answer_image_url and answer_image_url.strip():
-                payload["files"].append({
-                    "type": "image",
-                    "transfer_method": "remote_url",
-                    "url": answer_image_url
-                })
-            
-            # 打印完整的请求参数用于调试
-            logger.info(f"=== AI批改API调用参数 ===")
-            logger.info(f"API URL: {self.api_url}")
-            logger.info(f"请求头: {headers}")
-            logger.info(f"完整请求体: {payload}")
-            logger.info(f"图片URL: {image_url}")
-            logger.info(f"题目文本: {question_text}")
-            logger.info(f"参考答案: {reference_answer}")
-            logger.info(f"============================")
-            
-            # 进行重试请求
-            for attempt in range(self.max_retries):
-                try:
-                    start_time = time.time()
-                    logger.info(f"调用AI批改API，尝试次数: {attempt + 1}/{self.max_retries}")
-                    logger.debug(f"请求超时设置: {self.timeout}秒")
-                    
-                    response = requests.post(
-                        self.api_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=self.timeout
-                    )
-                    
-                    response_time = time.time() - start_time
-                    logger.info(f"AI批改API响应时间: {response_time:.2f}秒")
-                    logger.info(f"AI批改API响应状态码: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        try:
-                            result = response.json()
-                            logger.info("AI批改API调用成功")
-                            logger.debug(f"AI批改API原始响应: {result}")
-                            
-                            # 解析批改结果
-                            parsed_result = self._parse_grading_result(result)
-                            logger.info(f"批改结果解析完成，得分: {parsed_result.get('score', '未知')}")
-                        except json.JSONDecodeError as e:
-                            logger.error(f"AI批改API响应JSON解析失败: {e}")
-                            logger.error(f"响应内容: {response.text[:500]}")
-                            if attempt < self.max_retries - 1:
-                                logger.info(f"等待{self.retry_delay}秒后重试...")
-                                time.sleep(self.retry_delay)
-                                continue
-                            else:
-                                return {
-                                    'success': False,
-                                    'error': f'AI批改API响应格式错误: {str(e)}',
-                                    'question_text': question_text
-                                }
-                        
-                        return {
-                            'success': True,
-                            'question_text': question_text,
-                            'reference_answer': reference_answer,
-                            'grading_result': parsed_result,
-                            'raw_result': result
-                        }
-                    else:
-                        logger.error(f"AI批改API调用失败，状态码: {response.status_code}")
-                        logger.error(f"错误响应内容: {response.text[:500]}")
-                        if attempt < self.max_retries - 1:
-                            logger.info(f"等待{self.retry_delay}秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
-                        else:
-                            return {
-                                'success': False,
-                                'error': f'AI批改API调用失败，状态码: {response.status_code}',
-                                'question_text': question_text
-                            }
-                            
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"AI批改请求异常: {str(e)}")
-                    logger.error(f"异常类型: {type(e).__name__}")
-                    if attempt < self.max_retries - 1:
-                        logger.info(f"等待{self.retry_delay}秒后重试...")
-                        time.sleep(self.retry_delay)
-                        continue
-                    else:
-                        return {
-                            'success': False,
-                            'error': f'AI批改网络请求失败: {str(e)}',
-                            'question_text': question_text
-                        }
+            if response.status_code != 200:
+                logger.error(f"AI批改API调用失败，状态码: {response.status_code}")
+                logger.error(f"错误响应内容: {response.text[:500]}")
+                return {
+                    'success': False,
+                    'error': f'AI批改API调用失败，状态码: {response.status_code}',
+                    'question_text': question_text
+                }
+            
+            try:
+                result = response.json()
+            except json.JSONDecodeError as e:
+                logger.error(f"AI批改API响应JSON解析失败: {e}")
+                logger.error(f"响应内容: {response.text[:500]}")
+                return {
+                    'success': False,
+                    'error': f'AI批改API响应格式错误: {str(e)}',
+                    'question_text': question_text
+                }
+            
+            logger.info("AI批改API调用成功")
+            logger.debug("AI批改API原始响应: %s", preview(result))
+            
+            # 解析批改结果
+            parsed_result = self._parse_grading_result(result)
+            logger.info(f"批改结果解析完成，得分: {parsed_result.get('score', '未知')}")
+            
+            return {
+                'success': True,
+                'question_text': question_text,
+                'reference_answer': reference_answer,
+                'grading_result': parsed_result,
+                'raw_result': result
+            }
                         
         except Exception as e:
             logger.error(f"AI批改处理失败: {str(e)}")
@@ -220,11 +145,193 @@ class AIGradingService:
                 'question_text': question_text
             }
     
+    def _post_grading_request(self, headers, payload, deadline=None):
+        """发送批改请求，开启对冲时慢请求会再发一份，取先返回的成功响应
+        
+        Args:
+            headers: 请求头
+            payload: 请求体
+            deadline: 请求的整体截止时间（可选）
+            
+        Returns:
+            requests.Response: 批改API响应；网络异常或熔断时抛出异常
+        """
+        send = functools.partial(
+            call_downstream,
+            'ai_grading', get_http_client('ai_grading').post,
+            self.api_url,
+            headers=headers,
+            json=payload,
+            timeout=self.timeout,
+            max_attempts=self.max_retries,
+            deadline=deadline
+        )
+        if not Config.GRADING_HEDGE_ENABLED:
+            return send()
+        return hedged_call(get_hedge_policy('ai_grading'), send, _is_grading_response_ok)
+    
+    async def grade_question_async(self, question_image_path, question_text, knowledge_result=None, char_details=None, deadline=None):
+        """grade_question的异步版本，在异步执行引擎的事件循环中调用
+        
+        Args:
+            question_image_path: 题目图片路径或ImageBuffer
+            question_text: 题目OCR文字
+            knowledge_result: 知识库检索结果（可选）
+            char_details: 字符级坐标信息（用于获取作答区坐标）
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
+        
+        Returns:
+            dict: 批改结果，格式与grade_question相同
+        """
+        try:
+            reference_answer, question_image_url, answer_image_url = self._unpack_knowledge_result(knowledge_result)
+            
+            image_result = await self.obs_service.process_image_path_async(question_image_path, deadline=deadline)
+            if not image_result['success']:
+                logger.error(f"图片处理失败: {image_result.get('error', '未知错误')}")
+                return {
+                    'success': False,
+                    'error': '图片处理失败',
+                    'question_text': question_text
+                }
+            
+            payload = self._build_grading_payload(image_result['url'], question_image_url, answer_image_url, char_details)
+            send = functools.partial(
+                get_async_engine().request,
+                'ai_grading', 'POST', self.api_url,
+                max_attempts=self.max_retries,
+                deadline=deadline,
+                timeout=self.timeout,
+                headers={'Authorization': f'Bearer {self.api_token}'},
+                json=payload
+            )
+            if Config.GRADING_HEDGE_ENABLED:
+                response = await hedged_call_async(get_hedge_policy('ai_grading'), send, _is_grading_response_ok)
+            else:
+                response = await send()
+            
+            if response.status_code != 200:
+                return {
+                    'success': False,
+                    'error': f'AI批改API调用失败，状态码: {response.status_code}',
+                    'question_text': question_text
+                }
+            
+            try:
+                result = response.json()
+            except json.JSONDecodeError as e:
+                logger.error(f"AI批改API响应JSON解析失败: {e}")
+                return {
+                    'success': False,
+                    'error': f'AI批改API响应格式错误: {str(e)}',
+                    'question_text': question_text
+                }
+            
+            parsed_result = self._parse_grading_result(result)
+            return {
+                'success': True,
+                'question_text': question_text,
+                'reference_answer': reference_answer,
+                'grading_result': parsed_result,
+                'raw_result': result
+            }
+        except DownstreamError as e:
+            return {
+                'success': False,
+                'error': f'AI批改网络请求失败: {str(e)}',
+                'question_text': question_text
+            }
+        except Exception as e:
+            logger.error(f"AI批改处理失败: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'question_text': question_text
+            }
+    
+    def _unpack_knowledge_result(self, knowledge_result):
+        """从知识库检索结果中提取参考答案、题目图片和答案图片地址
+        
+        Returns:
+            tuple: (参考答案, 题目图片URL, 答案图片URL)
+        """
+        if isinstance(knowledge_result, dict):
+            return (
+                knowledge_result.get('reference_answer', ''),
+                knowledge_result.get('question_image_url', ''),
+                knowledge_result.get('answer_image_url', '')
+            )
+        # 向后兼容：如果传入的是字符串
+        return (str(knowledge_result) if knowledge_result else '', '', '')
+    
+    def _build_headers(self):
+        """构建批改API请求头"""
+        return {
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Authorization': f'Bearer {self.api_token}',
+            'Connection': 'keep-alive',
+            'Content-Type': 'application/json',
+            'User-Agent': 'PostmanRuntime-ApipostRuntime/1.1.0'
+        }
+    
+    def _build_grading_payload(self, image_url, question_image_url, answer_image_url, char_details):
+        """构建阻塞模式批改请求数据
+        
+        Args:
+            image_url: 学生作答题目图片的OBS地址
+            question_image_url: 知识库中的题目图片地址
+            answer_image_url: 知识库中的答案图片地址
+            char_details: 字符级坐标信息（CharTable或字典列表）
+            
+        Returns:
+            dict: 请求数据
+        """
+        # 将char_details直接转换为JSON字符串
+        user_question_ocr = ""
+        if char_details and len(char_details) > 0:
+            user_question_ocr = json.dumps(char_detail_dicts(char_details), ensure_ascii=False)
+            logger.info("使用字符级OCR信息JSON格式，包含%d个字符，JSON长度: %d", len(char_details), len(user_question_ocr))
+        else:
+            logger.warning("没有字符级坐标信息可用")
+        
+        payload = {
+            "inputs": {
+                "user_question_ocr": user_question_ocr
+            },
+            "user": "abc-123",
+            "response_mode": "blocking",
+            "files": [
+                {
+                    "type": "image",
+                    "transfer_method": "remote_url",
+                    "url": image_url
+                }
+            ]
+        }
+        
+        # 添加知识库中的题目图片
+        if question_image_url and question_image_url.strip():
+            payload["files"].append({
+                "type": "image",
+                "transfer_method": "remote_url",
+                "url": question_image_url
+            })
+        
+        # 只有当answer_image_url不为空时才添加答案图片
+        if answer_image_url and answer_image_url.strip():
+            payload["files"].append({
+                "type": "image",
+                "transfer_method": "remote_url",
+                "url": answer_image_url
+            })
+        return payload
+    
     def grade_question_streaming(self, question_image_path, question_text, reference_answer, char_details=None):
         """流式批改题目（适用于长时间处理）
         
         Args:
-            question_image_path: 题目图片路径
+            question_image_path: 题目图片路径或ImageBuffer
             question_text: 题目OCR文本
             reference_answer: 参考答案
             
@@ -236,7 +343,7 @@ class AIGradingService:
             logger.info(f"题目图片路径: {question_image_path}")
             
             # 检查文件是否存在
-            if not os.path.exists(question_image_path):
+            if not image_exists(question_image_path):
                 logger.error(f"题目图片文件不存在: {question_image_path}")
                 return {
                     'success': False,
@@ -244,14 +351,7 @@ class AIGradingService:
                     'question_text': question_text
                 }
             
-            headers = {
-                'Accept': '*/*',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Authorization': f'Bearer {self.api_token}',
-                'Connection': 'keep-alive',
-                'Content-Type': 'application/json',
-                'User-Agent': 'PostmanRuntime-ApipostRuntime/1.1.0'
-            }
+            headers = self._build_headers()
             
             # 获取图片URL
             image_result = self.obs_service.process_image_path(question_image_path)
@@ -272,7 +372,7 @@ class AIGradingService:
                 # 将字符级坐标信息转换为批改API需要的格式
                 user_question_ocr = {
                     "text": question_text,
-                    "char_details": char_details
+                    "char_details": char_detail_dicts(char_details)
                 }
                 logger.info(f"流式批改使用字符级OCR信息，包含{len(char_details)}个字符")
             else:
@@ -293,23 +393,20 @@ class AIGradingService:
                 ]
             }
             
-            # 打印完整的流式请求参数用于调试
-            logger.info(f"=== 流式AI批改API调用参数 ===")
-            logger.info(f"API URL: {self.api_url}")
-            logger.info(f"请求头: {headers}")
-            logger.info(f"完整请求体: {payload}")
-            logger.info(f"图片URL: {image_url}")
-            logger.info(f"题目文本: {question_text}")
-            logger.info(f"参考答案: {reference_answer}")
-            logger.info(f"============================")
+            # 请求体包含全部字符坐标，只在DEBUG级别输出截断后的预览（请求头含密钥，不记录）
+            logger.info("流式AI批改API调用，图片URL: %s", image_url)
+            logger.debug("流式AI批改请求体: %s", preview(payload))
             
             start_time = time.time()
-            response = requests.post(
+            # 流式响应已部分返回给调用方后无法重放，只尝试一次
+            response = call_downstream(
+                'ai_grading', get_http_client('ai_grading').post,
                 self.api_url,
                 headers=headers,
                 json=payload,
                 stream=True,
-                timeout=self.timeout
+                timeout=self.timeout,
+                max_attempts=1
             )
             
             response_time = time.time() - start_time
@@ -369,9 +466,8 @@ class AIGradingService:
                 return ""
             
             # 从OBS URL下载图片并转换为base64
-            import requests
             try:
-                response = requests.get(final_image_path, timeout=30)
+                response = get_http_client('download').get(final_image_path, timeout=30)
                 if response.status_code == 200:
                     image_data = response.content
                     base64_data = base64.b64encode(image_data).decode('utf-8')
@@ -402,7 +498,7 @@ class AIGradingService:
         Returns:
             dict: 解析后的批改结果
         """
-        logger.debug(f"开始解析AI批改结果: {api_result}")
+        logger.debug("开始解析AI批改结果: %s", preview(api_result))
         
         grading_result = {
             'score': 0,
@@ -417,40 +513,36 @@ class AIGradingService:
             # 根据Dify工作流的实际返回格式进行解析
             if 'data' in api_result:
                 data = api_result['data']
-                logger.debug(f"从API结果中提取data字段: {data}")
                 
                 if 'outputs' in data:
                     outputs = data['outputs']
-                    logger.debug(f"从data中提取outputs字段: {outputs}")
                     
                     # 处理result字段中的JSON字符串
                     if 'result' in outputs:
                         try:
                             import json
                             result_str = outputs['result']
-                            logger.debug(f"提取result字符串: {result_str}")
                             
                             # 解析JSON字符串
                             result_data = json.loads(result_str)
-                            logger.debug(f"解析JSON结果: {result_data}")
+                            logger.debug("解析JSON结果: %s", preview(result_data))
                             
                             # 处理结果数组（通常是第一个元素）
                             if isinstance(result_data, list) and len(result_data) > 0:
                                 first_result = result_data[0]
-                                logger.debug(f"提取第一个结果: {first_result}")
                                 
                                 # 解析isRight字段
                                 if 'isRight' in first_result:
                                     is_right = first_result['isRight']
                                     grading_result['correct'] = bool(is_right)
                                     grading_result['score'] = 100 if is_right else 0
-                                    logger.debug(f"解析正确性: {grading_result['correct']}, 分数: {grading_result['score']}")
+                                    logger.debug("解析正确性: %s, 分数: %s", grading_result['correct'], grading_result['score'])
                                 
                                 # 解析answerAreaPosition字段（区域坐标）
                                 if 'answerAreaPosition' in first_result:
                                     area_position = first_result['answerAreaPosition']
                                     grading_result['answer_area_position'] = area_position
-                                    logger.debug(f"解析答题区域位置: {area_position}")
+                                    logger.debug("解析答题区域位置: %s", area_position)
                                     
                         except json.JSONDecodeError as e:
                             logger.error(f"解析result JSON失败: {e}")
@@ -461,27 +553,27 @@ class AIGradingService:
                     if 'text' in outputs:
                         feedback_text = outputs['text']
                         grading_result['feedback'] = feedback_text
-                        logger.debug(f"提取反馈文本，长度: {len(feedback_text)}")
+                        logger.debug("提取反馈文本，长度: %d", len(feedback_text))
                         
                     # 如果工作流返回其他结构化数据（保留原有逻辑）
                     if 'score' in outputs:
                         grading_result['score'] = outputs['score']
-                        logger.debug(f"从API结果中直接获取分数: {outputs['score']}")
+                        logger.debug("从API结果中直接获取分数: %s", outputs['score'])
                     
                     if 'correct' in outputs:
                         grading_result['correct'] = outputs['correct']
-                        logger.debug(f"从API结果中直接获取正确性: {outputs['correct']}")
+                        logger.debug("从API结果中直接获取正确性: %s", outputs['correct'])
             else:
                 logger.warning("API结果中未找到data字段")
             
             logger.info(f"批改结果解析完成，得分: {grading_result['score']}，正确性: {grading_result['correct']}")
-            logger.debug(f"完整解析结果: {grading_result}")
+            logger.debug("完整解析结果: %s", preview(grading_result))
             return grading_result
             
         except Exception as e:
             logger.error(f"批改结果解析失败: {str(e)}")
             logger.error(f"异常类型: {type(e).__name__}")
-            logger.error(f"原始结果: {api_result}")
+            logger.error("原始结果: %s", preview(api_result))
             return grading_result
     
     def _extract_structured_feedback(self, feedback_text):
@@ -0,0 +1,165 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import aiohttp
+from requests.structures import CaseInsensitiveDict
+from config import Config
+from .image_buffer import ImageBuffer
+from .resilience import call_downstream_async
+
+logger = logging.getLogger(__name__)
+
+class AsyncResponse:
+    """已读取完毕的下游响应，接口与requests.Response的常用部分一致"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)  # 与requests一致，响应头按名称不区分大小写查找
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _client_timeout(timeout):
+    """把requests风格的超时（秒数或(连接, 读取)元组）转换为aiohttp超时"""
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        return aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+    return aiohttp.ClientTimeout(total=timeout)
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class AsyncEngine:
+    """异步执行引擎：在后台线程中运行一个事件循环，所有下游HTTP调用共享一个aiohttp连接池
+
+    同步代码（Flask路由、后台任务线程）通过run()把协程提交到事件循环并阻塞等待结果。
+    每个在途请求只占用一个协程而不是一个线程，单个进程可同时保持数千个下游请求。
+    """
+
+    def __init__(self, max_connections, max_connections_per_host=0):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+        self.in_flight = 0  # 以下计数只在事件循环线程中修改
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name='async-engine', daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._session = self._loop.run_until_complete(self._create_session())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def run(self, coro, timeout=None):
+        """在事件循环中执行协程，阻塞等待并返回结果（供同步代码调用）
+
+        Args:
+            coro: 协程对象
+            timeout: 最长等待秒数，超时后取消协程并抛出TimeoutError
+
+        Returns:
+            协程的返回值
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def read_file(self, path):
+        """在线程中读取文件，避免阻塞事件循环"""
+        return await asyncio.to_thread(_read_file, path)
+
+    async def read_image(self, image):
+        """读取图片字节：ImageBuffer直接返回内存数据，路径在线程中读取"""
+        if isinstance(image, ImageBuffer):
+            return image.data
+        return await self.read_file(image)
+
+    async def request(self, service, method, url, max_attempts=None, timeout=None, deadline=None, rate_limiter=None, **kwargs):
+        """通过弹性层（舱壁、熔断、分类重试）发送下游HTTP请求
+
+        Args:
+            service: 下游服务名称
+            method: HTTP方法
+            url: 请求地址
+            max_attempts: 最多尝试次数，默认Config.MAX_RETRIES
+            timeout: 超时秒数，或(连接超时, 读取超时)元组
+            deadline: 请求的整体截止时间（可选），每次尝试的超时不超过剩余时间
+            rate_limiter: 限流器（可选），每次尝试前申请令牌
+            **kwargs: 传给aiohttp的其他参数（headers、data、json等）
+
+        Returns:
+            AsyncResponse: 成功响应，或不可重试、重试耗尽后的最后一个响应
+
+        Raises:
+            DownstreamError: 网络异常重试耗尽、截止时间已到、限流或下游熔断中
+        """
+        return await call_downstream_async(
+            service, self._send, method, url,
+            max_attempts=max_attempts, deadline=deadline, rate_limiter=rate_limiter, timeout=timeout, **kwargs
+        )
+
+    async def _send(self, method, url, timeout=None, **kwargs):
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            async with self._session.request(method, url, timeout=_client_timeout(timeout), **kwargs) as response:
+                content = await response.read()
+                return AsyncResponse(response.status, response.headers, content)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        """返回在途请求和连接池配置统计"""
+        return {
+            'max_connections': self.max_connections,
+            'max_connections_per_host': self.max_connections_per_host,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'total_requests': self.total_requests
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_async_engine():
+    """获取进程级异步执行引擎，首次调用时启动事件循环"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine(
+                Config.ASYNC_HTTP_MAX_CONNECTIONS,
+                Config.ASYNC_HTTP_MAX_CONNECTIONS_PER_HOST
+            )
+            logger.info(f"异步执行引擎已启动，连接池上限: {Config.ASYNC_HTTP_MAX_CONNECTIONS}")
+        return _engine
+
+def get_async_engine_stats():
+    """返回异步执行引擎统计，引擎未启动时返回None"""
+    return _engine.stats() if _engine is not None else None
@@ -0,0 +1,145 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CharTable:
+    """整页字符级OCR详情的列式存储
+
+    整页只保存一个字符串（所有字符按文本块顺序拼接）、一个(N, 8)的int32坐标数组、
+    每个字符在所属文本块中的下标数组，以及各文本块在表中的起始偏移，不再为每个字符
+    创建字典和坐标列表。每道题的字符是整页表的视图（只记录行号，与整页表共享字符串和数组）。
+    需要旧格式时用to_dicts()（或迭代、下标访问）按需转换为{'character', 'coordinates', 'index'}字典。
+    """
+
+    __slots__ = ('_text', '_coordinates', '_indices', 'block_offsets', '_rows')
+
+    def __init__(self, text, coordinates, indices, block_offsets, rows=None):
+        """
+        Args:
+            text: 所有字符按顺序拼接的字符串
+            coordinates: (N, 8) int32坐标数组，每行为[x1, y1, x2, y2, x3, y3, x4, y4]
+            indices: (N,) int32数组，字符在所属文本块中的下标
+            block_offsets: (B + 1,) int32数组，各文本块第一个字符在表中的行号，最后一项为N
+            rows: 视图包含的行号数组（可选），None为整页表
+        """
+        self._text = text
+        self._coordinates = coordinates
+        self._indices = indices
+        self.block_offsets = block_offsets
+        self._rows = rows
+
+    @classmethod
+    def empty(cls):
+        return cls('', np.zeros((0, 8), dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int32))
+
+    @classmethod
+    def from_text_items(cls, text_items):
+        """从get_text_with_coordinates返回的文本项建立字符表
+
+        字符数与坐标数不一致时只取前面能一一对应的部分；不是8值四边形的坐标对应的字符不收录。
+        """
+        chars = []
+        coordinates = []
+        indices = []
+        block_offsets = [0]
+        for text_item in text_items:
+            text = text_item.get('text')
+            char_coords = text_item.get('char_coordinates')
+            if not text or not char_coords:
+                continue
+            length = min(len(text), len(char_coords))
+            if len(text) != len(char_coords):
+                logger.warning("字符数(%d)与坐标数(%d)不匹配，将处理前 %d 个匹配的字符，文本: '%s'",
+                               len(text), len(char_coords), length, text)
+
+            char_coords = char_coords[:length]
+            if all(len(coords) == 8 for coords in char_coords):
+                chars.append(text[:length])
+                coordinates.extend(char_coords)
+                indices.extend(range(length))
+            else:
+                for i, coords in enumerate(char_coords):
+                    if len(coords) == 8:
+                        chars.append(text[i])
+                        coordinates.append(coords)
+                        indices.append(i)
+            if len(indices) > block_offsets[-1]:
+                block_offsets.append(len(indices))
+
+        if not coordinates:
+            return cls.empty()
+        return cls(
+            ''.join(chars),
+            np.rint(np.asarray(coordinates, dtype=np.float64)).astype(np.int32),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(block_offsets, dtype=np.int32)
+        )
+
+    def __len__(self):
+        return len(self._text) if self._rows is None else len(self._rows)
+
+    def __getitem__(self, i):
+        row = i if self._rows is None else int(self._rows[i])
+        return {
+            'character': self._text[row],
+            'coordinates': self._coordinates[row].tolist(),
+            'index': int(self._indices[row])
+        }
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    @property
+    def coordinates(self):
+        """(len, 8)坐标数组；整页表返回共享数组本身，视图按行号取出"""
+        if self._rows is None:
+            return self._coordinates
+        return self._coordinates[self._rows]
+
+    @property
+    def text(self):
+        """表中字符按顺序拼接的字符串"""
+        if self._rows is None:
+            return self._text
+        text = self._text
+        return ''.join([text[row] for row in self._rows.tolist()])
+
+    def view(self, rows):
+        """按行号（相对于本表）取子表，与本表共享字符串和数组
+
+        Args:
+            rows: 行号序列，按需要的顺序排列
+
+        Returns:
+            CharTable: 只记录行号的视图
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if self._rows is not None:
+            rows = self._rows[rows]
+        return CharTable(self._text, self._coordinates, self._indices, self.block_offsets, rows)
+
+    def to_dicts(self):
+        """转换为旧格式的字符详情列表：[{'character', 'coordinates', 'index'}, ...]"""
+        if self._rows is None:
+            chars = self._text
+            coordinates = self._coordinates.tolist()
+            indices = self._indices.tolist()
+        else:
+            rows = self._rows.tolist()
+            text = self._text
+            chars = [text[row] for row in rows]
+            coordinates = self._coordinates[self._rows].tolist()
+            indices = self._indices[self._rows].tolist()
+        return [
+            {'character': char, 'coordinates': coords, 'index': index}
+            for char, coords, index in zip(chars, coordinates, indices)
+        ]
+
+
+def char_detail_dicts(char_details):
+    """把字符详情转换为可JSON序列化的字典列表，CharTable按需转换，列表原样返回"""
+    if isinstance(char_details, CharTable):
+        return char_details.to_dicts()
+    return char_details
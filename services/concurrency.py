@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from config import Config
+from .metrics import REGISTRY, gauge_family
+
+logger = logging.getLogger(__name__)
+
+class BulkheadFullError(Exception):
+    """等待下游并发名额超时"""
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Bulkhead:
+    """下游服务舱壁：限制对单个下游服务的同时调用数，并记录饱和情况
+
+    同步调用（线程）和异步调用（协程）共用同一个信号量，两者合计不超过max_concurrent。
+    """
+
+    ASYNC_POLL_INTERVAL = 0.1  # 协程等待名额时的兜底重试间隔（秒），正常由释放名额的一方唤醒
+
+    def __init__(self, name, max_concurrent, wait_timeout=None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.wait_timeout = wait_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._async_waiters = deque()  # 等待名额的协程：(事件循环, Future)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.total_calls = 0
+        self.saturated_calls = 0  # 因名额已满而需要排队的调用数
+        self.rejected_calls = 0  # 排队超时被拒绝的调用数
+        self.total_wait_time = 0.0
+
+    @contextmanager
+    def slot(self, max_wait=None):
+        """占用一个并发名额，名额已满时排队等待
+
+        Args:
+            max_wait: 本次最长排队秒数（可选，如请求剩余时间），不超过wait_timeout
+
+        Raises:
+            BulkheadFullError: 等待超过wait_timeout或max_wait仍未获得名额
+        """
+        if not self._semaphore.acquire(blocking=False):
+            self._on_saturated()
+            wait_start = time.time()
+            acquired = self._semaphore.acquire(timeout=self._wait_limit(max_wait))
+            self._on_waited(time.time() - wait_start, acquired)
+
+        self._on_acquired()
+        try:
+            yield
+        finally:
+            self._on_released()
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self, max_wait=None):
+        """slot()的协程版本，供异步执行引擎在事件循环中使用
+
+        与同步调用共用名额和统计。名额已满时协程不占用线程排队：登记一个Future后让出事件循环，
+        任一调用释放名额时唤醒最早登记的协程重新尝试获取。
+
+        Raises:
+            BulkheadFullError: 等待超过wait_timeout或max_wait仍未获得名额
+        """
+        if not self._semaphore.acquire(blocking=False):
+            self._on_saturated()
+            wait_start = time.time()
+            acquired = await self._acquire_async(self._wait_limit(max_wait))
+            self._on_waited(time.time() - wait_start, acquired)
+
+        self._on_acquired()
+        try:
+            yield
+        finally:
+            self._on_released()
+            self._release()
+
+    async def _acquire_async(self, timeout):
+        """在事件循环中等待名额，超时返回False"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            waiter = (loop, loop.create_future())
+            with self._lock:
+                self._async_waiters.append(waiter)
+            try:
+                # 登记后再尝试一次，登记前刚释放的名额不会被错过
+                if self._semaphore.acquire(blocking=False):
+                    return True
+                wait = self.ASYNC_POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter[1]), wait)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._lock:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def _release(self):
+        """归还名额，并唤醒一个等待中的协程"""
+        self._semaphore.release()
+        with self._lock:
+            waiter = self._async_waiters.popleft() if self._async_waiters else None
+        if waiter is None:
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(_wake, future)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _wait_limit(self, max_wait):
+        if max_wait is None:
+            return self.wait_timeout
+        if self.wait_timeout is None:
+            return max_wait
+        return min(self.wait_timeout, max_wait)
+
+    def _on_saturated(self):
+        with self._lock:
+            self.waiting += 1
+            self.saturated_calls += 1
+
+    def _on_waited(self, wait_time, acquired):
+        with self._lock:
+            self.waiting -= 1
+            self.total_wait_time += wait_time
+            if not acquired:
+                self.rejected_calls += 1
+        if not acquired:
+            logger.error(f"{self.name}并发名额已满，等待{wait_time:.2f}秒后放弃")
+            raise BulkheadFullError(f'{self.name}服务繁忙，请稍后重试')
+        logger.debug(f"{self.name}并发名额已满，排队{wait_time:.2f}秒")
+
+    def _on_acquired(self):
+        with self._lock:
+            self.in_flight += 1
+            self.total_calls += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _on_released(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """返回并发和饱和统计"""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'peak_in_flight': self.peak_in_flight,
+                'total_calls': self.total_calls,
+                'saturated_calls': self.saturated_calls,
+                'rejected_calls': self.rejected_calls,
+                'total_wait_time': round(self.total_wait_time, 3)
+            }
+
+
+class SharedExecutor:
+    """进程级长生命周期线程池，记录排队和执行中的任务数"""
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，返回Future"""
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        # 排队中被取消的任务不会执行run，需要在这里扣减排队数
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def stats(self):
+        """返回线程池使用统计"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'active': self.active,
+                'queued': self.queued,
+                'completed': self.completed
+            }
+
+
+_bulkheads = {}
+_executors = {}
+_registry_lock = threading.Lock()
+
+def get_bulkhead(name):
+    """获取指定下游服务的舱壁，并发上限来自Config.BULKHEAD_LIMITS"""
+    with _registry_lock:
+        if name not in _bulkheads:
+            _bulkheads[name] = Bulkhead(
+                name,
+                Config.BULKHEAD_LIMITS[name],
+                wait_timeout=Config.BULKHEAD_WAIT_TIMEOUT
+            )
+        return _bulkheads[name]
+
+def get_executor(name):
+    """获取共享线程池，线程数来自Config.SHARED_EXECUTOR_WORKERS"""
+    with _registry_lock:
+        if name not in _executors:
+            _executors[name] = SharedExecutor(name, Config.SHARED_EXECUTOR_WORKERS[name])
+        return _executors[name]
+
+def get_concurrency_stats():
+    """汇总所有共享线程池和舱壁的统计信息"""
+    with _registry_lock:
+        executors = dict(_executors)
+        bulkheads = dict(_bulkheads)
+    return {
+        'executors': {name: executor.stats() for name, executor in executors.items()},
+        'bulkheads': {name: bulkhead.stats() for name, bulkhead in bulkheads.items()}
+    }
+
+def _collect_concurrency_metrics():
+    """把线程池和舱壁统计导出为Prometheus指标"""
+    stats = get_concurrency_stats()
+    return (
+        gauge_family('pigai_executor', '共享线程池状态', 'executor', stats['executors'])
+        + gauge_family('pigai_bulkhead', '下游服务舱壁状态', 'service', stats['bulkheads'])
+    )
+
+REGISTRY.register_collector(_collect_concurrency_metrics)
@@ -0,0 +1,41 @@
+import time
+
+class Deadline:
+    """单次批改请求的整体截止时间
+
+    在收到请求时创建，随请求传递到流水线各步骤和各下游调用。每次远程调用的超时、
+    重试次数和舱壁排队时间都不超过剩余时间，整体耗时不会因逐次超时和重试而被放大。
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_ms(cls, deadline_ms):
+        """根据毫秒数创建截止时间，deadline_ms为空或不大于0时返回None（不限时）"""
+        if not deadline_ms or deadline_ms <= 0:
+            return None
+        return cls(deadline_ms / 1000)
+
+    def remaining(self):
+        """剩余秒数，已过期时为0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """是否已过截止时间"""
+        return self.remaining() <= 0
+
+    def clamp_timeout(self, timeout):
+        """把requests风格的超时（秒数、(连接, 读取)元组或None）限制在剩余时间以内"""
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(min(value, remaining) for value in timeout)
+        return min(timeout, remaining)
+
+
+def remaining_time(deadline, default=None):
+    """剩余秒数，未设置截止时间时返回default"""
+    return deadline.remaining() if deadline is not None else default
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def compute_content_hash(image_data):
+    """计算图片内容的SHA-256指纹"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class DiskCache:
+    """磁盘持久化的LRU缓存
+
+    每个条目保存为一个JSON文件（compresslevel大于0时gzip压缩），文件修改时间记录最近访问时间，
+    重启后按修改时间恢复LRU顺序。超过条目上限或总字节数上限时淘汰最久未访问的条目，
+    超过有效期的条目在读取时删除。
+    """
+
+    def __init__(self, name, directory, max_entries, ttl, max_bytes=0, compresslevel=0):
+        """
+        Args:
+            name: 缓存名称，用于日志
+            directory: 缓存目录
+            max_entries: 条目数上限
+            ttl: 有效期（秒），0为永久有效
+            max_bytes: 缓存文件总字节数上限，0为不限
+            compresslevel: gzip压缩级别（1-9），0为不压缩
+        """
+        self.name = name
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self._suffix = '.json.gz' if compresslevel else '.json'
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> 文件字节数，按LRU顺序排列
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self._suffix}")
+
+    def _open(self, path, mode):
+        if self.compresslevel:
+            return gzip.open(path, f'{mode}t', encoding='utf-8', compresslevel=self.compresslevel)
+        return open(path, mode, encoding='utf-8')
+
+    def _load_index(self):
+        """扫描缓存目录，按最近访问时间重建LRU索引"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self._suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(self._suffix)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+        logger.info(f"{self.name}缓存加载完成，目录: {self.directory}，条目数: {len(self._index)}")
+        self._evict_overflow()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回None"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+        path = self._path(key)
+        try:
+            with self._open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"{self.name}缓存条目读取失败，已丢弃: {key}，原因: {str(e)}")
+            self.delete(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.ttl and time.time() - entry.get('stored_at', 0) > self.ttl:
+            logger.info(f"{self.name}缓存条目已过期: {key}")
+            self.delete(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            self.hits += 1
+        return entry.get('value')
+
+    def set(self, key, value):
+        """写入缓存（先写临时文件再原子替换）"""
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with self._open(temp_path, 'w') as f:
+                json.dump({'stored_at': time.time(), 'value': value}, f, ensure_ascii=False)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"{self.name}缓存写入失败: {key}，原因: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        with self._lock:
+            self._bytes += size - self._index.get(key, 0)
+            self._index[key] = size
+            self._index.move_to_end(key)
+        self._evict_overflow()
+        return True
+
+    def delete(self, key):
+        """删除缓存条目"""
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_overflow(self):
+        """淘汰超出条目上限或字节数上限的最久未访问条目"""
+        evicted = []
+        with self._lock:
+            while self._index and (
+                len(self._index) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                key, size = self._index.popitem(last=False)
+                self._bytes -= size
+                evicted.append(key)
+                self.evictions += 1
+
+        for key in evicted:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        if evicted:
+            logger.info(f"{self.name}缓存淘汰{len(evicted)}个条目")
+
+    def stats(self):
+        """返回缓存统计"""
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
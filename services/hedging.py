@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from config import Config
+from .concurrency import get_executor
+from .metrics import REGISTRY, gauge_family
+from .resilience import RetryBudget
+
+logger = logging.getLogger(__name__)
+
+HEDGES_SENT = REGISTRY.counter(
+    'pigai_hedged_requests_total', '超过对冲阈值后额外发出的重复请求数', ['service'])
+HEDGE_WINS = REGISTRY.counter(
+    'pigai_hedge_wins_total', '发出对冲后先返回可用结果的一方（primary原请求，hedge对冲请求）', ['service', 'winner'])
+HEDGE_BUDGET_EXHAUSTED = REGISTRY.counter(
+    'pigai_hedge_budget_exhausted_total', '因对冲比例上限而未发出的对冲请求数', ['service'])
+
+
+class HedgePolicy:
+    """单个下游服务的对冲请求策略
+
+    请求超过最近若干次成功请求耗时的指定分位数（自适应阈值）仍未返回时，再发一份相同请求，
+    取先返回可用结果的一方。对冲请求数受令牌桶限制，不超过请求总数的max_ratio倍左右，
+    避免下游整体变慢时对冲请求成倍放大负载。样本不足min_samples时使用initial_delay作为阈值。
+    """
+
+    def __init__(self, service, percentile, initial_delay, min_delay, max_ratio, max_burst, window, min_samples):
+        self.service = service
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._budget = RetryBudget(max_ratio, 0, max_burst)
+        self._latencies = deque(maxlen=window)
+        self._threshold = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def on_request(self):
+        """记录一个新请求，为对冲预算存入令牌"""
+        self._budget.on_request()
+        with self._lock:
+            self.requests += 1
+
+    def observe(self, latency):
+        """记录一次可用结果的耗时，用于更新对冲阈值"""
+        with self._lock:
+            self._latencies.append(latency)
+            self._threshold = None
+
+    def delay(self):
+        """当前对冲阈值（秒）"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            if self._threshold is None:
+                ordered = sorted(self._latencies)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._threshold = max(self.min_delay, ordered[index])
+            return self._threshold
+
+    def try_hedge(self):
+        """申请发出一个对冲请求，超过对冲比例上限时返回False"""
+        if not self._budget.try_acquire():
+            with self._lock:
+                self.budget_exhausted += 1
+            HEDGE_BUDGET_EXHAUSTED.inc(service=self.service)
+            return False
+        with self._lock:
+            self.hedges += 1
+        HEDGES_SENT.inc(service=self.service)
+        return True
+
+    def on_win(self, winner):
+        """记录发出对冲后先返回可用结果的一方"""
+        if winner == 'hedge':
+            with self._lock:
+                self.hedge_wins += 1
+        HEDGE_WINS.inc(service=self.service, winner=winner)
+
+    def stats(self):
+        """返回对冲阈值和对冲次数统计"""
+        threshold = self.delay()
+        with self._lock:
+            return {
+                'threshold': round(threshold, 3),
+                'samples': len(self._latencies),
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'budget_exhausted': self.budget_exhausted
+            }
+
+
+def _run_attempt(policy, call, accept, started=None):
+    if started is not None:
+        started.set()
+    start = time.time()
+    result = call()
+    if accept(result):
+        policy.observe(time.time() - start)
+    return result
+
+async def _run_attempt_async(policy, call, accept):
+    start = time.time()
+    result = await call()
+    if accept(result):
+        policy.observe(time.time() - start)
+    return result
+
+def _pick_winner(done, pending, attempts, accept):
+    """从已完成的请求中选出可用结果；两个请求都结束仍无可用结果时返回最后完成的一个"""
+    for attempt in done:
+        if attempt.exception() is None and accept(attempt.result()):
+            return attempt, attempts[attempt]
+    if not pending:
+        return next(iter(done)), None
+    return None, None
+
+def hedged_call(policy, call, accept):
+    """执行一次带对冲的同步调用
+
+    原请求和对冲请求都在共享线程池hedge中执行。对冲计时从原请求开始执行时算起，线程池排队时间不计入，
+    与用于计算阈值的耗时口径一致；线程池已有排队任务时不发出对冲（对冲请求同样要排队）。
+    落后的一方无法中断，会在后台执行完毕后丢弃结果。
+
+    Args:
+        policy: HedgePolicy
+        call: 无参函数，发出一次完整请求并返回结果（内部可包含重试）
+        accept: 判断结果是否可用的函数，不可用的结果不会提前结束等待
+
+    Returns:
+        先返回的可用结果；都不可用时为最后完成的结果，异常原样抛出
+    """
+    executor = get_executor('hedge')
+    policy.on_request()
+    started = threading.Event()
+    primary = executor.submit(_run_attempt, policy, call, accept, started)
+    started.wait()
+    delay = policy.delay()
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+    if executor.queued > 0 or not policy.try_hedge():
+        return primary.result()
+
+    logger.info(f"{policy.service}请求超过{delay:.2f}秒未返回，发出对冲请求")
+    hedge = executor.submit(_run_attempt, policy, call, accept)
+    attempts = {primary: 'primary', hedge: 'hedge'}
+    pending = set(attempts)
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner, label = _pick_winner(done, pending, attempts, accept)
+        if winner is not None:
+            if label is not None:
+                policy.on_win(label)
+            return winner.result()
+
+async def hedged_call_async(policy, call, accept):
+    """hedged_call的协程版本，call为返回协程的无参函数；选出结果后取消落后的一方"""
+    policy.on_request()
+    primary = asyncio.ensure_future(_run_attempt_async(policy, call, accept))
+    attempts = {primary: 'primary'}
+    try:
+        delay = policy.delay()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not policy.try_hedge():
+            return await primary
+
+        logger.info(f"{policy.service}请求超过{delay:.2f}秒未返回，发出对冲请求")
+        hedge = asyncio.ensure_future(_run_attempt_async(policy, call, accept))
+        attempts[hedge] = 'hedge'
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner, label = _pick_winner(done, pending, attempts, accept)
+            if winner is not None:
+                if label is not None:
+                    policy.on_win(label)
+                return winner.result()
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+def get_hedge_policy(service):
+    """获取指定下游服务的对冲策略，参数来自Config.HEDGE_*"""
+    with _policies_lock:
+        if service not in _policies:
+            _policies[service] = HedgePolicy(
+                service,
+                percentile=Config.HEDGE_PERCENTILE,
+                initial_delay=Config.HEDGE_INITIAL_DELAY,
+                min_delay=Config.HEDGE_MIN_DELAY,
+                max_ratio=Config.HEDGE_MAX_RATIO,
+                max_burst=Config.HEDGE_MAX_BURST,
+                window=Config.HEDGE_WINDOW,
+                min_samples=Config.HEDGE_MIN_SAMPLES
+            )
+        return _policies[service]
+
+def get_hedge_stats():
+    """汇总各下游服务的对冲统计"""
+    with _policies_lock:
+        policies = dict(_policies)
+    return {service: policy.stats() for service, policy in policies.items()}
+
+def _collect_hedge_metrics():
+    """把对冲阈值和对冲次数导出为Prometheus指标"""
+    return gauge_family('pigai_hedge', '对冲请求策略状态', 'service', get_hedge_stats())
+
+REGISTRY.register_collector(_collect_hedge_metrics)
@@ -0,0 +1,85 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from .metrics import REGISTRY, Gauge
+
+logger = logging.getLogger(__name__)
+
+class PooledHTTPClient:
+    """单个下游服务的keep-alive连接池
+
+    所有线程共用同一个HTTPAdapter（urllib3连接池本身线程安全），每个线程持有自己的
+    requests.Session，避免多线程修改同一个Session的cookie等状态。同一主机的请求复用已建立的
+    TCP/TLS连接，不再每次重新握手。
+    """
+
+    def __init__(self, name, pool_size):
+        self.name = name
+        self.pool_size = pool_size
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """当前线程的Session，挂载共享的连接池"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._local.session = session
+        return session
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        """返回各主机连接池的建连数和请求数，复用率 = 1 - 建连数 / 请求数"""
+        pools = self._adapter.poolmanager.pools
+        hosts = {}
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            hosts[host] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                'reuse_ratio': round(1 - pool.num_connections / pool.num_requests, 3) if pool.num_requests else 0.0
+            }
+        return {'pool_size': self.pool_size, 'hosts': hosts}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_http_client(name):
+    """获取指定下游服务的连接池客户端，池大小来自Config.HTTP_POOL_SIZES"""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = PooledHTTPClient(name, Config.HTTP_POOL_SIZES[name])
+        return _clients[name]
+
+def get_http_pool_stats():
+    """汇总所有下游连接池的复用统计"""
+    with _clients_lock:
+        clients = dict(_clients)
+    return {name: client.stats() for name, client in clients.items()}
+
+def _collect_http_pool_metrics():
+    """把连接池复用统计导出为Prometheus指标"""
+    opened = Gauge('pigai_http_connections_opened', '下游连接池累计新建连接数', ['service', 'host'])
+    sent = Gauge('pigai_http_pool_requests', '下游连接池累计发出请求数', ['service', 'host'])
+    for name, stats in get_http_pool_stats().items():
+        for host, host_stats in stats['hosts'].items():
+            opened.set(host_stats['connections_opened'], service=name, host=host)
+            sent.set(host_stats['requests'], service=name, host=host)
+    return [opened, sent]
+
+REGISTRY.register_collector(_collect_http_pool_metrics)
@@ -0,0 +1,47 @@
+import io
+import os
+from PIL import Image
+
+class ImageBuffer:
+    """内存中的上传图片
+
+    上传内容只读入一次，题目分割、OCR、题目切分和内容哈希共用同一份字节数据，
+    各阶段不再重复读取磁盘文件。流水线中凡是接受图片路径的地方都可以传入ImageBuffer。
+    """
+
+    def __init__(self, data, filename):
+        self.data = data
+        self.filename = filename
+
+    def __str__(self):
+        return self.filename
+
+
+def read_image_bytes(image):
+    """读取图片字节数据
+
+    Args:
+        image: 图片文件路径或ImageBuffer
+
+    Returns:
+        bytes: 图片内容；路径不存在时抛出FileNotFoundError
+    """
+    if isinstance(image, ImageBuffer):
+        return image.data
+    with open(image, 'rb') as f:
+        return f.read()
+
+def open_image(image):
+    """打开为PIL图片，ImageBuffer直接从内存解码"""
+    if isinstance(image, ImageBuffer):
+        return Image.open(io.BytesIO(image.data))
+    return Image.open(image)
+
+def image_exists(image):
+    """图片是否可用：ImageBuffer始终可用，路径需存在"""
+    return isinstance(image, ImageBuffer) or os.path.exists(image)
+
+def image_basename(image):
+    """不含扩展名的图片名，用于生成题目切图的文件名"""
+    name = image.filename if isinstance(image, ImageBuffer) else image
+    return os.path.splitext(os.path.basename(name))[0]
@@ -0,0 +1,167 @@
+import io
+import logging
+from PIL import Image, ImageOps
+from config import Config
+from .image_buffer import open_image, read_image_bytes
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+
+# Textin响应中的坐标字段：pos/position为8值四边形，char_pos为每个字符一个8值四边形
+OCR_COORDINATE_KEYS = ('pos', 'position', 'char_pos')
+
+# 规范化算法版本：摆正、降采样或编码方式改变（发送的字节随之改变）时递增，使按发送参数计算的缓存键失效
+NORMALIZER_VERSION = 1
+
+
+class NormalizedImage:
+    """发送给下游服务的规范化图片
+
+    原图空间指按EXIF方向摆正后的原始分辨率图片，题目切分也在该空间中裁剪。
+    scale_x、scale_y为原图空间与发送图片的尺寸比例，下游返回的坐标乘以该比例即换算回原图空间。
+    """
+
+    __slots__ = ('data', 'scale_x', 'scale_y', 'size')
+
+    def __init__(self, data, scale_x=1.0, scale_y=1.0, size=None):
+        self.data = data
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.size = size
+
+    @property
+    def rescaled(self):
+        """下游返回的坐标是否需要换算"""
+        return self.scale_x != 1.0 or self.scale_y != 1.0
+
+
+def _orientation(image):
+    """读取EXIF方向标记，没有或读取失败时返回1（无需旋转）"""
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def open_upright(image):
+    """打开图片并按EXIF方向摆正（规范化关闭时保持原样），得到原图空间的图片"""
+    pil_image = open_image(image)
+    if Config.IMAGE_NORMALIZE_ENABLED and _orientation(pil_image) != 1:
+        pil_image = ImageOps.exif_transpose(pil_image)
+    return pil_image
+
+
+def normalizer_params(service):
+    """影响发送给下游服务的图片字节的规范化参数，用于缓存键"""
+    if not Config.IMAGE_NORMALIZE_ENABLED:
+        return 'off'
+    return (f"v{NORMALIZER_VERSION}|{Config.IMAGE_MAX_SIDE.get(service, 0)}"
+            f"|q{Config.IMAGE_NORMALIZE_JPEG_QUALITY}")
+
+
+def normalize_image(image, service):
+    """按下游服务的长边上限规范化图片
+
+    图片已是正向且长边不超过上限时直接使用原始字节；否则摆正、缩小后以
+    IMAGE_NORMALIZE_JPEG_QUALITY重新编码为JPEG。只读取文件头即可判断，不需要时不解码。
+
+    Args:
+        image: 图片文件路径或ImageBuffer
+        service: 下游服务名称，对应Config.IMAGE_MAX_SIDE中的长边上限
+
+    Returns:
+        NormalizedImage: 发送的字节数据及坐标换算比例；路径不存在时抛出FileNotFoundError
+    """
+    data = read_image_bytes(image)
+    if not Config.IMAGE_NORMALIZE_ENABLED:
+        return NormalizedImage(data)
+
+    try:
+        pil_image = Image.open(io.BytesIO(data))
+        orientation = _orientation(pil_image)
+    except Exception as e:
+        logger.warning(f"图片规范化失败，使用原图发送: {image}，原因: {str(e)}")
+        return NormalizedImage(data)
+
+    width, height = pil_image.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    max_side = Config.IMAGE_MAX_SIDE.get(service, 0)
+    ratio = max_side / max(width, height) if max_side > 0 else 1.0
+    if ratio >= 1 and orientation == 1:
+        return NormalizedImage(data, size=(width, height))
+
+    target = (max(1, round(width * ratio)), max(1, round(height * ratio))) if ratio < 1 else (width, height)
+    try:
+        # JPEG按1/2、1/4、1/8在解码时直接降采样，大图不必全分辨率解码
+        if ratio < 1:
+            draft_size = (target[1], target[0]) if orientation in (5, 6, 7, 8) else target
+            pil_image.draft('RGB', draft_size)
+        pil_image = ImageOps.exif_transpose(pil_image)
+        if pil_image.size != target:
+            pil_image = pil_image.resize(target, Image.LANCZOS)
+        if pil_image.mode not in ('RGB', 'L'):
+            pil_image = pil_image.convert('RGB')
+
+        output = io.BytesIO()
+        pil_image.save(output, 'JPEG', quality=Config.IMAGE_NORMALIZE_JPEG_QUALITY)
+    except Exception as e:
+        logger.warning(f"图片规范化失败，使用原图发送: {image}，原因: {str(e)}")
+        return NormalizedImage(data)
+
+    normalized = output.getvalue()
+    logger.debug("图片规范化(%s): %dx%d -> %dx%d，%d -> %d 字节",
+                 service, width, height, target[0], target[1], len(data), len(normalized))
+    return NormalizedImage(normalized, width / target[0], height / target[1], (width, height))
+
+
+def _scale_quad(values, scale_x, scale_y):
+    """换算[x1, y1, x2, y2, ...]格式的坐标，四舍五入为整数像素"""
+    return [round(v * (scale_x if i % 2 == 0 else scale_y)) for i, v in enumerate(values)]
+
+
+def _scale_ocr_coordinates(node, scale_x, scale_y):
+    if isinstance(node, list):
+        for item in node:
+            _scale_ocr_coordinates(item, scale_x, scale_y)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key in OCR_COORDINATE_KEYS and isinstance(value, list) and value:
+            if isinstance(value[0], list):
+                node[key] = [_scale_quad(quad, scale_x, scale_y) for quad in value]
+            else:
+                node[key] = _scale_quad(value, scale_x, scale_y)
+        elif isinstance(value, (dict, list)):
+            _scale_ocr_coordinates(value, scale_x, scale_y)
+
+
+def rescale_ocr_response(result, normalized):
+    """把Textin响应中的坐标（pos、position、char_pos及页面宽高）原地换算回原图空间
+
+    换算在解析之前完成，归档、缓存和后续所有处理看到的都是原图空间的坐标。
+    """
+    if not normalized.rescaled or not isinstance(result, dict):
+        return result
+    scale_x, scale_y = normalized.scale_x, normalized.scale_y
+    ocr_result = result.get('result')
+    _scale_ocr_coordinates(ocr_result, scale_x, scale_y)
+    if isinstance(ocr_result, dict) and normalized.size:
+        for page in ocr_result.get('pages', []):
+            if 'width' in page and 'height' in page:
+                page['width'], page['height'] = normalized.size
+    return result
+
+
+def rescale_segmentation_response(result, normalized):
+    """把题目分割响应中的detection_boxes原地换算回原图空间"""
+    if not normalized.rescaled or not isinstance(result, dict):
+        return result
+    scale_x, scale_y = normalized.scale_x, normalized.scale_y
+    result['detection_boxes'] = [
+        [v * (scale_x if i % 2 == 0 else scale_y) for i, v in enumerate(box)]
+        for box in result.get('detection_boxes', [])
+    ]
+    return result
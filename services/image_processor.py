@@ -1,15 +1,42 @@
+import asyncio
 import requests
 import json
 import os
 import requests
 import base64
+import io
 from PIL import Image
 from config import Config
+from .async_engine import get_async_engine
+from .http_client import get_http_client
+from .concurrency import get_executor
+from .deadline import Deadline, remaining_time
+from .image_buffer import ImageBuffer, image_basename
+from .image_normalizer import normalize_image, open_upright, rescale_segmentation_response
+from .layout_segmenter import LayoutSegmenter
+from .local_segmenter import LocalSegmenter
+from .log_utils import preview
+from .metrics import REGISTRY
+from .ocr_geometry import PageGeometry
+from .resilience import DownstreamError, RequestCancelledError, call_downstream, get_circuit_breaker
+from .spatial_index import CharGridIndex
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+SEGMENTATIONS = REGISTRY.counter(
+    'pigai_segmentations_total', '题目分割次数（engine为实际使用的引擎，fallback表示auto模式下由远程降级为本地）',
+    ['engine', 'fallback'])
+
+def remove_files(paths):
+    """删除生成的中间文件（如PDF渲染出的页面图片），不存在或删除失败时忽略"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除文件失败: {path}，原因: {str(e)}")
+
 class ImageProcessor:
     """图像处理服务"""
     
@@ -18,20 +45,154 @@ class ImageProcessor:
         self.api_token = Config.SEGMENTATION_API_TOKEN
         self.timeout = Config.REQUEST_TIMEOUT
         self.max_retries = Config.MAX_RETRIES
-        self.retry_delay = Config.RETRY_DELAY
+        self.local_segmenter = LocalSegmenter()
+        self.layout_segmenter = LayoutSegmenter()
+    
+    def segment(self, image_path, engine=None, cancel_event=None, deadline=None):
+        """按指定引擎执行题目分割
+        
+        Args:
+            image_path: 图片文件路径或ImageBuffer
+            engine: remote、local或auto，默认Config.SEGMENTATION_ENGINE。auto时优先调用远程接口，
+                熔断中、调用失败或超过SEGMENTATION_FALLBACK_AFTER秒未完成时改用本地分割；
+                layout需要OCR结果，由流水线调用segment_questions_layout
+            cancel_event: 取消事件（可选），被设置后不再发起后续重试
+            deadline: 请求的整体截止时间（可选）
+            
+        Returns:
+            dict: 与segment_questions格式相同的分割结果，附带engine字段；降级时附带fallback_reason
+        """
+        engine = engine or Config.SEGMENTATION_ENGINE
+        if engine == 'layout':
+            return {'success': False, 'error': 'layout引擎需要OCR结果，请使用segment_questions_layout'}
+        if engine == 'local':
+            return self._segmented(self.segment_questions_local(image_path), 'local')
+        if engine == 'remote':
+            return self._segmented(self.segment_questions(image_path, cancel_event, deadline), 'remote')
+        
+        reason = self._remote_segmentation_unavailable()
+        if reason is None:
+            result = self.segment_questions(image_path, cancel_event, self._fallback_deadline(deadline))
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if result['success'] or cancelled or (deadline is not None and deadline.expired()):
+                return self._segmented(result, 'remote')
+            reason = result.get('error')
+        logger.warning(f"远程题目分割不可用（{reason}），改用本地分割")
+        return self._segmented(self.segment_questions_local(image_path), 'local', reason)
+    
+    async def segment_async(self, image_path, engine=None, deadline=None):
+        """segment的异步版本，本地分割在线程中执行
+        
+        Returns:
+            dict: 与segment格式相同的分割结果
+        """
+        engine = engine or Config.SEGMENTATION_ENGINE
+        if engine == 'layout':
+            return {'success': False, 'error': 'layout引擎需要OCR结果，请使用segment_questions_layout'}
+        if engine == 'local':
+            return self._segmented(await asyncio.to_thread(self.segment_questions_local, image_path), 'local')
+        if engine == 'remote':
+            return self._segmented(await self.segment_questions_async(image_path, deadline), 'remote')
+        
+        reason = self._remote_segmentation_unavailable()
+        if reason is None:
+            result = await self.segment_questions_async(image_path, self._fallback_deadline(deadline))
+            if result['success'] or (deadline is not None and deadline.expired()):
+                return self._segmented(result, 'remote')
+            reason = result.get('error')
+        logger.warning(f"远程题目分割不可用（{reason}），改用本地分割")
+        return self._segmented(await asyncio.to_thread(self.segment_questions_local, image_path), 'local', reason)
+    
+    def _segmented(self, result, engine, fallback_reason=None):
+        """在分割结果中标注实际使用的引擎（降级时附带原因），并计入分割次数指标"""
+        result = dict(result, engine=engine)
+        if fallback_reason is not None:
+            result['fallback_reason'] = fallback_reason
+        if result['success']:
+            SEGMENTATIONS.inc(engine=engine, fallback=str(fallback_reason is not None).lower())
+        return result
+    
+    def _remote_segmentation_unavailable(self):
+        """远程分割接口熔断中时返回原因，否则返回None"""
+        if get_circuit_breaker('segmentation').is_open():
+            return '远程分割服务熔断中'
+        return None
+    
+    def _fallback_deadline(self, deadline):
+        """auto模式下远程分割的截止时间：不超过SEGMENTATION_FALLBACK_AFTER秒，也不超过请求本身的剩余时间"""
+        budget = Config.SEGMENTATION_FALLBACK_AFTER
+        if budget <= 0:
+            return deadline
+        return Deadline(min(budget, remaining_time(deadline, budget)))
+    
+    def segment_questions_local(self, image_path):
+        """使用进程内的OpenCV分割器检测题目区域，结果格式与segment_questions相同
+        
+        Args:
+            image_path: 图片文件路径或ImageBuffer
+            
+        Returns:
+            dict: 包含分割结果的字典
+        """
+        start_time = time.time()
+        try:
+            result = self.local_segmenter.detect(image_path)
+        except ImportError:
+            logger.error("未安装opencv-python，无法使用本地题目分割")
+            return {
+                'success': False,
+                'error': '本地题目分割需要安装opencv-python'
+            }
+        except FileNotFoundError:
+            error_msg = f"图片文件不存在: {image_path}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg}
+        except Exception as e:
+            error_msg = f"本地题目分割失败: {str(e)}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg}
+        
+        coordinates = self._parse_coordinates(result)
+        logger.info(f"本地题目分割完成，用时: {time.time() - start_time:.2f}秒，检测到{len(coordinates)}个题目区域")
+        return {
+            'success': True,
+            'coordinates': coordinates,
+            'raw_result': result
+        }
     
-    def segment_questions(self, image_path):
+    def segment_questions_layout(self, ocr_result):
+        """根据OCR版面信息划分题目区域，不发起网络请求
+        
+        Args:
+            ocr_result: OCR识别结果
+            
+        Returns:
+            dict: 与segment_questions格式相同的分割结果，engine为layout
+        """
+        result = self.layout_segmenter.detect(ocr_result)
+        if not result['success']:
+            return {'success': False, 'error': result['error'], 'engine': 'layout'}
+        
+        coordinates = self._parse_coordinates(result)
+        return self._segmented({
+            'success': True,
+            'coordinates': coordinates,
+            'raw_result': result
+        }, 'layout')
+    
+    def segment_questions(self, image_path, cancel_event=None, deadline=None):
         """调用API进行题目分割
         
         Args:
-            image_path: 图片文件路径
+            image_path: 图片文件路径或ImageBuffer
+            cancel_event: 取消事件（可选），被设置后不再发起后续重试
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
             
         Returns:
             dict: 包含分割结果的字典
         """
         logger.info(f"开始调用题目分割API，图片路径: {image_path}")
-        logger.info(f"API配置 - URL: {self.api_url}")
-        logger.info(f"API配置 - Token: {self.api_token[:20]}...")  # 只记录token前20位
+        logger.debug("API配置 - URL: %s", self.api_url)
         
         try:
             # 准备请求头，按照实际API要求设置
@@ -44,67 +205,59 @@ class ImageProcessor:
                 'Content-Type': 'application/octet-stream'
             }
             
-            logger.info(f"请求头配置: {json.dumps(headers, ensure_ascii=False, indent=2)}")
+            # 读取图片字节数据（内存中的上传图片直接复用），按服务长边上限规范化
+            normalized = normalize_image(image_path, 'segmentation')
+            image_data = normalized.data
+            logger.info(f"成功读取图片文件，大小: {len(image_data)} 字节")
+            
+            # 发送POST请求，直接传递图片二进制数据；重试、退避和熔断由弹性层处理
+            try:
+                response = call_downstream(
+                    'segmentation', get_http_client('segmentation').post,
+                    self.api_url,
+                    headers=headers,
+                    data=image_data,
+                    timeout=self.timeout,
+                    max_attempts=self.max_retries,
+                    cancel_event=cancel_event,
+                    deadline=deadline
+                )
+            except RequestCancelledError:
+                logger.warning("题目分割已被取消")
+                return {
+                    'success': False,
+                    'error': '题目分割已取消'
+                }
+            except (requests.exceptions.RequestException, DownstreamError) as e:
+                logger.error(f"网络请求异常: {str(e)}")
+                return {
+                    'success': False,
+                    'error': f'网络请求失败: {str(e)}'
+                }
+            
+            logger.info(f"API响应状态码: {response.status_code}")
+            logger.debug("API响应头: %s", response.headers)
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("API调用失败，状态码: %s，响应内容: %s", response.status_code, preview(error_text))
+                return {
+                    'success': False,
+                    'error': f'API调用失败，状态码: {response.status_code}，响应: {error_text}'
+                }
+            
+            result = rescale_segmentation_response(response.json(), normalized)
+            logger.debug("API调用成功，响应数据: %s", preview(result))
+            
+            coordinates = self._parse_coordinates(result)
+            logger.info(f"成功解析出 {len(coordinates)} 个题目区域")
             
-            # 读取图片文件并转换为字节数据
-            with open(image_path, 'rb') as file:
-                image_data = file.read()
-                logger.info(f"成功读取图片文件，大小: {len(image_data)} 字节")
-                
-                # 进行重试请求
-                for attempt in range(self.max_retries):
-                    try:
-                        logger.info(f"调用题目分割API，尝试次数: {attempt + 1}/{self.max_retries}")
-                        logger.info(f"请求URL: {self.api_url}")
-                        
-                        # 发送POST请求，直接传递图片二进制数据
-                        response = requests.post(
-                            self.api_url,
-                            headers=headers,
-                            data=image_data,
-                            timeout=self.timeout
-                        )
-                        
-                        logger.info(f"API响应状态码: {response.status_code}")
-                        logger.info(f"API响应头: {dict(response.headers)}")
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            logger.info(f"API调用成功，响应数据: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                            
-                            coordinates = self._parse_coordinates(result)
-                            logger.info(f"成功解析出 {len(coordinates)} 个题目区域")
-                            
-                            return {
-                                'success': True,
-                                'coordinates': coordinates,
-                                'raw_result': result
-                            }
-                        else:
-                            error_text = response.text
-                            logger.error(f"API调用失败，状态码: {response.status_code}，响应内容: {error_text}")
-                            if attempt < self.max_retries - 1:
-                                logger.info(f"等待 {self.retry_delay} 秒后重试...")
-                                time.sleep(self.retry_delay)
-                                continue
-                            else:
-                                return {
-                                    'success': False,
-                                    'error': f'API调用失败，状态码: {response.status_code}，响应: {error_text}'
-                                }
-                                
-                    except requests.exceptions.RequestException as e:
-                        logger.error(f"网络请求异常: {str(e)}")
-                        if attempt < self.max_retries - 1:
-                            logger.info(f"等待 {self.retry_delay} 秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
-                        else:
-                            return {
-                                'success': False,
-                                'error': f'网络请求失败: {str(e)}'
-                            }
-                        
+            return {
+                'success': True,
+                'coordinates': coordinates,
+                'raw_result': result
+            }
+                    
         except FileNotFoundError:
             error_msg = f"图片文件不存在: {image_path}"
             logger.error(error_msg)
@@ -120,6 +273,112 @@ class ImageProcessor:
                 'error': error_msg
             }
     
+    async def segment_questions_async(self, image_path, deadline=None):
+        """segment_questions的异步版本，在异步执行引擎的事件循环中调用
+        
+        Args:
+            image_path: 图片文件路径或ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
+            
+        Returns:
+            dict: 包含分割结果的字典，格式与segment_questions相同
+        """
+        engine = get_async_engine()
+        try:
+            normalized = await asyncio.to_thread(normalize_image, image_path, 'segmentation')
+            image_data = normalized.data
+            logger.info(f"异步调用题目分割API，图片大小: {len(image_data)} 字节")
+            
+            response = await engine.request(
+                'segmentation', 'POST', self.api_url,
+                max_attempts=self.max_retries,
+                deadline=deadline,
+                timeout=self.timeout,
+                headers={
+                    'Authorization': self.api_token,
+                    'Content-Type': 'application/octet-stream'
+                },
+                data=image_data
+            )
+            
+            if response.status_code != 200:
+                return {
+                    'success': False,
+                    'error': f'API调用失败，状态码: {response.status_code}，响应: {response.text}'
+                }
+            
+            result = rescale_segmentation_response(response.json(), normalized)
+            coordinates = self._parse_coordinates(result)
+            logger.info(f"成功解析出 {len(coordinates)} 个题目区域")
+            return {
+                'success': True,
+                'coordinates': coordinates,
+                'raw_result': result
+            }
+        except FileNotFoundError:
+            error_msg = f"图片文件不存在: {image_path}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg}
+        except DownstreamError as e:
+            return {'success': False, 'error': f'网络请求失败: {str(e)}'}
+        except Exception as e:
+            error_msg = f"题目分割处理失败: {str(e)}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg}
+    
+    def render_pdf_pages(self, pdf_path, output_folder, dpi=None, max_pages=None):
+        """将PDF逐页渲染为PNG图片，供题目分割和OCR按页处理
+        
+        Args:
+            pdf_path: PDF文件路径
+            output_folder: 页面图片输出目录
+            dpi: 渲染分辨率，默认使用Config.PDF_RENDER_DPI
+            max_pages: 页数上限（可选），超过时不渲染任何页面直接返回失败
+            
+        Returns:
+            dict: 包含按页顺序排列的图片路径列表；失败时已渲染的页面图片会被删除
+        """
+        dpi = dpi or Config.PDF_RENDER_DPI
+        try:
+            import fitz  # PyMuPDF，仅批量处理PDF时需要
+        except ImportError:
+            logger.error("未安装PyMuPDF，无法渲染PDF页面")
+            return {
+                'success': False,
+                'error': 'PDF处理需要安装PyMuPDF'
+            }
+        
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        page_paths = []
+        try:
+            with fitz.open(pdf_path) as document:
+                if max_pages is not None and document.page_count > max_pages:
+                    return {
+                        'success': False,
+                        'error': f'页数超过上限: {document.page_count}/{max_pages}',
+                        'page_count': document.page_count
+                    }
+                logger.info(f"开始渲染PDF: {pdf_path}，共{document.page_count}页，分辨率: {dpi}dpi")
+                for page_index, page in enumerate(document):
+                    page_path = os.path.join(output_folder, f"{base_name}_page_{page_index + 1}.png")
+                    page.get_pixmap(dpi=dpi).save(page_path)
+                    page_paths.append(page_path)
+            
+            logger.info(f"PDF渲染完成，生成{len(page_paths)}张页面图片")
+            return {
+                'success': True,
+                'page_paths': page_paths
+            }
+        
+        except Exception as e:
+            error_msg = f"PDF渲染失败: {str(e)}"
+            logger.error(error_msg)
+            remove_files(page_paths)
+            return {
+                'success': False,
+                'error': error_msg
+            }
+    
     def _parse_coordinates(self, api_result):
         """解析API返回的坐标信息
         
@@ -173,7 +432,7 @@ class ImageProcessor:
                     }
                     
                     coordinates.append(coord_info)
-                    logger.info(f"题目 {i+1}: 坐标({int(x1)},{int(y1)},{int(x2)},{int(y2)}) 置信度:{score:.3f} 类别:{class_name}")
+                    logger.debug("题目 %d: 坐标(%d,%d,%d,%d) 置信度:%.3f 类别:%s", i + 1, x1, y1, x2, y2, score, class_name)
             
             # 按y坐标排序，从上到下排列题目
             coordinates.sort(key=lambda x: x['y1'])
@@ -186,70 +445,75 @@ class ImageProcessor:
             logger.error(error_msg)
             return []
     
-    def split_questions(self, image_path, coordinates, ocr_result, char_details=None):
+    def split_questions(self, image_path, coordinates, ocr_result, char_details=None, assignment_rule=None, persist=None):
         """根据坐标信息分割题目
         
         Args:
-            image_path: 原始图片路径
+            image_path: 原始图片路径或ImageBuffer
             coordinates: 题目坐标列表
             ocr_result: OCR识别结果
-            char_details: 字符级坐标信息（用于批改接口）
+            char_details: 整页字符表（CharTable，用于批改接口）
+            assignment_rule: 字符归属题目的判定规则（top_left、center或overlap），默认Config.CHAR_ASSIGNMENT_RULE
+            persist: 是否同时把题目切图保存到PROCESSED_FOLDER，默认Config.QUESTION_IMAGE_PERSIST
             
         Returns:
-            list: 分割后的题目信息列表
+            list: 分割后的题目信息列表，image_path为内存中的ImageBuffer（JPEG），char_details为整页字符表的视图
         """
         questions = []
         
         try:
-            # 打开原始图片
-            image = Image.open(image_path)
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            # 打开原始图片（按EXIF方向摆正，与下游服务返回的坐标处于同一空间）
+            image = open_upright(image_path)
+            base_name = image_basename(image_path)
+            
+            # 整页字符只建一次网格索引，每道题按区域查询
+            char_index = CharGridIndex(char_details, Config.CHAR_GRID_CELL_SIZE) if char_details else None
+            assignment_rule = assignment_rule or Config.CHAR_ASSIGNMENT_RULE
+            
+            # 所有题目区域的文字用整页几何信息表一次批量提取；OCR结果不是pages格式时逐题提取
+            geometry = ocr_result.get('geometry') or PageGeometry.from_ocr_result(ocr_result)
+            region_texts = None
+            if geometry is not None:
+                region_texts = geometry.region_texts([
+                    (coord['x1'], coord['y1'], coord['x2'], coord['y2']) for coord in coordinates
+                ])
+            
+            # 在当前线程完成解码和裁剪，JPEG编码（Pillow编码时释放GIL）并行提交到共享线程池
+            image.load()
+            persist = Config.QUESTION_IMAGE_PERSIST if persist is None else persist
+            executor = get_executor('encode')
+            encode_futures = [
+                executor.submit(
+                    self._encode_question_image,
+                    image.crop((coord['x1'], coord['y1'], coord['x2'], coord['y2'])),
+                    os.path.join(Config.PROCESSED_FOLDER, f"{base_name}_question_{i+1}.jpg"),
+                    persist
+                )
+                for i, coord in enumerate(coordinates)
+            ]
             
             for i, coord in enumerate(coordinates):
-                # 裁剪题目区域
-                question_image = image.crop((
-                    coord['x1'], coord['y1'], coord['x2'], coord['y2']
-                ))
-                
-                # 保存裁剪后的图片
-                question_image_path = os.path.join(
-                    Config.PROCESSED_FOLDER, 
-                    f"{base_name}_question_{i+1}.jpg"
-                )
-                
-                # 如果图片是RGBA模式，转换为RGB模式以支持JPEG格式
-                if question_image.mode == 'RGBA':
-                    # 创建白色背景
-                    rgb_image = Image.new('RGB', question_image.size, (255, 255, 255))
-                    rgb_image.paste(question_image, mask=question_image.split()[-1])  # 使用alpha通道作为mask
-                    question_image = rgb_image
-                
-                question_image.save(question_image_path, 'JPEG')
-                
                 # 提取该区域的OCR文字
-                question_text = self._extract_region_text(
-                    ocr_result, coord['x1'], coord['y1'], coord['x2'], coord['y2']
-                )
+                if region_texts is not None:
+                    question_text = region_texts[i]
+                else:
+                    question_text = self._extract_region_text(
+                        ocr_result, coord['x1'], coord['y1'], coord['x2'], coord['y2']
+                    )
                 
                 # 提取该区域的字符级坐标信息
                 question_char_details = []
-                if char_details:
-                    for char_detail in char_details:
-                        # coordinates是8个值的数组: [x1, y1, x2, y2, x3, y3, x4, y4]
-                        char_coords = char_detail.get('coordinates', [])
-                        if len(char_coords) >= 4:
-                            # 使用字符坐标的左上角点进行区域判断
-                            char_x = char_coords[0]
-                            char_y = char_coords[1]
-                            # 判断字符是否在题目区域内
-                            if (coord['x1'] <= char_x <= coord['x2'] and 
-                                coord['y1'] <= char_y <= coord['y2']):
-                                question_char_details.append(char_detail)
+                if char_index is not None:
+                    question_char_details = char_index.query(
+                        coord['x1'], coord['y1'], coord['x2'], coord['y2'],
+                        rule=assignment_rule,
+                        min_overlap=Config.CHAR_ASSIGNMENT_MIN_OVERLAP
+                    )
                 
                 questions.append({
                     'question_id': i + 1,
                     'coordinates': coord,
-                    'image_path': question_image_path,
+                    'image_path': encode_futures[i].result(),
                     'text': question_text,
                     'char_details': question_char_details
                 })
@@ -261,6 +525,37 @@ class ImageProcessor:
             logger.error(f"题目分割失败: {str(e)}")
             return []
     
+    def _encode_question_image(self, question_image, question_image_path, persist):
+        """把裁剪后的题目图片编码为JPEG（在共享线程池中执行）
+        
+        Args:
+            question_image: 裁剪后的PIL图片
+            question_image_path: 题目切图路径，作为ImageBuffer的文件名，persist时写入该路径
+            persist: 是否同时保存到磁盘
+            
+        Returns:
+            ImageBuffer: 内存中的JPEG数据
+        """
+        # 如果图片是RGBA模式，转换为RGB模式以支持JPEG格式
+        if question_image.mode == 'RGBA':
+            # 创建白色背景
+            rgb_image = Image.new('RGB', question_image.size, (255, 255, 255))
+            rgb_image.paste(question_image, mask=question_image.split()[-1])  # 使用alpha通道作为mask
+            question_image = rgb_image
+        
+        output = io.BytesIO()
+        question_image.save(
+            output, 'JPEG',
+            quality=Config.QUESTION_IMAGE_JPEG_QUALITY,
+            subsampling=Config.QUESTION_IMAGE_JPEG_SUBSAMPLING
+        )
+        data = output.getvalue()
+        
+        if persist:
+            with open(question_image_path, 'wb') as f:
+                f.write(data)
+        return ImageBuffer(data, question_image_path)
+    
     def _extract_region_text(self, ocr_result, x1, y1, x2, y2):
         """从OCR结果中提取指定区域的文字
         
@@ -274,17 +569,16 @@ class ImageProcessor:
         region_text = []
         
         try:
-            logger.debug(f"提取区域文本，坐标: ({x1}, {y1}) 到 ({x2}, {y2})")
-            logger.info(f"OCR结果结构: {list(ocr_result.keys()) if isinstance(ocr_result, dict) else 'not dict'}")
+            logger.debug("提取区域文本，坐标: (%s, %s) 到 (%s, %s)", x1, y1, x2, y2)
             
             # 检查OCR结果结构，优先从pages的content中获取字符级坐标信息
             if 'result' in ocr_result:
                 # 优先使用pages格式，因为它包含字符级坐标信息
                 if 'pages' in ocr_result['result']:
-                    logger.info(f"使用Pages格式处理OCR结果（包含字符级坐标）")
+                    logger.debug("使用Pages格式处理OCR结果（包含字符级坐标）")
                     for page_idx, page in enumerate(ocr_result['result']['pages']):
                         if 'content' in page:
-                            logger.debug(f"处理第{page_idx+1}页，包含{len(page['content'])}个文本项")
+                            logger.debug("处理第%d页，包含%d个文本项", page_idx + 1, len(page['content']))
                             
                             for item in page['content']:
                                 if 'char_pos' in item and 'text' in item:
@@ -314,14 +608,14 @@ class ImageProcessor:
                                                 )
                                                 if char_text:
                                                     region_text.append(char_text)
-                                                    logger.info(f"✓ 字符级提取文本: '{char_text}'")
+                                                    logger.debug("✓ 字符级提取文本: '%s'", char_text)
                                             else:
                                                 region_text.append(item['text'])
-                                                logger.info(f"✓ 直接提取文本: '{item['text']}'")
+                                                logger.debug("✓ 直接提取文本: '%s'", item['text'])
                 
                 # 如果没有pages格式，才使用detail格式（但这种格式缺少字符级坐标）
                 elif 'detail' in ocr_result['result']:
-                    logger.info(f"使用Detail格式处理OCR结果（缺少字符级坐标），detail数组长度: {len(ocr_result['result']['detail'])}")
+                    logger.info("使用Detail格式处理OCR结果（缺少字符级坐标），detail数组长度: %d", len(ocr_result['result']['detail']))
                     logger.warning("注意：Detail格式不包含字符级坐标，可能影响精确度")
                     
                     found_texts = []
@@ -329,24 +623,24 @@ class ImageProcessor:
                         if 'text' in item and 'position' in item:
                             # 检查文字是否在指定区域内
                             text_coords = item['position']
-                            logger.debug(f"检查文本第{idx}项: '{item['text']}', 坐标: {text_coords}")
+                            logger.debug("检查文本第%d项: '%s', 坐标: %s", idx, item['text'], text_coords)
                             
                             if self._is_text_in_region_new_format(text_coords, x1, y1, x2, y2):
-                                logger.info(f"✓ 找到区域内文本第{idx}项: '{item['text']}'")
+                                logger.debug("✓ 找到区域内文本第%d项: '%s'", idx, item['text'])
                                 region_text.append(item['text'])
                                 found_texts.append(item['text'])
                             else:
-                                logger.debug(f"✗ 文本第{idx}项不在区域内: '{item['text']}'")
+                                logger.debug("✗ 文本第%d项不在区域内: '%s'", idx, item['text'])
                     
-                    logger.info(f"区域内找到的所有文本: {found_texts}")
+                    logger.debug("区域内找到的所有文本: %s", preview(found_texts))
                 else:
                     logger.warning(f"OCR结果中既没有pages也没有detail格式")
             else:
-                logger.warning(f"OCR结果格式不认识: {list(ocr_result.keys()) if isinstance(ocr_result, dict) else 'not dict'}")
+                logger.warning("OCR结果格式不认识: %s", list(ocr_result.keys()) if isinstance(ocr_result, dict) else 'not dict')
                 return ""
             
             result_text = ' '.join(region_text)
-            logger.debug(f"区域文本提取完成，总长度: {len(result_text)}")
+            logger.debug("区域文本提取完成，总长度: %d", len(result_text))
             return result_text
             
         except Exception as e:
@@ -371,18 +665,18 @@ class ImageProcessor:
             min_length = min(len(text), len(char_coords))
             extracted_chars = []
             
-            logger.debug(f"开始字符级精确提取: 文本='{text}', 区域=[{x1},{y1},{x2},{y2}]")
+            logger.debug("开始字符级精确提取: 文本='%s', 区域=[%s,%s,%s,%s]", text, x1, y1, x2, y2)
             
             for i in range(min_length):
                 char_coord = char_coords[i]
                 # 检查字符坐标是否在题目区域内
                 if self._is_char_in_region(char_coord, x1, y1, x2, y2):
                     extracted_chars.append(text[i])
-                    logger.debug(f"字符'{text[i]}'在区域内: {char_coord}")
+                    logger.debug("字符'%s'在区域内: %s", text[i], char_coord)
             
             result = ''.join(extracted_chars)
             if result != text:
-                logger.debug(f"字符级精确提取：原文本'{text}' -> 区域文本'{result}'")
+                logger.debug("字符级精确提取：原文本'%s' -> 区域文本'%s'", text, result)
             
             return result
             
@@ -439,7 +733,10 @@ class ImageProcessor:
                 
                 is_in_region = (x1 <= char_center_x <= x2 and y1 <= char_center_y <= y2)
                 
-                logger.debug(f"字符坐标检查: 字符边界[{char_x1:.1f},{char_y1:.1f},{char_x2:.1f},{char_y2:.1f}], 中心点({char_center_x:.1f},{char_center_y:.1f}), 区域[{x1},{y1},{x2},{y2}], 结果={is_in_region}")
+                logger.debug(
+                    "字符坐标检查: 字符边界[%.1f,%.1f,%.1f,%.1f], 中心点(%.1f,%.1f), 区域[%s,%s,%s,%s], 结果=%s",
+                    char_x1, char_y1, char_x2, char_y2, char_center_x, char_center_y, x1, y1, x2, y2, is_in_region
+                )
                 
                 return is_in_region
             
@@ -471,10 +768,10 @@ class ImageProcessor:
                 text_x2 = position_coords[4]  # 右下角x
                 text_y2 = position_coords[5]  # 右下角y
                 
-                logger.debug(f"坐标匹配检查:")
-                logger.debug(f"  文本坐标: ({text_x1}, {text_y1}) 到 ({text_x2}, {text_y2})")
-                logger.debug(f"  区域坐标: ({x1}, {y1}) 到 ({x2}, {y2})")
-                logger.debug(f"  原始position: {position_coords}")
+                logger.debug(
+                    "坐标匹配检查: 文本坐标(%s, %s)到(%s, %s), 区域坐标(%s, %s)到(%s, %s), 原始position: %s",
+                    text_x1, text_y1, text_x2, text_y2, x1, y1, x2, y2, position_coords
+                )
                 
                 # 检查文字区域是否与题目区域有重叠
                 # 条件检查：text_x2 < x1(文本在区域左侧) or text_x1 > x2(文本在区域右侧) or text_y2 < y1(文本在区域上方) or text_y1 > y2(文本在区域下方)
@@ -485,8 +782,8 @@ class ImageProcessor:
                 
                 overlap = not (cond1 or cond2 or cond3 or cond4)
                 
-                logger.debug(f"  重叠检查: 左侧={cond1}, 右侧={cond2}, 上方={cond3}, 下方={cond4}")
-                logger.debug(f"  结果: {'重叠' if overlap else '不重叠'}")
+                logger.debug("  重叠检查: 左侧=%s, 右侧=%s, 上方=%s, 下方=%s, 结果: %s",
+                             cond1, cond2, cond3, cond4, '重叠' if overlap else '不重叠')
                 
                 return overlap
             
@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """单个批改任务的状态、阶段进度和（部分）结果
+
+    所有进度事件按顺序记录在events中，流式接口通过wait_events增量读取。
+    """
+
+    def __init__(self, job_id, filename):
+        self.job_id = job_id
+        self.filename = filename
+        self.status = 'queued'  # queued -> running -> completed / failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        self.questions = []
+        self.results = []
+        self.pages = []
+        self.result = None
+        self.error = None
+        self.events = []
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    @property
+    def finished(self):
+        """任务是否已结束"""
+        return self.status in ('completed', 'failed')
+
+    def on_progress(self, event, data):
+        """接收流水线进度事件并更新任务状态"""
+        with self._lock:
+            self.events.append((event, data))
+            self._condition.notify_all()
+            if 'page' in data:
+                self._on_page_progress(event, data)
+            elif event == 'stage_started':
+                self.stages[data['stage']] = {'status': 'running', 'started_at': time.time()}
+            elif event == 'stage_completed':
+                self.stages.setdefault(data['stage'], {}).update({
+                    'status': 'completed',
+                    'elapsed': data.get('elapsed')
+                })
+            elif event == 'stage_failed':
+                self.stages.setdefault(data['stage'], {}).update({
+                    'status': 'failed',
+                    'error': data.get('error')
+                })
+            elif event == 'questions_ready':
+                self.questions = data['questions']
+                self.results = [None] * len(self.questions)
+            elif event == 'question_completed':
+                if data['index'] < len(self.results):
+                    self.results[data['index']] = data['result']
+
+    def _on_page_progress(self, event, data):
+        """记录批量任务中单页的进度，阶段以“页码.阶段”为键"""
+        page = data['page']
+        if event == 'page_started':
+            self.pages.extend({'page': i + 1, 'status': 'queued'} for i in range(len(self.pages), page + 1))
+            self.pages[page] = {'page': page + 1, 'filename': data.get('filename'), 'status': 'running'}
+        elif event == 'page_completed':
+            self.pages.extend({'page': i + 1, 'status': 'queued'} for i in range(len(self.pages), page + 1))
+            self.pages[page] = dict(data['result'], status='completed' if data['result'].get('success') else 'failed')
+        elif event in ('stage_started', 'stage_completed', 'stage_failed'):
+            stage_key = f"page{page + 1}.{data['stage']}"
+            if event == 'stage_started':
+                self.stages[stage_key] = {'status': 'running', 'started_at': time.time()}
+            elif event == 'stage_completed':
+                self.stages.setdefault(stage_key, {}).update({'status': 'completed', 'elapsed': data.get('elapsed')})
+            else:
+                self.stages.setdefault(stage_key, {}).update({'status': 'failed', 'error': data.get('error')})
+
+    def finish(self, result):
+        """记录流水线最终结果并发送结束事件"""
+        with self._lock:
+            self.finished_at = time.time()
+            if result.get('success'):
+                self.status = 'completed'
+                self.result = result
+                summary = {key: value for key, value in result.items() if key not in ('results', 'pages')}
+                self.events.append(('completed', summary))
+            else:
+                self.status = 'failed'
+                self.error = result.get('error', '未知错误')
+                self.events.append(('failed', {'error': self.error, 'timed_out': bool(result.get('timed_out'))}))
+            self._condition.notify_all()
+
+    def wait_events(self, cursor, timeout=None):
+        """等待并返回cursor之后的新事件
+
+        Args:
+            cursor: 已读取的事件数
+            timeout: 最长等待秒数
+
+        Returns:
+            tuple: (新事件列表, 新的cursor, 任务是否已结束)
+        """
+        with self._condition:
+            if cursor >= len(self.events) and not self.finished:
+                self._condition.wait(timeout)
+            events = self.events[cursor:]
+            return events, cursor + len(events), self.finished
+
+    def to_dict(self):
+        """转换为API返回格式"""
+        with self._lock:
+            completed = sum(1 for r in self.results if r is not None)
+            job_info = {
+                'job_id': self.job_id,
+                'filename': self.filename,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'stages': {stage: dict(info) for stage, info in self.stages.items()},
+                'progress': {
+                    'total_questions': len(self.questions),
+                    'completed_questions': completed
+                }
+            }
+
+            if self.status == 'completed' and self.result is not None:
+                job_info.update(self.result)
+            elif self.pages:
+                job_info['pages'] = [dict(page) for page in self.pages]
+            else:
+                job_info['questions'] = list(self.questions)
+                job_info['results'] = list(self.results)
+
+            if self.error:
+                job_info['error'] = self.error
+            return job_info
+
+
+class JobManager:
+    """后台批改任务管理器
+
+    使用有界线程池执行批改流水线，Web线程只负责入队和查询，
+    已结束的任务在保留期过后被清理。
+    """
+
+    def __init__(self, pipeline, max_workers, max_pending, result_ttl):
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, filepath, filename, force=False, deadline=None, segmenter=None):
+        """提交批改任务
+
+        Args:
+            filepath: 上传图片路径，或内存中的ImageBuffer
+            filename: 上传文件名
+            force: 为True时跳过结果缓存
+            deadline: 请求的整体截止时间（可选），排队时间也计入其中
+            segmenter: 题目分割引擎（remote、local、auto或layout，可选）
+
+        Returns:
+            Job: 新建的任务；排队任务已达上限时返回None
+        """
+        return self._enqueue(filename, self.pipeline.process, filepath, force=force, deadline=deadline, segmenter=segmenter)
+
+    def submit_batch(self, filepaths, name, force=False, deadline=None, segmenter=None):
+        """提交多页批量批改任务
+
+        Args:
+            filepaths: 按页顺序排列的图片路径列表
+            name: 任务名称（上传文件名）
+            force: 为True时跳过结果缓存
+            deadline: 整个批次的截止时间（可选）
+            segmenter: 题目分割引擎（remote、local、auto或layout，可选）
+
+        Returns:
+            Job: 新建的任务；排队任务已达上限时返回None
+        """
+        return self._enqueue(name, self.pipeline.process_batch, filepaths, force=force, deadline=deadline, segmenter=segmenter)
+
+    def _enqueue(self, filename, target, source, **options):
+        """创建任务并放入工作线程池"""
+        self._evict_expired()
+
+        with self._lock:
+            active = sum(1 for job in self.jobs.values() if job.status in ('queued', 'running'))
+            if active >= self.max_pending:
+                logger.warning(f"批改任务队列已满({active}/{self.max_pending})，拒绝新任务: {filename}")
+                return None
+
+            job = Job(uuid.uuid4().hex, filename)
+            self.jobs[job.job_id] = job
+
+        self.executor.submit(self._run, job, target, source, options)
+        logger.info(f"批改任务已入队: {job.job_id}，文件: {filename}")
+        return job
+
+    def get(self, job_id):
+        """查询任务，不存在时返回None"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, target, source, options):
+        """在工作线程中执行批改流水线"""
+        with job._lock:
+            job.status = 'running'
+            job.started_at = time.time()
+        logger.info(f"开始执行批改任务: {job.job_id}，排队用时: {job.started_at - job.created_at:.2f}秒")
+
+        try:
+            result = target(source, progress_callback=job.on_progress, archive_id=job.job_id, **options)
+        except Exception as e:
+            logger.error(f"批改任务{job.job_id}执行异常: {str(e)}")
+            result = {'success': False, 'error': f'处理失败: {str(e)}'}
+
+        job.finish(result)
+
+        logger.info(f"批改任务{job.job_id}结束，状态: {job.status}，用时: {job.finished_at - job.started_at:.2f}秒")
+
+    def _evict_expired(self):
+        """清理超过保留期的已结束任务"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job.finished_at is not None and now - job.finished_at > self.result_ttl
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+        if expired:
+            logger.info(f"清理{len(expired)}个过期批改任务")
@@ -2,6 +2,10 @@ import requests
 import json
 import requests
 from config import Config
+from .async_engine import get_async_engine
+from .http_client import get_http_client
+from .log_utils import preview
+from .resilience import DownstreamError, call_downstream
 import logging
 import time
 from .obs_service import OBSService
@@ -18,18 +22,18 @@ class KnowledgeService:
         self.tenant_id = Config.KNOWLEDGE_TENANT_ID
         self.timeout = Config.REQUEST_TIMEOUT
         self.max_retries = Config.MAX_RETRIES
-        self.retry_delay = Config.RETRY_DELAY
         self.obs_service = OBSService()
         
         # 构建数据集检索API的完整URL
         self.api_url = f"{self.base_url}/v1/datasets/{self.dataset_id}/retrieve"
     
-    def search_similar_question(self, query_text, image_path=None):
+    def search_similar_question(self, query_text, image_path=None, deadline=None):
         """在知识库中搜索相似题目
         
         Args:
             query_text: 查询文本
             image_path: 题目图片路径（可选）
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
             
         Returns:
             dict: 包含搜索结果的字典
@@ -56,123 +60,70 @@ class KnowledgeService:
                 'Content-Type': 'application/json'
             }
             
-            # 构建dify数据库检索API请求载荷
-            payload = {
-                "query": query_text,
-                "retrieval_model": {
-                    "search_method": "hybrid_search",
-                    "reranking_enable": True,
-                    "reranking_mode": "reranking_model",
-                    "reranking_model": {
-                        "reranking_provider_name": "tongyi",
-                        "reranking_model_name": "gte-rerank"
-                    },
-                    "weights": {
-                        "weight_type": "customized",
-                        "vector_setting": {
-                            "vector_weight": 0.1,
-                            "embedding_provider_name": "",
-                            "embedding_model_name": ""
-                        },
-                        "keyword_setting": {
-                            "keyword_weight": 0.9
-                        }
-                    },
-                    "top_k": 5,
-                    "score_threshold_enabled": True,
-                    "score_threshold": 0.6
-                }
-            }
+            payload = self._build_search_payload(query_text)
             
             # 如果有图片，暂时忽略图片检索功能
             if image_path:
                 logger.warning("当前dify数据库检索API版本不支持图片检索，仅使用文本检索")
             
-            logger.debug(f"知识库请求头: {headers}")
             logger.debug(f"知识库API URL: {self.api_url}")
             logger.debug(f"检索查询: {query_text}")
-            logger.debug(f"知识库请求载荷: {json.dumps(payload, ensure_ascii=False)}")
+            logger.debug("知识库请求载荷: %s", preview(payload))
             logger.info(f"使用数据集ID: {self.dataset_id} 进行检索")
             
-            # 进行重试请求
-            for attempt in range(self.max_retries):
-                try:
-                    logger.info(f"调用知识库检索API，尝试次数: {attempt + 1}/{self.max_retries}")
-                    start_time = time.time()
-                    
-                    response = requests.post(
-                        self.api_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=(Config.KNOWLEDGE_CONNECT_TIMEOUT, Config.KNOWLEDGE_READ_TIMEOUT)
-                    )
-                    
-                    end_time = time.time()
-                    logger.info(f"知识库API响应时间: {end_time - start_time:.2f}秒")
-                    
-                    logger.info(f"知识库API响应状态码: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        try:
-                            result = response.json()
-                            logger.debug(f"知识库API原始响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                        except json.JSONDecodeError as e:
-                            logger.error(f"知识库响应JSON解析失败: {str(e)}")
-                            logger.error(f"响应内容: {response.text[:500]}...")
-                            return {
-                                'success': False,
-                                'error': '知识库响应格式错误',
-                                'query': query_text
-                            }
-                        
-                        logger.info("知识库检索成功")
-                        
-                        # 解析搜索结果
-                        logger.info(f"知识库检索完成原始数据，{result}")
-                        parsed_result = self._parse_search_result(result, query_text)
-                        logger.info(f"知识库检索完成，{parsed_result}")
-                        logger.info(f"知识库检索完成，找到{len(parsed_result.get('all_results', []))}个结果")
-                        logger.info(f"最佳匹配相似度: {parsed_result.get('similarity_score', 0.0)}")
-                        
-                        return {
-                            'success': True,
-                            'query': query_text,
-                            'reference_answer': parsed_result.get('reference_answer', ''),
-                            'question_image_url': parsed_result.get('question_image_url', ''),
-                            'answer_image_url': parsed_result.get('answer_image_url', ''),
-                            'question_text': parsed_result.get('question_text', ''),
-                            'answer_text': parsed_result.get('answer_text', ''),
-                            'similarity_score': parsed_result.get('similarity_score', 0.0),
-                            'source_document': parsed_result.get('source_document', ''),
-                            'all_results': parsed_result.get('all_results', []),
-                            'raw_result': result
-                        }
-                    else:
-                        logger.error(f"知识库API调用失败，状态码: {response.status_code}")
-                        logger.error(f"响应内容: {response.text[:500]}...")
-                        
-                        if attempt < self.max_retries - 1:
-                            logger.info(f"等待{self.retry_delay}秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
-                        else:
-                            return {
-                                'success': False,
-                                'error': f'知识库API调用失败，状态码: {response.status_code}',
-                                'query': query_text
-                            }
-                            
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"知识库请求异常: {str(e)}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                        continue
-                    else:
-                        return {
-                            'success': False,
-                            'error': f'知识库网络请求失败: {str(e)}',
-                            'query': query_text
-                        }
+            # 发送请求，重试、退避和熔断由弹性层处理
+            start_time = time.time()
+            try:
+                response = call_downstream(
+                    'knowledge', get_http_client('knowledge').post,
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=(Config.KNOWLEDGE_CONNECT_TIMEOUT, Config.KNOWLEDGE_READ_TIMEOUT),
+                    max_attempts=self.max_retries,
+                    deadline=deadline
+                )
+            except (requests.exceptions.RequestException, DownstreamError) as e:
+                logger.error(f"知识库请求异常: {str(e)}")
+                return {
+                    'success': False,
+                    'error': f'知识库网络请求失败: {str(e)}',
+                    'query': query_text
+                }
+            
+            logger.info(f"知识库API响应时间: {time.time() - start_time:.2f}秒")
+            logger.info(f"知识库API响应状态码: {response.status_code}")
+            
+            if response.status_code != 200:
+                logger.error(f"知识库API调用失败，状态码: {response.status_code}")
+                logger.error(f"响应内容: {response.text[:500]}...")
+                return {
+                    'success': False,
+                    'error': f'知识库API调用失败，状态码: {response.status_code}',
+                    'query': query_text
+                }
+            
+            try:
+                result = response.json()
+                logger.debug("知识库API原始响应: %s", preview(result))
+            except json.JSONDecodeError as e:
+                logger.error(f"知识库响应JSON解析失败: {str(e)}")
+                logger.error(f"响应内容: {response.text[:500]}...")
+                return {
+                    'success': False,
+                    'error': '知识库响应格式错误',
+                    'query': query_text
+                }
+            
+            logger.info("知识库检索成功")
+            
+            # 解析搜索结果
+            parsed_result = self._parse_search_result(result, query_text)
+            logger.debug("知识库检索解析结果: %s", preview(parsed_result))
+            logger.info(f"知识库检索完成，找到{len(parsed_result.get('all_results', []))}个结果")
+            logger.info(f"最佳匹配相似度: {parsed_result.get('similarity_score', 0.0)}")
+            
+            return self._build_search_response(result, parsed_result, query_text)
                         
         except Exception as e:
             logger.error(f"知识库检索处理失败: {str(e)}")
@@ -182,6 +133,114 @@ class KnowledgeService:
                 'query': query_text
             }
     
+    async def search_similar_question_async(self, query_text, deadline=None):
+        """search_similar_question的异步版本，在异步执行引擎的事件循环中调用
+        
+        Args:
+            query_text: 查询文本
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
+            
+        Returns:
+            dict: 包含搜索结果的字典，格式与search_similar_question相同
+        """
+        try:
+            if not query_text or not query_text.strip():
+                logger.warning("查询文本为空，跳过知识库检索")
+                return {
+                    'success': False,
+                    'error': '查询文本为空',
+                    'query': query_text
+                }
+            query_text = query_text.strip()[:250]
+            
+            response = await get_async_engine().request(
+                'knowledge', 'POST', self.api_url,
+                max_attempts=self.max_retries,
+                deadline=deadline,
+                timeout=(Config.KNOWLEDGE_CONNECT_TIMEOUT, Config.KNOWLEDGE_READ_TIMEOUT),
+                headers={'Authorization': f'Bearer {self.api_token}'},
+                json=self._build_search_payload(query_text)
+            )
+            
+            if response.status_code != 200:
+                return {
+                    'success': False,
+                    'error': f'知识库API调用失败，状态码: {response.status_code}',
+                    'query': query_text
+                }
+            
+            try:
+                result = response.json()
+            except json.JSONDecodeError as e:
+                logger.error(f"知识库响应JSON解析失败: {str(e)}")
+                return {
+                    'success': False,
+                    'error': '知识库响应格式错误',
+                    'query': query_text
+                }
+            
+            parsed_result = self._parse_search_result(result, query_text)
+            logger.info(f"知识库检索完成，找到{len(parsed_result.get('all_results', []))}个结果")
+            return self._build_search_response(result, parsed_result, query_text)
+        except DownstreamError as e:
+            return {
+                'success': False,
+                'error': f'知识库网络请求失败: {str(e)}',
+                'query': query_text
+            }
+        except Exception as e:
+            logger.error(f"知识库检索处理失败: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'query': query_text
+            }
+    
+    def _build_search_payload(self, query_text):
+        """构建dify数据库检索API请求载荷"""
+        return {
+            "query": query_text,
+            "retrieval_model": {
+                "search_method": "hybrid_search",
+                "reranking_enable": True,
+                "reranking_mode": "reranking_model",
+                "reranking_model": {
+                    "reranking_provider_name": "tongyi",
+                    "reranking_model_name": "gte-rerank"
+                },
+                "weights": {
+                    "weight_type": "customized",
+                    "vector_setting": {
+                        "vector_weight": 0.1,
+                        "embedding_provider_name": "",
+                        "embedding_model_name": ""
+                    },
+                    "keyword_setting": {
+                        "keyword_weight": 0.9
+                    }
+                },
+                "top_k": 5,
+                "score_threshold_enabled": True,
+                "score_threshold": 0.6
+            }
+        }
+    
+    def _build_search_response(self, result, parsed_result, query_text):
+        """把解析后的检索结果整理为接口返回格式"""
+        return {
+            'success': True,
+            'query': query_text,
+            'reference_answer': parsed_result.get('reference_answer', ''),
+            'question_image_url': parsed_result.get('question_image_url', ''),
+            'answer_image_url': parsed_result.get('answer_image_url', ''),
+            'question_text': parsed_result.get('question_text', ''),
+            'answer_text': parsed_result.get('answer_text', ''),
+            'similarity_score': parsed_result.get('similarity_score', 0.0),
+            'source_document': parsed_result.get('source_document', ''),
+            'all_results': parsed_result.get('all_results', []),
+            'raw_result': result
+        }
+    
     def _parse_search_result(self, api_result, query_text):
         """解析知识库搜索结果
         
@@ -201,7 +260,7 @@ class KnowledgeService:
         
         try:
             logger.info(f"开始解析dify数据库检索API返回结果...")
-            logger.debug(f"API返回结构: {json.dumps(api_result, ensure_ascii=False, indent=2) if isinstance(api_result, dict) else str(api_result)}")
+            logger.debug("API返回结构: %s", preview(api_result))
             
             # 解析Dify数据库检索API格式
             if isinstance(api_result, dict) and 'records' in api_result:
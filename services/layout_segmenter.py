@@ -0,0 +1,213 @@
+import re
+import statistics
+from config import Config
+
+CLASS_NAME = 'question'
+
+# 题号锚点：大题"1." "2、"，小题"（3）" "(4)"；"一、"等分部标题只作为分隔，不属于任何一题
+QUESTION_NUMBER = re.compile(r'^\s*(\d{1,3})\s*[.．、](?!\d)')
+SUB_QUESTION_NUMBER = re.compile(r'^\s*[（(]\s*(\d{1,3})\s*[)）]')
+SECTION_HEADER = re.compile(r'^\s*[一二三四五六七八九十]{1,3}\s*[、.．]')
+
+
+def _quad_box(pos):
+    """8值四边形坐标的外接矩形"""
+    xs = pos[0::2]
+    ys = pos[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def box_iou(a, b):
+    """两个题目框（x1、y1、x2、y2字典）的交并比"""
+    overlap_w = min(a['x2'], b['x2']) - max(a['x1'], b['x1'])
+    overlap_h = min(a['y2'], b['y2']) - max(a['y1'], b['y1'])
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    overlap = overlap_w * overlap_h
+    area_a = (a['x2'] - a['x1']) * (a['y2'] - a['y1'])
+    area_b = (b['x2'] - b['x1']) * (b['y2'] - b['y1'])
+    return overlap / (area_a + area_b - overlap)
+
+
+def compare_segmentations(reference, candidate, iou_threshold=0.5):
+    """按IoU从高到低贪心一对一匹配两组题目框，评估候选结果与参考结果的一致性
+
+    Args:
+        reference: 参考题目坐标列表（通常为远程分割结果）
+        candidate: 候选题目坐标列表
+        iou_threshold: 判定两个框一致的IoU阈值
+
+    Returns:
+        dict: matched、precision、recall和mean_iou（匹配对的平均IoU）
+    """
+    pairs = sorted(
+        ((box_iou(r, c), i, j) for i, r in enumerate(reference) for j, c in enumerate(candidate)),
+        reverse=True
+    )
+    used_reference, used_candidate, matched = set(), set(), []
+    for score, i, j in pairs:
+        if score < iou_threshold:
+            break
+        if i in used_reference or j in used_candidate:
+            continue
+        used_reference.add(i)
+        used_candidate.add(j)
+        matched.append(score)
+    return {
+        'matched': len(matched),
+        'precision': len(matched) / len(candidate) if candidate else float(not reference),
+        'recall': len(matched) / len(reference) if reference else float(not candidate),
+        'mean_iou': statistics.mean(matched) if matched else 0.0
+    }
+
+
+class LayoutSegmenter:
+    """根据OCR版面信息划分题目区域，不需要单独的题目分割调用
+
+    使用Textin响应result.pages[].content中每个文本行的pos：先按版面中间的竖直空白检测分栏，
+    再在每栏内从上到下以题号锚点（贴近栏左边距的"1." "2、"，页面没有这类题号时用"（3）"）划分题目，
+    栏内没有任何题号时按明显大于行高的竖直留白划分。每道题的区域向下延伸到同栏下一题或下一个分部标题之前，
+    包含作答留白；页首和分部标题之后、第一个题号之前的内容（标题、作答说明等）不属于任何一题。
+    """
+
+    def __init__(self, gap_ratio=None):
+        """
+        Args:
+            gap_ratio: 没有题号时，行间留白达到行高中位数的该倍数即视为新题，默认Config.LAYOUT_SEGMENTER_GAP_RATIO
+        """
+        self.gap_ratio = gap_ratio or Config.LAYOUT_SEGMENTER_GAP_RATIO
+
+    def detect(self, ocr_result):
+        """从OCR结果划分题目区域
+
+        Args:
+            ocr_result: OCR识别结果（extract_text的返回值或Textin原始响应）
+
+        Returns:
+            dict: 与远程分割接口相同格式的结果（detection_boxes等），坐标与OCR坐标处于同一空间；
+                OCR结果不是pages格式时success为False
+        """
+        result = ocr_result.get('result') if isinstance(ocr_result, dict) else None
+        if not isinstance(result, dict) or 'pages' not in result:
+            return {'success': False, 'error': 'OCR结果中没有pages版面信息'}
+
+        boxes = []
+        scores = []
+        for page in result['pages']:
+            lines = []
+            for item in page.get('content', []):
+                pos = item.get('pos')
+                if not pos or len(pos) < 8:
+                    continue
+                lines.append((_quad_box(pos), (item.get('text') or '').strip()))
+            if not lines:
+                continue
+            page_width = page.get('width') or max(box[2] for box, _ in lines)
+            for column in self._columns(lines, page_width):
+                column_boxes, column_scores = self._column_questions(column)
+                boxes.extend(column_boxes)
+                scores.extend(column_scores)
+
+        return {
+            'success': True,
+            'detection_boxes': boxes,
+            'detection_scores': scores,
+            'detection_classes': [0] * len(boxes),
+            'detection_class_names': [CLASS_NAME] * len(boxes),
+            'engine': 'layout'
+        }
+
+    def _columns(self, lines, page_width):
+        """检测分栏：在页面中间区域寻找没有任何窄文本行覆盖的竖直空白，按行中心点分配到左右两栏"""
+        narrow = sorted(
+            (box[0], box[2]) for box, _ in lines if box[2] - box[0] < 0.45 * page_width
+        )
+        gutter = None
+        if len(narrow) >= 6:
+            covered_to = narrow[0][1]
+            for x1, x2 in narrow[1:]:
+                gap = x1 - covered_to
+                center = (x1 + covered_to) / 2
+                if gap >= 0.02 * page_width and 0.25 * page_width <= center <= 0.75 * page_width:
+                    if gutter is None or gap > gutter[1] - gutter[0]:
+                        gutter = (covered_to, x1)
+                covered_to = max(covered_to, x2)
+
+        if gutter is None:
+            return [lines]
+        split = (gutter[0] + gutter[1]) / 2
+        left = [line for line in lines if (line[0][0] + line[0][2]) / 2 < split]
+        right = [line for line in lines if (line[0][0] + line[0][2]) / 2 >= split]
+        if len(left) < 3 or len(right) < 3:
+            return [lines]
+        return [left, right]
+
+    def _column_questions(self, lines):
+        """在单栏内按题号锚点划分题目，返回题目框和置信度"""
+        lines = sorted(lines, key=lambda line: (line[0][1], line[0][0]))
+        line_height = statistics.median(box[3] - box[1] for box, _ in lines) or 1
+        margin = self._margin(lines)
+        at_margin = [box[0] <= margin + 2 * line_height for box, _ in lines]
+
+        pattern = QUESTION_NUMBER
+        if not any(QUESTION_NUMBER.match(text) and at_margin[i] for i, (_, text) in enumerate(lines)):
+            pattern = SUB_QUESTION_NUMBER
+
+        # 每组：boxes为文本行框，anchored为是否由题号锚点开始，preamble为是否位于页首或分部标题之后、
+        # 下一个题号之前（标题、姓名栏、"一、选择题"下的作答说明等），limit为作答留白向下延伸的上限（下一个分部标题）
+        groups = []
+        current = None
+        previous_bottom = None
+        in_preamble = True
+        for i, (box, text) in enumerate(lines):
+            if SECTION_HEADER.match(text) and at_margin[i]:
+                if groups and groups[-1]['limit'] is None:
+                    groups[-1]['limit'] = box[1]
+                current = None
+                previous_bottom = box[3]
+                in_preamble = True
+                continue
+            anchored = at_margin[i] and pattern.match(text) is not None
+            spaced = previous_bottom is not None and box[1] - previous_bottom >= self.gap_ratio * line_height
+            if current is None or anchored or (spaced and not current['anchored']):
+                if anchored:
+                    in_preamble = False
+                current = {'boxes': [], 'anchored': anchored, 'preamble': in_preamble, 'limit': None}
+                groups.append(current)
+            current['boxes'].append(box)
+            previous_bottom = max(previous_bottom or box[3], box[3])
+
+        if any(group['anchored'] for group in groups):
+            # 栏内有题号时，题号之前的内容不作为题目
+            groups = [group for group in groups if not group['preamble']]
+
+        pad = line_height / 2
+        boxes = []
+        scores = []
+        for index, group in enumerate(groups):
+            group_boxes = group['boxes']
+            y1 = min(box[1] for box in group_boxes) - pad
+            y2 = max(box[3] for box in group_boxes) + pad
+            if index + 1 < len(groups):
+                # 作答留白归属于上一题：区域延伸到同栏下一题（或下一个分部标题）之前
+                next_top = min(box[1] for box in groups[index + 1]['boxes'])
+                if group['limit'] is not None:
+                    next_top = min(next_top, group['limit'])
+                y2 = max(y2, next_top - pad)
+            boxes.append([
+                max(0, min(box[0] for box in group_boxes) - pad),
+                max(0, y1),
+                max(box[2] for box in group_boxes) + pad,
+                y2
+            ])
+            scores.append(0.7 if group['anchored'] else 0.4)
+        return boxes, scores
+
+    @staticmethod
+    def _margin(lines):
+        """栏左边距：题号行的最小x；没有题号行时取所有行左缘的10%分位数"""
+        for pattern in (QUESTION_NUMBER, SUB_QUESTION_NUMBER):
+            numbered = [box[0] for box, text in lines if pattern.match(text)]
+            if numbered:
+                return min(numbered)
+        return sorted(box[0] for box, _ in lines)[len(lines) // 10]
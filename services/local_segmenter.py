@@ -0,0 +1,131 @@
+import logging
+import numpy as np
+from config import Config
+from .image_normalizer import open_upright
+
+logger = logging.getLogger(__name__)
+
+CLASS_NAME = 'question'
+
+
+class LocalSegmenter:
+    """基于OpenCV的本地题目分割
+
+    在工作进程内完成，不发起网络请求：缩小到固定宽度后自适应二值化，按水平投影切出文本行，
+    再以题号锚点把文本行归并为题目。题号锚点为左缘贴近页面左边距、且上方留白明显大于行高
+    或行首是一个短字形块（如"1."、"12、"）的文本行。每道题的区域向下延伸到下一题之前，
+    包含作答留白。只适用于单栏版式，准确度低于远程模型，用作快速路径和降级路径。
+    """
+
+    def __init__(self, work_width=None, gap_ratio=None):
+        """
+        Args:
+            work_width: 分割时缩放到的图片宽度（像素），默认Config.LOCAL_SEGMENTER_WORK_WIDTH
+            gap_ratio: 行首贴近左边距时，上方留白达到行高中位数的该倍数即视为新题，
+                默认Config.LOCAL_SEGMENTER_GAP_RATIO
+        """
+        self.work_width = work_width or Config.LOCAL_SEGMENTER_WORK_WIDTH
+        self.gap_ratio = gap_ratio or Config.LOCAL_SEGMENTER_GAP_RATIO
+
+    def detect(self, image_path):
+        """检测题目区域
+
+        Args:
+            image_path: 图片文件路径或ImageBuffer
+
+        Returns:
+            dict: 与远程分割接口相同格式的结果（success、detection_boxes、detection_scores、
+                detection_classes、detection_class_names、ori_img_shape），坐标为摆正后的原图坐标
+        """
+        import cv2  # opencv-python，仅本地题目分割时需要
+
+        image = open_upright(image_path)
+        width, height = image.size
+        gray = np.asarray(image.convert('L'))
+
+        scale = min(1.0, self.work_width / width)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (self.work_width, max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+        block_size = max(15, (gray.shape[1] // 40) | 1)
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block_size, 15
+        )
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+        # 拍照页面四周的阴影和纸张边缘不参与分行
+        border_y = gray.shape[0] // 50
+        border_x = gray.shape[1] // 50
+        ink = np.zeros(binary.shape, dtype=bool)
+        ink[border_y:binary.shape[0] - border_y, border_x:binary.shape[1] - border_x] = (
+            binary[border_y:binary.shape[0] - border_y, border_x:binary.shape[1] - border_x] > 0
+        )
+
+        boxes, scores = self._question_boxes(ink)
+        boxes = [[value / scale for value in box] for box in boxes]
+        logger.debug("本地题目分割: %dx%d，检测到%d个题目", width, height, len(boxes))
+        return {
+            'success': True,
+            'detection_boxes': boxes,
+            'detection_scores': scores,
+            'detection_classes': [0] * len(boxes),
+            'detection_class_names': [CLASS_NAME] * len(boxes),
+            'ori_img_shape': [height, width, 3],
+            'engine': 'local'
+        }
+
+    def _text_lines(self, ink):
+        """按水平投影切出文本行，返回[(top, bottom, left, right, 行首字形块宽度), ...]"""
+        row_ink = ink.sum(axis=1)
+        is_text = row_ink > max(2, ink.shape[1] // 500)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], is_text.view(np.int8), [0]))))
+        lines = []
+        for top, bottom in zip(edges[0::2], edges[1::2]):
+            if bottom - top < 3:
+                continue
+            columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+            if not len(columns):
+                continue
+            # 行首字形块：从最左侧墨迹开始，到第一个宽于0.4倍行高的空隙为止
+            breaks = np.flatnonzero(np.diff(columns) > 0.4 * (bottom - top))
+            lead_end = columns[breaks[0]] if len(breaks) else columns[-1]
+            lines.append((top, bottom, columns[0], columns[-1], lead_end - columns[0] + 1))
+        return lines
+
+    def _question_boxes(self, ink):
+        """把文本行按题号锚点归并为题目区域（工作尺寸下的坐标）"""
+        lines = self._text_lines(ink)
+        if not lines:
+            return [], []
+
+        heights = np.array([bottom - top for top, bottom, _, _, _ in lines])
+        line_height = float(np.median(heights))
+        gaps = np.array([lines[i][0] - lines[i - 1][1] for i in range(1, len(lines))])
+        margin = float(np.percentile([left for _, _, left, _, _ in lines], 10))
+
+        groups = []
+        for i, (top, bottom, left, right, lead_width) in enumerate(lines):
+            at_margin = left <= margin + line_height
+            numbered = lead_width <= 2.5 * (bottom - top)
+            spaced = i > 0 and gaps[i - 1] >= self.gap_ratio * line_height
+            if not groups or (at_margin and (spaced or numbered)):
+                groups.append({'lines': [], 'numbered': numbered})
+            groups[-1]['lines'].append((top, bottom, left, right))
+
+        pad = line_height / 2
+        max_y = ink.shape[0] - 1
+        max_x = ink.shape[1] - 1
+        boxes = []
+        scores = []
+        for index, group in enumerate(groups):
+            group_lines = group['lines']
+            y1 = max(0.0, group_lines[0][0] - pad)
+            if index + 1 < len(groups):
+                # 作答留白归属于上一题：区域延伸到下一题首行之前
+                y2 = max(group_lines[-1][1] + pad, groups[index + 1]['lines'][0][0] - pad)
+            else:
+                y2 = group_lines[-1][1] + pad
+            x1 = max(0.0, min(line[2] for line in group_lines) - pad)
+            x2 = min(max_x, max(line[3] for line in group_lines) + pad)
+            boxes.append([x1, y1, x2, min(max_y, y2)])
+            scores.append(0.6 if group['numbered'] else 0.4)
+        return boxes, scores
@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import Config
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class PayloadPreview:
+    """日志中大体积数据（API请求体、响应）的预览
+
+    只在日志记录真正被输出时才序列化并截断到指定长度，配合%s惰性格式化使用：
+    logger.debug("响应数据: %s", preview(result))。级别未开启时不产生任何序列化开销。
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, (bytes, bytearray)):
+            return f'<{len(value)} bytes>'
+        if isinstance(value, str):
+            text = value
+        else:
+            try:
+                text = json.dumps(value, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                text = repr(value)
+        if self.limit and len(text) > self.limit:
+            return f'{text[:self.limit]}...（共{len(text)}字符）'
+        return text
+
+
+def preview(value, limit=None):
+    """包装日志参数，输出时截断到limit个字符，默认Config.LOG_PAYLOAD_PREVIEW_CHARS（0为不截断）"""
+    return PayloadPreview(value, Config.LOG_PAYLOAD_PREVIEW_CHARS if limit is None else limit)
+
+
+class SamplingFilter(logging.Filter):
+    """按比例采样热路径logger的DEBUG/INFO日志，WARNING及以上全部保留
+
+    逐页、逐题的服务日志量与请求量成正比，采样后磁盘写入按比例下降；
+    请求级日志（app）和错误日志不受影响。
+    """
+
+    def __init__(self, rate, prefixes):
+        super().__init__()
+        self.rate = rate
+        self.prefixes = tuple(prefixes)
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if not record.name.startswith(self.prefixes):
+            return True
+        return random.random() < self.rate
+
+
+_listener = None
+_configured = False
+
+def configure_logging():
+    """按Config.LOG_*配置根logger
+
+    production模式下请求线程只把日志记录放入内存队列，由后台QueueListener线程写文件和控制台，
+    RotatingFileHandler的磁盘写入和轮转不再阻塞请求；热路径日志按LOG_SAMPLE_RATE采样。
+    debug模式下同步写出全部日志，便于本地排查。重复调用时不做任何事。
+
+    Returns:
+        QueueListener: production模式下的后台写日志线程，debug模式下为None
+    """
+    global _listener, _configured
+    if _configured:
+        return _listener
+    _configured = True
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        RotatingFileHandler(
+            Config.LOG_FILE,
+            maxBytes=Config.LOG_MAX_BYTES,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        ),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
+
+    if Config.LOG_MODE != 'production':
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATE, Config.LOG_SAMPLED_LOGGERS))
+    root.addHandler(queue_handler)
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
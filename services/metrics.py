@@ -0,0 +1,265 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 默认延迟分桶（秒），覆盖从毫秒级本地处理到分钟级远程调用
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+def _format_labels(labels):
+    """格式化Prometheus标签"""
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签组合保存样本"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}的标签应为{self.labelnames}，实际为{tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """在代码块执行期间将该值加一"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """分桶直方图，用于统计延迟分布和分位数"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块执行时间"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            bucket_labels = key + (('le', _format_value(bound)),)
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，输出Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """注册采集函数，在输出时调用，返回需要即时计算的指标列表"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """以Prometheus文本格式输出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.error(f"指标采集失败: {str(e)}")
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'pigai_stage_duration_seconds', '批改流水线各步骤耗时', ['stage'])
+DOWNSTREAM_DURATION = REGISTRY.histogram(
+    'pigai_downstream_request_duration_seconds', '外部服务单次请求耗时', ['service', 'outcome'])
+DOWNSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    'pigai_downstream_in_flight', '正在进行的外部服务请求数', ['service'])
+DOWNSTREAM_RETRIES = REGISTRY.counter(
+    'pigai_downstream_retries_total', '外部服务请求重试次数', ['service'])
+DOWNSTREAM_ERRORS = REGISTRY.counter(
+    'pigai_downstream_errors_total', '外部服务请求错误次数', ['service', 'reason'])
+PIPELINE_IN_FLIGHT = REGISTRY.gauge(
+    'pigai_pipeline_in_flight', '正在处理的作业页数')
+PAGES_PROCESSED = REGISTRY.counter(
+    'pigai_pages_total', '已处理的作业页数', ['outcome'])
+QUESTIONS_PER_PAGE = REGISTRY.histogram(
+    'pigai_questions_per_page', '每页检测到的题目数', buckets=(0, 1, 2, 4, 6, 8, 10, 15, 20, 30))
+LAYOUT_AGREEMENT = REGISTRY.histogram(
+    'pigai_layout_agreement', 'OCR版面划分的题目与远程分割结果的一致性（precision、recall、mean_iou）', ['metric'],
+    buckets=(0, 0.25, 0.5, 0.75, 0.9, 0.99, 1))
+
+def _observe_exception(service, start, exc):
+    reason = 'timeout' if 'Timeout' in type(exc).__name__ else 'exception'
+    DOWNSTREAM_DURATION.observe(time.time() - start, service=service, outcome='exception')
+    DOWNSTREAM_ERRORS.inc(service=service, reason=reason)
+
+def _observe_response(service, start, status_code):
+    if status_code < 400:
+        outcome = 'success'
+    else:
+        outcome = 'http_error'
+        DOWNSTREAM_ERRORS.inc(service=service, reason=f'http_{status_code // 100}xx')
+    DOWNSTREAM_DURATION.observe(time.time() - start, service=service, outcome=outcome)
+
+def timed_request(service, send, *args, **kwargs):
+    """执行一次外部服务HTTP请求，并记录耗时、结果和在途请求数
+
+    Args:
+        service: 下游服务名称（segmentation、ocr、knowledge、obs_upload、ai_grading）
+        send: 实际发送请求的函数，如get_http_client('ocr').post
+        *args, **kwargs: 传给send的参数
+
+    Returns:
+        requests.Response: 响应对象；请求异常原样抛出
+    """
+    start = time.time()
+    with DOWNSTREAM_IN_FLIGHT.track_inprogress(service=service):
+        try:
+            response = send(*args, **kwargs)
+        except Exception as e:
+            _observe_exception(service, start, e)
+            raise
+
+    _observe_response(service, start, response.status_code)
+    return response
+
+async def timed_request_async(service, send, *args, **kwargs):
+    """timed_request的协程版本，send为返回带status_code属性响应的协程函数"""
+    start = time.time()
+    with DOWNSTREAM_IN_FLIGHT.track_inprogress(service=service):
+        try:
+            response = await send(*args, **kwargs)
+        except Exception as e:
+            _observe_exception(service, start, e)
+            raise
+
+    _observe_response(service, start, response.status_code)
+    return response
+
+def gauge_family(name, documentation, labelname, values):
+    """把{标签值: {字段: 数值}}形式的统计转换为按字段区分的Gauge列表，供采集函数使用"""
+    gauges = {}
+    for label_value, stats in values.items():
+        for field, value in stats.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if field not in gauges:
+                gauges[field] = Gauge(f"{name}_{field}", f"{documentation}（{field}）", [labelname])
+            gauges[field].set(value, **{labelname: label_value})
+    return list(gauges.values())
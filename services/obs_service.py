@@ -1,8 +1,15 @@
+import asyncio
 import os
 import tempfile
 import requests
+import aiohttp
 import logging
 from urllib.parse import urlparse
+from .async_engine import get_async_engine
+from .http_client import get_http_client
+from .image_buffer import image_exists, read_image_bytes
+from .log_utils import preview
+from .resilience import DeadlineExceededError, DownstreamError, call_downstream
 
 logger = logging.getLogger(__name__)
 
@@ -48,18 +55,19 @@ class OBSService:
         """将文件上传到对象存储
         
         Args:
-            file_path: 本地文件路径
+            file_path: 本地文件路径或内存中的ImageBuffer
             
         Returns:
             dict: 包含上传结果的字典
         """
         return self.upload_file_to_obs(file_path)
     
-    def upload_file_to_obs(self, file_path):
+    def upload_file_to_obs(self, file_path, deadline=None):
         """将文件上传到对象存储
         
         Args:
-            file_path: 本地文件路径
+            file_path: 本地文件路径或内存中的ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时不超过剩余时间
             
         Returns:
             dict: 包含上传结果的字典
@@ -67,58 +75,37 @@ class OBSService:
         try:
             logger.info(f"开始上传文件到OBS: {file_path}")
             
-            if not os.path.exists(file_path):
+            if not image_exists(file_path):
                 return {
                     'success': False,
                     'error': f'文件不存在: {file_path}'
                 }
             
-            with open(file_path, 'rb') as file:
-                files = {'file': file}
-                headers = {
-                    'Accept': '*/*',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Connection': 'keep-alive',
-                    'User-Agent': 'PostmanRuntime-ApipostRuntime/1.1.0',
-                    'token': self.upload_token
-                }
-                
-                response = requests.post(
-                    self.upload_url,
-                    files=files,
-                    headers=headers,
-                    timeout=self.timeout
-                )
-                
-                logger.info(f"OBS上传响应状态码: {response.status_code}")
-                logger.info(f"OBS上传响应内容: {response.text}")
-                
-                if response.status_code == 200:
-                    try:
-                        result = response.json()
-                        logger.info(f"文件上传成功: {result}")
-                        # 根据实际API返回格式调整
-                        obs_url = result.get('data', {}).get('url') or result.get('url', '')
-                        return {
-                            'success': True,
-                            'url': obs_url,
-                            'message': result.get('message', 'Upload successful')
-                        }
-                    except ValueError as e:
-                        logger.error(f"解析上传响应JSON失败: {e}")
-                        # 如果返回的不是JSON，可能直接是URL
-                        return {
-                            'success': True,
-                            'url': response.text.strip(),
-                            'message': 'Upload successful'
-                        }
-                else:
-                    logger.error(f"文件上传失败，状态码: {response.status_code}, 响应: {response.text}")
-                    return {
-                        'success': False,
-                        'error': f'HTTP {response.status_code}: {response.text}'
-                    }
-                    
+            files = {'file': (os.path.basename(str(file_path)), read_image_bytes(file_path))}
+            headers = {
+                'Accept': '*/*',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Connection': 'keep-alive',
+                'User-Agent': 'PostmanRuntime-ApipostRuntime/1.1.0',
+                'token': self.upload_token
+            }
+            
+            # 上传只尝试一次，但仍受舱壁和熔断保护
+            response = call_downstream(
+                'obs_upload', get_http_client('obs_upload').post,
+                self.upload_url,
+                files=files,
+                headers=headers,
+                timeout=self.timeout,
+                max_attempts=1,
+                deadline=deadline
+            )
+            
+            logger.info(f"OBS上传响应状态码: {response.status_code}")
+            logger.debug("OBS上传响应内容: %s", preview(response.text))
+            
+            return self._parse_upload_response(response)
+            
         except Exception as e:
             logger.error(f"文件上传异常: {str(e)}")
             return {
@@ -126,11 +113,86 @@ class OBSService:
                 'error': f'Upload exception: {str(e)}'
             }
     
-    def process_image_path(self, image_path):
+    async def upload_file_to_obs_async(self, file_path, deadline=None):
+        """upload_file_to_obs的异步版本，在异步执行引擎的事件循环中调用
+        
+        Args:
+            file_path: 本地文件路径或内存中的ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时不超过剩余时间
+            
+        Returns:
+            dict: 包含上传结果的字典
+        """
+        engine = get_async_engine()
+        try:
+            file_data = await engine.read_image(file_path)
+            form = aiohttp.FormData()
+            form.add_field('file', file_data, filename=os.path.basename(str(file_path)))
+            
+            # 与同步版本一致，上传不是幂等操作，只尝试一次（FormData也不能重复发送）
+            response = await engine.request(
+                'obs_upload', 'POST', self.upload_url,
+                max_attempts=1,
+                timeout=self.timeout,
+                deadline=deadline,
+                headers={'token': self.upload_token},
+                data=form
+            )
+            logger.info(f"OBS上传响应状态码: {response.status_code}")
+            return self._parse_upload_response(response)
+        except FileNotFoundError:
+            return {
+                'success': False,
+                'error': f'文件不存在: {file_path}'
+            }
+        except DownstreamError as e:
+            logger.error(f"文件上传异常: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Upload exception: {str(e)}'
+            }
+    
+    def _parse_upload_response(self, response):
+        """解析OBS上传接口响应
+        
+        Args:
+            response: 上传接口响应（requests.Response或AsyncResponse）
+            
+        Returns:
+            dict: 包含上传结果的字典
+        """
+        if response.status_code == 200:
+            try:
+                result = response.json()
+                logger.debug("文件上传成功: %s", preview(result))
+                # 根据实际API返回格式调整
+                obs_url = result.get('data', {}).get('url') or result.get('url', '')
+                return {
+                    'success': True,
+                    'url': obs_url,
+                    'message': result.get('message', 'Upload successful')
+                }
+            except ValueError as e:
+                logger.error(f"解析上传响应JSON失败: {e}")
+                # 如果返回的不是JSON，可能直接是URL
+                return {
+                    'success': True,
+                    'url': response.text.strip(),
+                    'message': 'Upload successful'
+                }
+        else:
+            logger.error(f"文件上传失败，状态码: {response.status_code}, 响应: {response.text}")
+            return {
+                'success': False,
+                'error': f'HTTP {response.status_code}: {response.text}'
+            }
+    
+    def process_image_path(self, image_path, deadline=None):
         """处理图片路径，如果是URL则上传到OBS，本地文件保持不变
         
         Args:
-            image_path: 图片路径或URL
+            image_path: 图片路径、URL或ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时不超过剩余时间
             
         Returns:
             dict: 处理结果包含最终可用的URL或路径
@@ -149,7 +211,7 @@ class OBSService:
                 logger.info(f"检测到远程URL，需要重新上传到OBS: {image_path}")
                 
                 # 下载远程图片
-                download_result = self.download_remote_image(image_path)
+                download_result = self.download_remote_image(image_path, deadline)
                 if not download_result['success']:
                     return {
                         'success': False,
@@ -157,7 +219,7 @@ class OBSService:
                     }
                 
                 # 上传到OBS
-                upload_result = self.upload_file_to_obs(download_result['local_path'])
+                upload_result = self.upload_file_to_obs(download_result['local_path'], deadline)
                 
                 # 清理临时文件
                 try:
@@ -182,14 +244,14 @@ class OBSService:
             else:
                 # 本地文件，需要上传到OBS
                 logger.info(f"检测到本地文件，需要上传到OBS: {image_path}")
-                if not os.path.exists(image_path):
+                if not image_exists(image_path):
                     return {
                         'success': False,
                         'error': f'本地文件不存在: {image_path}'
                     }
                 
                 # 上传本地文件到OBS
-                upload_result = self.upload_file_to_obs(image_path)
+                upload_result = self.upload_file_to_obs(image_path, deadline)
                 if upload_result['success']:
                     return {
                         'success': True,
@@ -211,11 +273,43 @@ class OBSService:
                 'error': error_msg
             }
     
-    def download_remote_image(self, url):
+    async def process_image_path_async(self, image_path, deadline=None):
+        """process_image_path的异步版本：本地文件异步上传，远程URL在线程中走同步流程
+        
+        Args:
+            image_path: 图片路径、URL或ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时不超过剩余时间
+            
+        Returns:
+            dict: 处理结果包含最终可用的URL或路径
+        """
+        if not image_path:
+            return {
+                'success': False,
+                'error': '图片路径为空'
+            }
+        if self.is_remote_url(image_path):
+            return await asyncio.to_thread(self.process_image_path, image_path, deadline)
+        
+        upload_result = await self.upload_file_to_obs_async(image_path, deadline)
+        if not upload_result['success']:
+            return {
+                'success': False,
+                'error': f'上传本地文件到OBS失败: {upload_result.get("error", "未知错误")}'
+            }
+        return {
+            'success': True,
+            'url': upload_result['url'],
+            'is_local': False,
+            'original_path': image_path
+        }
+    
+    def download_remote_image(self, url, deadline=None):
         """下载远程图片到本地临时文件
         
         Args:
             url: 图片URL
+            deadline: 请求的整体截止时间（可选），请求超时不超过剩余时间
             
         Returns:
             dict: 包含本地文件路径的字典
@@ -229,7 +323,10 @@ class OBSService:
             temp_file.close()
             
             # 下载文件
-            response = requests.get(url, timeout=30)
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceededError('请求截止时间已到，未下载远程图片')
+            timeout = deadline.clamp_timeout(30) if deadline is not None else 30
+            response = get_http_client('download').get(url, timeout=timeout)
             if response.status_code == 200:
                 with open(temp_path, 'wb') as f:
                     f.write(response.content)
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class PageGeometry:
+    """整页OCR文本块和字符的几何信息表
+
+    OCR完成后建立一次：文本块外接矩形和字符中心点保存为NumPy数组，所有题目区域的文字
+    用一次批量向量化掩码计算完成，不再对每道题遍历全部文本块并逐字符判断。
+    判定规则与ImageProcessor._extract_region_text的pages格式处理一致：文本块外接矩形与区域相交，
+    且字符外接矩形的中心点在区域内（边界包含在内）。
+    """
+
+    def __init__(self, texts, block_boxes, char_block, char_text, char_centers):
+        self.texts = texts  # 文本块文字，按OCR返回顺序
+        self.block_boxes = block_boxes  # (B, 4) 文本块外接矩形 x1, y1, x2, y2
+        self.char_block = char_block  # (C,) 字符所属文本块序号，按文本块和字符顺序排列
+        self.char_text = char_text  # 长度C的字符列表
+        self.char_centers = char_centers  # (C, 2) 字符外接矩形中心点
+
+    @classmethod
+    def from_ocr_result(cls, ocr_result):
+        """从OCR结果（原始响应或extract_text的返回值）建立几何信息表
+
+        Returns:
+            PageGeometry: 结果中没有pages格式时返回None，由调用方回退到逐项提取
+        """
+        result = ocr_result.get('result') if isinstance(ocr_result, dict) else None
+        if not isinstance(result, dict) or 'pages' not in result:
+            return None
+
+        texts = []
+        corners = []  # 所有8值字符坐标，按文本块连续排列
+        block_starts = []
+        row_block = []
+        row_is_char = []  # 该坐标是否对应文本中的一个字符（下标小于文字长度）
+        char_text = []
+        for page in result['pages']:
+            for item in page.get('content', []):
+                char_pos = item.get('char_pos')
+                text = item.get('text')
+                if not char_pos or text is None:
+                    continue
+                block = len(texts)
+                start = len(corners)
+                for i, coords in enumerate(char_pos):
+                    if len(coords) < 8:
+                        continue
+                    corners.append(coords[:8])
+                    row_block.append(block)
+                    is_char = i < len(text)
+                    row_is_char.append(is_char)
+                    if is_char:
+                        char_text.append(text[i])
+                if len(corners) == start:
+                    continue
+                texts.append(text)
+                block_starts.append(start)
+
+        if not corners:
+            empty = np.zeros((0, 4))
+            return cls([], empty, np.zeros(0, dtype=np.intp), [], np.zeros((0, 2)))
+
+        corners = np.asarray(corners, dtype=np.float64)
+        xs = corners[:, 0::2]
+        ys = corners[:, 1::2]
+        starts = np.asarray(block_starts, dtype=np.intp)
+        block_boxes = np.stack([
+            np.minimum.reduceat(xs.min(axis=1), starts),
+            np.minimum.reduceat(ys.min(axis=1), starts),
+            np.maximum.reduceat(xs.max(axis=1), starts),
+            np.maximum.reduceat(ys.max(axis=1), starts)
+        ], axis=1)
+
+        # 字符外接矩形：左=min(左上x, 左下x)，上=min(左上y, 右上y)，右=max(右上x, 右下x)，下=max(右下y, 左下y)
+        is_char = np.asarray(row_is_char, dtype=bool)
+        chars = corners[is_char]
+        centers = np.stack([
+            (np.minimum(chars[:, 0], chars[:, 6]) + np.maximum(chars[:, 2], chars[:, 4])) / 2,
+            (np.minimum(chars[:, 1], chars[:, 3]) + np.maximum(chars[:, 5], chars[:, 7])) / 2
+        ], axis=1)
+        char_block = np.asarray(row_block, dtype=np.intp)[is_char]
+        return cls(texts, block_boxes, char_block, char_text, centers)
+
+    def region_texts(self, regions):
+        """批量提取多个区域的文字
+
+        Args:
+            regions: 区域列表，每项为(x1, y1, x2, y2)
+
+        Returns:
+            list: 与regions一一对应的区域文字，各文本块的区域内字符按原顺序拼接，文本块之间以空格分隔
+        """
+        if not regions:
+            return []
+        if not len(self.char_text):
+            return [''] * len(regions)
+
+        boxes = np.asarray(regions, dtype=np.float64)
+        rx1, ry1, rx2, ry2 = (boxes[:, k:k + 1] for k in range(4))
+
+        # (区域数, 文本块数)：文本块外接矩形与区域相交
+        bx1, by1, bx2, by2 = self.block_boxes.T
+        block_mask = ~((bx2 < rx1) | (bx1 > rx2) | (by2 < ry1) | (by1 > ry2))
+
+        # (区域数, 字符数)：字符中心点在区域内，且所属文本块与区域相交
+        cx, cy = self.char_centers.T
+        char_mask = (rx1 <= cx) & (cx <= rx2) & (ry1 <= cy) & (cy <= ry2)
+        char_mask &= block_mask[:, self.char_block]
+
+        texts = []
+        char_text = self.char_text
+        for row in char_mask:
+            selected = np.flatnonzero(row)
+            if not len(selected):
+                texts.append('')
+                continue
+            breaks = np.flatnonzero(np.diff(self.char_block[selected])) + 1
+            texts.append(' '.join(
+                ''.join(char_text[i] for i in segment)
+                for segment in np.split(selected, breaks)
+            ))
+        return texts
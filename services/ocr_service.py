@@ -1,30 +1,63 @@
+import asyncio
 import requests
 import json
 import os
 import requests
 import base64
 from config import Config
+from .async_engine import get_async_engine
+from .char_table import CharTable
+from .concurrency import BulkheadFullError
+from .disk_cache import compute_content_hash
+from .http_client import get_http_client
+from .image_buffer import ImageBuffer, image_exists, read_image_bytes
+from .image_normalizer import normalize_image, normalizer_params, rescale_ocr_response
+from .log_utils import preview
+from .ocr_geometry import PageGeometry
+from .rate_limiter import RateLimitError, RateLimitTimeoutError, get_rate_limiter
+from .resilience import (
+    CircuitOpenError, DownstreamError, RequestCancelledError, call_downstream, get_circuit_breaker
+)
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+# 解析后保留的Textin响应字段：流水线只用到版面（页面宽高）、文本行的文字和坐标、字符坐标，
+# 没有pages时退回detail格式的文字和坐标；全文（markdown）单独保存为text_content
+OCR_PAGE_FIELDS = ('width', 'height')
+OCR_CONTENT_FIELDS = ('text', 'pos', 'char_pos')
+OCR_DETAIL_FIELDS = ('text', 'position')
+
+# 请求未能发出（熔断、舱壁或限流排队超时）时退还已扣除的当日额度
+QUOTA_REFUND_ERRORS = (CircuitOpenError, BulkheadFullError, RateLimitTimeoutError)
+
+
+def _pick(item, fields):
+    return {field: item[field] for field in fields if field in item}
+
 class OCRService:
     """OCR文字识别服务"""
     
-    def __init__(self):
+    def __init__(self, cache=None):
+        """
+        Args:
+            cache: OCR结果缓存（DiskCache，可选），按图片内容和OCR请求参数缓存Textin原始响应
+        """
+        self.cache = cache
         self.api_url = Config.OCR_API_URL
         self.app_id = Config.OCR_APP_ID
         self.secret_code = Config.OCR_SECRET_CODE
         self.timeout = Config.REQUEST_TIMEOUT
         self.max_retries = Config.MAX_RETRIES
-        self.retry_delay = Config.RETRY_DELAY
     
-    def extract_text(self, image_path):
+    def extract_text(self, image_path, cancel_event=None, deadline=None):
         """从图片中提取文字
         
         Args:
-            image_path: 图片文件路径
+            image_path: 图片文件路径或ImageBuffer
+            cancel_event: 取消事件（可选），被设置后不再发起后续重试
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
             
         Returns:
             dict: 包含OCR结果的字典
@@ -33,10 +66,14 @@ class OCRService:
             logger.info(f"开始OCR文字提取，图片路径: {image_path}")
             
             # 检查文件是否存在
-            if not os.path.exists(image_path):
+            if not image_exists(image_path):
                 logger.error(f"图片文件不存在: {image_path}")
                 return {'success': False, 'error': '图片文件不存在'}
             
+            image_path, cache_key, cached = self._lookup_cache(image_path)
+            if cached is not None:
+                return cached
+            
             headers = {
                 'Accept': '*/*',
                 'Accept-Encoding': 'gzip, deflate, br',
@@ -47,85 +84,78 @@ class OCRService:
                 'x-ti-secret-code': self.secret_code
             }
             
-            logger.debug(f"OCR请求头: {headers}")
-            logger.debug(f"OCR API URL: {self.api_url}")
+            logger.debug("OCR API URL: %s", self.api_url)
             
-            # 读取图片文件
-            with open(image_path, 'rb') as file:
-                image_data = file.read()
+            # 读取图片数据（内存中的上传图片直接复用），按服务长边上限规范化
+            normalized = normalize_image(image_path, 'ocr')
+            image_data = normalized.data
             
             logger.info(f"图片文件大小: {len(image_data)} bytes")
             
-            # 进行重试请求
-            for attempt in range(self.max_retries):
+            # 发送请求，重试、退避和熔断由弹性层处理；当日额度每页只扣一次
+            start_time = time.time()
+            rate_limiter = get_rate_limiter('ocr')
+            try:
+                charged = self._charge_quota(rate_limiter)
                 try:
-                    logger.info(f"调用OCR API，尝试次数: {attempt + 1}/{self.max_retries}")
-                    start_time = time.time()
-                    
-                    response = requests.post(
+                    response = call_downstream(
+                        'ocr', get_http_client('ocr').post,
                         self.api_url,
                         headers=headers,
                         data=image_data,
-                        timeout=self.timeout
+                        timeout=self.timeout,
+                        max_attempts=self.max_retries,
+                        cancel_event=cancel_event,
+                        deadline=deadline,
+                        rate_limiter=rate_limiter
                     )
-                    
-                    end_time = time.time()
-                    logger.info(f"OCR API响应时间: {end_time - start_time:.2f}秒")
-                    
-                    logger.info(f"OCR API响应状态码: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        try:
-                            result = response.json()
-                            logger.info(f"OCR API原始响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                        except json.JSONDecodeError as e:
-                            logger.error(f"OCR响应JSON解析失败: {str(e)}")
-                            logger.error(f"响应内容: {response.text[:500]}...")
-                            return {'success': False, 'error': 'OCR响应格式错误'}
-                        
-                        if result.get('code') == 200:
-                            text_content = self._extract_full_text(result)
-                            logger.info(f"OCR识别成功，提取文本长度: {len(text_content)}")
-                            logger.info(f"OCR完整返回数据: {result}")
-                            logger.info(f"提取的文本内容: {text_content[:200]}...")
-                            
-                            return {
-                                'success': True,
-                                'result': result.get('result', {}),
-                                'text_content': text_content,
-                                'raw_result': result
-                            }
-                        else:
-                            error_msg = result.get('message', '未知错误')
-                            logger.error(f"OCR API返回错误码: {result.get('code')}, 错误信息: {error_msg}")
-                            return {
-                                'success': False,
-                                'error': f'OCR API错误: {error_msg}'
-                            }
-                    else:
-                        logger.error(f"OCR API调用失败，状态码: {response.status_code}")
-                        logger.error(f"响应内容: {response.text[:500]}...")
-                        
-                        if attempt < self.max_retries - 1:
-                            logger.info(f"等待{self.retry_delay}秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
-                        else:
-                            return {
-                                'success': False,
-                                'error': f'OCR API调用失败，状态码: {response.status_code}'
-                            }
-                            
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"OCR请求异常: {str(e)}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                        continue
-                    else:
-                        return {
-                            'success': False,
-                            'error': f'OCR网络请求失败: {str(e)}'
-                        }
+                except QUOTA_REFUND_ERRORS:
+                    if charged:
+                        rate_limiter.refund()
+                    raise
+            except RequestCancelledError:
+                logger.warning("OCR识别已被取消")
+                return {'success': False, 'error': 'OCR识别已取消'}
+            except RateLimitError as e:
+                logger.error(f"OCR请求被限流: {str(e)}")
+                return {'success': False, 'error': f'OCR限流: {str(e)}'}
+            except (requests.exceptions.RequestException, DownstreamError) as e:
+                logger.error(f"OCR请求异常: {str(e)}")
+                return {
+                    'success': False,
+                    'error': f'OCR网络请求失败: {str(e)}'
+                }
+            
+            logger.info(f"OCR API响应时间: {time.time() - start_time:.2f}秒")
+            logger.info(f"OCR API响应状态码: {response.status_code}")
+            
+            if response.status_code != 200:
+                logger.error("OCR API调用失败，状态码: %s，响应内容: %s", response.status_code, preview(response.text))
+                return {
+                    'success': False,
+                    'error': f'OCR API调用失败，状态码: {response.status_code}'
+                }
+            
+            try:
+                result = rescale_ocr_response(response.json(), normalized)
+                logger.debug("OCR API原始响应: %s", preview(result))
+            except json.JSONDecodeError as e:
+                logger.error("OCR响应JSON解析失败: %s，响应内容: %s", e, preview(response.text))
+                return {'success': False, 'error': 'OCR响应格式错误'}
+            
+            if result.get('code') != 200:
+                error_msg = result.get('message', '未知错误')
+                logger.error(f"OCR API返回错误码: {result.get('code')}, 错误信息: {error_msg}")
+                return {
+                    'success': False,
+                    'error': f'OCR API错误: {error_msg}'
+                }
+            
+            self._store_cache(cache_key, result)
+            ocr_result = self._build_ocr_result(result)
+            logger.info(f"OCR识别成功，提取文本长度: {len(ocr_result['text_content'])}")
+            logger.debug("提取的文本内容: %s", preview(ocr_result['text_content'], 200))
+            return ocr_result
                         
         except Exception as e:
             logger.error(f"OCR处理失败: {str(e)}")
@@ -134,6 +164,153 @@ class OCRService:
                 'error': str(e)
             }
     
+    async def extract_text_async(self, image_path, deadline=None):
+        """extract_text的异步版本，在异步执行引擎的事件循环中调用
+        
+        Args:
+            image_path: 图片文件路径或ImageBuffer
+            deadline: 请求的整体截止时间（可选），请求超时和重试次数不超过剩余时间
+            
+        Returns:
+            dict: 包含OCR结果的字典，格式与extract_text相同
+        """
+        engine = get_async_engine()
+        try:
+            image_path, cache_key, cached = await asyncio.to_thread(self._lookup_cache, image_path)
+            if cached is not None:
+                return cached
+            
+            normalized = await asyncio.to_thread(normalize_image, image_path, 'ocr')
+            image_data = normalized.data
+            logger.info(f"异步调用OCR API，图片大小: {len(image_data)} bytes")
+            
+            rate_limiter = get_rate_limiter('ocr')
+            charged = await asyncio.to_thread(self._charge_quota, rate_limiter)
+            try:
+                response = await engine.request(
+                    'ocr', 'POST', self.api_url,
+                    max_attempts=self.max_retries,
+                    deadline=deadline,
+                    rate_limiter=rate_limiter,
+                    timeout=self.timeout,
+                    headers={
+                        'Content-Type': 'application/octet-stream',
+                        'x-ti-app-id': self.app_id,
+                        'x-ti-secret-code': self.secret_code
+                    },
+                    data=image_data
+                )
+            except QUOTA_REFUND_ERRORS:
+                if charged:
+                    await asyncio.to_thread(rate_limiter.refund)
+                raise
+            
+            if response.status_code != 200:
+                return {
+                    'success': False,
+                    'error': f'OCR API调用失败，状态码: {response.status_code}'
+                }
+            
+            try:
+                result = rescale_ocr_response(response.json(), normalized)
+            except json.JSONDecodeError as e:
+                logger.error(f"OCR响应JSON解析失败: {str(e)}")
+                return {'success': False, 'error': 'OCR响应格式错误'}
+            
+            if result.get('code') != 200:
+                error_msg = result.get('message', '未知错误')
+                logger.error(f"OCR API返回错误码: {result.get('code')}, 错误信息: {error_msg}")
+                return {
+                    'success': False,
+                    'error': f'OCR API错误: {error_msg}'
+                }
+            
+            await asyncio.to_thread(self._store_cache, cache_key, result)
+            ocr_result = self._build_ocr_result(result)
+            logger.info(f"OCR识别成功，提取文本长度: {len(ocr_result['text_content'])}")
+            return ocr_result
+        except FileNotFoundError:
+            logger.error(f"图片文件不存在: {image_path}")
+            return {'success': False, 'error': '图片文件不存在'}
+        except RateLimitError as e:
+            logger.error(f"OCR请求被限流: {str(e)}")
+            return {'success': False, 'error': f'OCR限流: {str(e)}'}
+        except DownstreamError as e:
+            return {'success': False, 'error': f'OCR网络请求失败: {str(e)}'}
+        except Exception as e:
+            logger.error(f"OCR处理失败: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _charge_quota(self, rate_limiter):
+        """识别前为本页扣除一次当日额度，重试不再扣除；熔断中（请求不会发出）时不扣除
+
+        Returns:
+            bool: 是否已扣除
+
+        Raises:
+            QuotaExceededError: 当日额度不足
+        """
+        if rate_limiter is None or get_circuit_breaker('ocr').is_open():
+            return False
+        rate_limiter.charge()
+        return True
+    
+    def _cache_key(self, image_data):
+        """OCR缓存键：图片内容SHA-256与影响识别结果的请求参数（接口地址及char_details等URL参数、规范化参数）"""
+        params = f"{self.api_url}|{normalizer_params('ocr')}"
+        return compute_content_hash(f"{compute_content_hash(image_data)}|{params}".encode('utf-8'))
+    
+    def _lookup_cache(self, image_path):
+        """查询OCR结果缓存
+        
+        图片路径先读入内存（ImageBuffer），未命中时规范化和上传复用同一份字节数据。
+        
+        Returns:
+            tuple: (图片, 缓存键, 命中时的识别结果)；未启用缓存时原样返回图片，缓存键和结果为None
+        """
+        if self.cache is None:
+            return image_path, None, None
+        if not isinstance(image_path, ImageBuffer):
+            image_path = ImageBuffer(read_image_bytes(image_path), image_path)
+        cache_key = self._cache_key(image_path.data)
+        result = self.cache.get(cache_key)
+        if result is None:
+            return image_path, cache_key, None
+        ocr_result = self._build_ocr_result(result)
+        logger.info(f"OCR缓存命中，缓存键: {cache_key[:16]}，提取文本长度: {len(ocr_result['text_content'])}")
+        return image_path, cache_key, ocr_result
+    
+    def _store_cache(self, cache_key, result):
+        """缓存识别成功的Textin原始响应（坐标已换算回原图空间）"""
+        if self.cache is not None and cache_key is not None:
+            self.cache.set(cache_key, result)
+    
+    def _build_ocr_result(self, result):
+        """把OCR API的原始响应整理为识别结果（也用于从原始响应归档离线重放）
+
+        result只保留OCR_PAGE_FIELDS等字段，与原始响应共享字符串和坐标列表，不复制数据；
+        字符候选、置信度等其余字段在raw_result被释放（流水线写入归档后即释放）时一并回收。
+        同时建立整页的几何信息表（geometry），题目切分时按区域批量提取文字。
+        """
+        return {
+            'success': True,
+            'result': self._parse_ocr_tree(result.get('result') or {}),
+            'text_content': self._extract_full_text(result),
+            'geometry': PageGeometry.from_ocr_result(result),
+            'raw_result': result
+        }
+    
+    def _parse_ocr_tree(self, tree):
+        """从Textin响应的result中取出流水线用到的字段"""
+        if 'pages' in tree:
+            return {'pages': [
+                dict(_pick(page, OCR_PAGE_FIELDS), content=[_pick(item, OCR_CONTENT_FIELDS) for item in page.get('content', [])])
+                for page in tree['pages']
+            ]}
+        if 'detail' in tree:
+            return {'detail': [_pick(item, OCR_DETAIL_FIELDS) for item in tree['detail']]}
+        return {}
+    
     def _extract_full_text(self, ocr_result):
         """从OCR结果中提取完整文本
         
@@ -170,7 +347,7 @@ class OCRService:
         """获取带坐标信息的文本
         
         Args:
-            ocr_result: OCR识别结果（包含raw_result字段的完整结果）
+            ocr_result: OCR识别结果（extract_text的返回值或Textin原始响应）
             
         Returns:
             list: 包含文本和坐标信息的列表
@@ -178,15 +355,12 @@ class OCRService:
         text_items = []
         
         try:
-            # 获取原始OCR结果
-            raw_result = ocr_result.get('raw_result', ocr_result)
-            
-            if 'result' in raw_result and 'pages' in raw_result['result']:
-                logger.info(f"开始处理OCR结果中的坐标文本，页面数: {len(raw_result['result']['pages'])}")
+            if 'result' in ocr_result and 'pages' in ocr_result['result']:
+                logger.debug("开始处理OCR结果中的坐标文本，页面数: %d", len(ocr_result['result']['pages']))
                 
-                for page_idx, page in enumerate(raw_result['result']['pages']):
+                for page_idx, page in enumerate(ocr_result['result']['pages']):
                     if 'content' in page:
-                        logger.info(f"处理第{page_idx+1}页，文本项数量: {len(page['content'])}")
+                        logger.debug("处理第%d页，文本项数量: %d", page_idx + 1, len(page['content']))
                         
                         for item in page['content']:
                             if 'text' in item and 'pos' in item:
@@ -203,29 +377,18 @@ class OCRService:
                                     # 验证字符数和坐标数是否匹配
                                     if len(text_content) == len(char_positions):
                                         text_item['char_coordinates'] = char_positions
-                                        logger.info(f"文本 '{text_content}' 字符级坐标匹配成功: {len(text_content)} 个字符对应 {len(char_positions)} 个坐标")
+                                        logger.debug("文本 '%s' 字符级坐标匹配成功: %d 个字符", text_content, len(char_positions))
                                     else:
-                                        logger.warning(f"文本 '{text_content}' 字符数({len(text_content)})与坐标数({len(char_positions)})不匹配")
-                                        # 仍然保存坐标信息，但会在后续处理中进行调整
+                                        # 仍然保存坐标信息，在字符映射时处理不匹配问题
+                                        logger.warning("文本 '%s' 字符数(%d)与坐标数(%d)不匹配，将在字符映射时处理",
+                                                       text_content, len(text_content), len(char_positions))
                                         text_item['char_coordinates'] = char_positions
-                                        logger.warning(f"已保存坐标信息，将在字符映射时处理不匹配问题")
-                                    
-                                    # 记录详细的字符坐标信息
-                                    logger.debug(f"文本内容: '{text_content}'")
-                                    logger.debug(f"字符级坐标数组长度: {len(char_positions)}")
-                                    
-                                    # 显示前几个字符的坐标示例
-                                    if len(char_positions) > 0:
-                                        for i in range(min(3, len(text_content), len(char_positions))):
-                                            char = text_content[i] if i < len(text_content) else 'N/A'
-                                            coords = char_positions[i] if i < len(char_positions) else 'N/A'
-                                            logger.debug(f"  字符[{i}]: '{char}' -> 坐标: {coords}")
                                 else:
-                                    logger.debug(f"文本 '{item['text'][:20]}...' 不包含字符级坐标信息(char_pos)")
+                                    logger.debug("文本 '%s...' 不包含字符级坐标信息(char_pos)", item['text'][:20])
                                 
                                 text_items.append(text_item)
             
-            logger.info(f"提取到{len(text_items)}个文本块（包含字符级坐标信息）")
+            logger.info("提取到%d个文本块（包含字符级坐标信息）", len(text_items))
             return text_items
             
         except Exception as e:
@@ -256,7 +419,7 @@ class OCRService:
                 actual_length = min(len(text), len(char_coordinates))
             else:
                 actual_length = len(text)
-                logger.debug(f"文本与坐标完全匹配，长度: {actual_length}")
+                logger.debug("文本与坐标完全匹配，长度: %d", actual_length)
             
             # 创建字符级映射
             for i in range(actual_length):
@@ -267,9 +430,8 @@ class OCRService:
                     'char_code': ord(text[i])  # 字符的Unicode编码
                 }
                 mappings.append(mapping)
-                logger.debug(f"映射 {i}: '{text[i]}' -> {char_coordinates[i]}")
             
-            logger.info(f"成功创建 {len(mappings)} 个字符级坐标映射")
+            logger.debug("成功创建 %d 个字符级坐标映射", len(mappings))
             return mappings
             
         except Exception as e:
@@ -292,7 +454,7 @@ class OCRService:
             if self._is_text_in_region(item['coordinates'], x1, y1, x2, y2):
                 filtered_items.append(item)
         
-        logger.debug(f"区域过滤：输入{len(text_items)}个文本项，过滤后得到{len(filtered_items)}个")
+        logger.debug("区域过滤：输入%d个文本项，过滤后得到%d个", len(text_items), len(filtered_items))
         return filtered_items
     
     def get_character_coordinates(self, text_items):
@@ -302,68 +464,23 @@ class OCRService:
             text_items: 包含字符级坐标的文本项列表
             
         Returns:
-            list: 字符级坐标详情列表，每个字符对应一个坐标数组
+            CharTable: 整页字符表（列式存储，每个字符对应一行8值坐标），需要时用to_dicts()转换为字典列表
         """
-        char_details = []
-        
         try:
-            for text_item in text_items:
-                if 'char_coordinates' in text_item and text_item['char_coordinates']:
-                    text = text_item['text']
-                    char_coords = text_item['char_coordinates']
-                    
-                    logger.info(f"处理文本块: '{text}'")
-                    logger.info(f"文本长度: {len(text)} 个字符")
-                    logger.info(f"坐标数组长度: {len(char_coords)} 个坐标")
-                    
-                    # 验证字符数和坐标数是否完全匹配
-                    if len(text) != len(char_coords):
-                        logger.warning(f"字符数({len(text)})与坐标数({len(char_coords)})不匹配，文本: '{text}'")
-                        # 使用较小的长度以避免索引错误
-                        actual_length = min(len(text), len(char_coords))
-                        logger.warning(f"将处理前 {actual_length} 个匹配的字符")
-                    else:
-                        actual_length = len(text)
-                        logger.debug(f"字符数和坐标数完全匹配: {actual_length}")
-                    
-                    # 逐字符映射坐标
-                    for i in range(actual_length):
-                        char = text[i]
-                        char_coordinate = char_coords[i]
-                        
-                        char_detail = {
-                            'character': char,
-                            'coordinates': char_coordinate,  # 单个字符对应的坐标数组
-                            'index': i  # 在文本中的索引位置
-                        }
-                        char_details.append(char_detail)
-                        
-                        # 详细日志记录每个字符的映射
-                        logger.debug(f"字符 '{char}' (索引{i}) 坐标: {char_coordinate}")
-                    
-                    logger.info(f"文本块 '{text}' 成功提取 {actual_length} 个字符级坐标")
-                else:
-                    logger.debug(f"文本项缺少字符级坐标信息: '{text_item.get('text', 'N/A')[:20]}...'")
-            
-            logger.info(f"总共提取到 {len(char_details)} 个字符级坐标详情")
-            
-            # 输出字符级坐标统计信息
-            if char_details:
-                sample_char = char_details[0]
-                logger.info(f"字符级坐标示例 - 字符: '{sample_char['character']}', 坐标: {sample_char['coordinates']}")
-            
-            return char_details
+            char_table = CharTable.from_text_items(text_items)
+            logger.info("总共提取到 %d 个字符级坐标详情", len(char_table))
+            return char_table
             
         except Exception as e:
             logger.error(f"字符级坐标提取失败: {str(e)}")
             logger.error(f"输入参数类型: {type(text_items)}, 长度: {len(text_items) if hasattr(text_items, '__len__') else 'N/A'}")
-            return []
+            return CharTable.empty()
     
     def filter_characters_by_region(self, char_details, x1, y1, x2, y2):
         """根据区域过滤字符级数据
         
         Args:
-            char_details: 字符级坐标详情列表
+            char_details: 字符级坐标详情列表或CharTable
             x1, y1, x2, y2: 区域坐标
             
         Returns:
@@ -0,0 +1,913 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+from config import Config
+from .concurrency import get_executor
+from .deadline import remaining_time
+from .disk_cache import compute_content_hash
+from .image_buffer import ImageBuffer, read_image_bytes
+from .layout_segmenter import compare_segmentations
+from .metrics import LAYOUT_AGREEMENT, PAGES_PROCESSED, PIPELINE_IN_FLIGHT, QUESTIONS_PER_PAGE, STAGE_DURATION
+from .response_archive import read_archive
+
+logger = logging.getLogger(__name__)
+
+def _notify(progress_callback, event, **data):
+    """向进度回调发送事件，回调异常不影响批改流程"""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(event, data)
+    except Exception as e:
+        logger.error(f"进度回调处理事件{event}失败: {str(e)}")
+
+class HomeworkPipeline:
+    """作业批改流水线：题目分割∥OCR识别 → 题目处理 → 原题检索与AI批改"""
+
+    # 识别阶段名称，用于日志和错误信息
+    RECOGNITION_STAGES = {
+        'segmentation': '题目分割',
+        'ocr': 'OCR识别'
+    }
+
+    def __init__(self, image_processor, ocr_service, knowledge_service, ai_grading_service, result_cache=None, engine=None,
+                 response_archive=None):
+        self.image_processor = image_processor
+        self.ocr_service = ocr_service
+        self.knowledge_service = knowledge_service
+        self.ai_grading_service = ai_grading_service
+        self.result_cache = result_cache  # 按图片内容哈希缓存完整批改结果（可选）
+        self.engine = engine  # 异步执行引擎（可选），设置后远程调用以协程方式在事件循环中并发执行
+        self.response_archive = response_archive  # 下游原始响应归档（可选），每个任务一个归档文件，可离线重放
+
+    def recognize(self, filepath, progress_callback=None, deadline=None, segmenter=None, archive=None):
+        """并发执行题目分割和整页OCR识别
+
+        两个远程调用互不依赖，同时发起并在题目处理前汇合。任一阶段失败时，
+        通过取消事件通知另一阶段停止后续重试，并立即返回错误。
+        识别成功后原始响应随即写入归档，OCR原始响应不再保留在识别结果中。
+
+        Args:
+            filepath: 上传图片路径
+            progress_callback: 进度回调（可选），签名为callback(event, data)
+            deadline: 请求的整体截止时间（可选），到期仍未完成识别时返回timed_out失败结果
+            segmenter: 题目分割引擎（remote、local、auto或layout，可选），默认Config.SEGMENTATION_ENGINE
+            archive: 本页的原始响应归档（可选），写入题目分割和OCR的原始响应
+
+        Returns:
+            dict: 包含segmentation_result、ocr_result和各阶段耗时的字典
+        """
+        if (segmenter or Config.SEGMENTATION_ENGINE) == 'layout':
+            result = self._recognize_from_layout(filepath, progress_callback, deadline)
+        elif self.engine is not None:
+            result = self.engine.run(self._recognize_async(filepath, progress_callback, deadline, segmenter))
+        else:
+            result = self._recognize_threaded(filepath, progress_callback, deadline, segmenter)
+        if result['success']:
+            self._archive_recognition(filepath, result, archive)
+        elif deadline is not None and deadline.expired():
+            result['timed_out'] = True
+        return result
+
+    def _archive_recognition(self, filepath, recognition, archive=None):
+        """把题目分割和OCR的原始响应写入归档，并从识别结果中释放OCR原始响应
+
+        解析后的OCR结果已包含后续步骤用到的全部字段，原始响应只用于归档。批量批改时识别结果
+        会排队等待题目处理，尽早释放可降低每个在途页面的内存占用。
+        """
+        timings = recognition['timings']
+        ocr_raw = recognition['ocr_result'].pop('raw_result', None)
+        if archive is None:
+            return
+        source = None if isinstance(filepath, ImageBuffer) else filepath
+        segmentation_result = recognition['segmentation_result']
+        archive.record(
+            'segmentation', segmentation_result.get('raw_result'),
+            source=source, elapsed=timings['segmentation'], engine=segmentation_result.get('engine')
+        )
+        archive.record('ocr', ocr_raw, source=source, elapsed=timings['ocr'])
+
+    def _recognize_threaded(self, filepath, progress_callback=None, deadline=None, segmenter=None):
+        """recognize的线程池实现"""
+        timings = {}
+        results = {}
+        cancel_event = threading.Event()
+        recognition_start = time.time()
+
+        def run_stage(stage, func):
+            stage_start = time.time()
+            _notify(progress_callback, 'stage_started', stage=stage)
+            try:
+                return func(filepath, cancel_event=cancel_event, deadline=deadline)
+            finally:
+                timings[stage] = time.time() - stage_start
+
+        executor = get_executor('recognition')
+        future_to_stage = {
+            executor.submit(run_stage, 'segmentation', partial(self.image_processor.segment, engine=segmenter)): 'segmentation',
+            executor.submit(run_stage, 'ocr', self.ocr_service.extract_text): 'ocr'
+        }
+
+        pending = set(future_to_stage)
+        while pending:
+            done, pending = wait(pending, timeout=remaining_time(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                cancel_event.set()
+                return self._recognition_timed_out([future_to_stage[future] for future in pending], timings, progress_callback)
+            for future in done:
+                stage = future_to_stage[future]
+                try:
+                    stage_result = future.result()
+                except Exception as exc:
+                    stage_result = {'success': False, 'error': str(exc)}
+
+                failure = self._on_recognition_stage_done(stage, stage_result, timings, progress_callback)
+                if failure is not None:
+                    cancel_event.set()
+                    for other in pending:
+                        other.cancel()
+                    return failure
+                results[stage] = stage_result
+
+        timings['recognition'] = time.time() - recognition_start
+        return {
+            'success': True,
+            'segmentation_result': results['segmentation'],
+            'ocr_result': results['ocr'],
+            'timings': timings
+        }
+
+    async def _recognize_async(self, filepath, progress_callback=None, deadline=None, segmenter=None):
+        """recognize的异步实现：两个识别阶段作为协程并发执行，任一失败时取消另一个"""
+        timings = {}
+        results = {}
+        recognition_start = time.time()
+
+        async def run_stage(stage, coro):
+            stage_start = time.time()
+            _notify(progress_callback, 'stage_started', stage=stage)
+            try:
+                return await coro
+            finally:
+                timings[stage] = time.time() - stage_start
+
+        task_to_stage = {
+            asyncio.ensure_future(run_stage('segmentation', self.image_processor.segment_async(filepath, segmenter, deadline))): 'segmentation',
+            asyncio.ensure_future(run_stage('ocr', self.ocr_service.extract_text_async(filepath, deadline))): 'ocr'
+        }
+
+        pending = set(task_to_stage)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=remaining_time(deadline), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                for task in pending:
+                    task.cancel()
+                return self._recognition_timed_out([task_to_stage[task] for task in pending], timings, progress_callback)
+            for task in done:
+                stage = task_to_stage[task]
+                try:
+                    stage_result = task.result()
+                except Exception as exc:
+                    stage_result = {'success': False, 'error': str(exc)}
+
+                failure = self._on_recognition_stage_done(stage, stage_result, timings, progress_callback)
+                if failure is not None:
+                    # 取消协程会直接中断进行中的请求，不必等待其超时
+                    for other in pending:
+                        other.cancel()
+                    return failure
+                results[stage] = stage_result
+
+        timings['recognition'] = time.time() - recognition_start
+        return {
+            'success': True,
+            'segmentation_result': results['segmentation'],
+            'ocr_result': results['ocr'],
+            'timings': timings
+        }
+
+    def _recognize_from_layout(self, filepath, progress_callback=None, deadline=None):
+        """recognize的layout实现：只调用OCR，再由OCR版面信息划分题目，整页只有一次远程识别调用
+
+        版面中没有划分出任何题目时，回退到SEGMENTATION_ENGINE配置的题目分割（配置为layout时使用远程分割）。
+        """
+        timings = {}
+        recognition_start = time.time()
+
+        _notify(progress_callback, 'stage_started', stage='ocr')
+        if self.engine is not None:
+            ocr_result = self.engine.run(self.ocr_service.extract_text_async(filepath, deadline))
+        else:
+            ocr_result = self.ocr_service.extract_text(filepath, deadline=deadline)
+        timings['ocr'] = time.time() - recognition_start
+        failure = self._on_recognition_stage_done('ocr', ocr_result, timings, progress_callback)
+        if failure is not None:
+            return failure
+
+        stage_start = time.time()
+        _notify(progress_callback, 'stage_started', stage='segmentation')
+        segmentation_result = self.image_processor.segment_questions_layout(ocr_result)
+        if not segmentation_result.get('coordinates'):
+            logger.warning(f"OCR版面中没有划分出题目（{segmentation_result.get('error', '没有题号和留白')}），回退到题目分割服务")
+            fallback_engine = 'remote' if Config.SEGMENTATION_ENGINE == 'layout' else Config.SEGMENTATION_ENGINE
+            segmentation_result = self.image_processor.segment(filepath, engine=fallback_engine, deadline=deadline)
+        timings['segmentation'] = time.time() - stage_start
+        failure = self._on_recognition_stage_done('segmentation', segmentation_result, timings, progress_callback)
+        if failure is not None:
+            return failure
+
+        timings['recognition'] = time.time() - recognition_start
+        return {
+            'success': True,
+            'segmentation_result': segmentation_result,
+            'ocr_result': ocr_result,
+            'timings': timings
+        }
+
+    def _on_recognition_stage_done(self, stage, stage_result, timings, progress_callback=None):
+        """处理单个识别阶段的结果并发送进度事件
+
+        Returns:
+            dict: 阶段失败时返回整体失败结果，成功时返回None
+        """
+        stage_name = self.RECOGNITION_STAGES[stage]
+        if not stage_result.get('success'):
+            logger.error(f"{stage_name}失败: {stage_result.get('error')}，取消其余识别阶段")
+            _notify(progress_callback, 'stage_failed', stage=stage, error=stage_result.get('error'))
+            return {
+                'success': False,
+                'stage': stage,
+                'error': f"{stage_name}失败: {stage_result.get('error')}",
+                'timings': dict(timings)
+            }
+
+        logger.info(f"{stage_name}完成，用时: {timings.get(stage, 0):.2f}秒")
+        _notify(progress_callback, 'stage_completed', stage=stage, elapsed=timings.get(stage, 0))
+        if stage == 'segmentation':
+            # 分割框先于OCR结果推送给客户端，便于提前展示题目区域
+            _notify(progress_callback, 'segmentation_ready', coordinates=stage_result.get('coordinates', []))
+        return None
+
+    def _recognition_timed_out(self, stages, timings, progress_callback=None):
+        """识别阶段在截止时间前未完成时的失败结果"""
+        for stage in stages:
+            _notify(progress_callback, 'stage_failed', stage=stage, error='请求截止时间已到')
+        stage_names = '、'.join(self.RECOGNITION_STAGES[stage] for stage in stages)
+        logger.error(f"请求截止时间已到，{stage_names}未完成")
+        return {
+            'success': False,
+            'stage': stages[0],
+            'error': f"{stage_names}超时: 请求截止时间已到",
+            'timed_out': True,
+            'timings': dict(timings)
+        }
+
+    def prepare_questions(self, filepath, segmentation_result, ocr_result):
+        """根据识别结果切分题目并提取文本和字符级坐标
+
+        Args:
+            filepath: 上传图片路径
+            segmentation_result: 题目分割结果
+            ocr_result: OCR识别结果
+
+        Returns:
+            list: 题目信息列表
+        """
+        # 获取字符级坐标信息用于批改
+        text_items = self.ocr_service.get_text_with_coordinates(ocr_result)
+        char_details = self.ocr_service.get_character_coordinates(text_items)
+        logger.info(f"提取字符级坐标信息: {len(text_items)}个文本块，{len(char_details)}个字符")
+
+        return self.image_processor.split_questions(
+            filepath, segmentation_result['coordinates'], ocr_result, char_details
+        )
+
+    def process_question(self, i, question, deadline=None, archive=None):
+        """处理单个题目：知识库检索 + AI批改
+
+        Args:
+            i: 题目序号（从0开始）
+            question: 题目信息
+            deadline: 请求的整体截止时间（可选）
+            archive: 原始响应归档（可选），写入检索和批改的原始响应
+
+        Returns:
+            tuple: (序号, 题目结果, 是否批改成功)
+        """
+        question_start = time.time()
+        logger.info(f"--- 并发处理第{i+1}题，文本: {question['text'][:50]}... ---")
+
+        # 知识库检索（传递图片路径）
+        search_start = time.time()
+        search_result = self.knowledge_service.search_similar_question(
+            question['text'],
+            question['image_path'],
+            deadline=deadline
+        )
+        search_time = time.time() - search_start
+
+        logger.info(f"第{i+1}题知识库检索完成，用时: {search_time:.2f}秒，相似度: {search_result.get('similarity_score', 0)}")
+
+        # AI批改
+        grading_start = time.time()
+        grading_result = self.ai_grading_service.grade_question(
+            question['image_path'],
+            question['text'],
+            search_result,  # 传递整个知识库检索结果
+            question.get('char_details', []),  # 传递字符级坐标信息
+            deadline=deadline
+        )
+        grading_time = time.time() - grading_start
+
+        success = grading_result.get('success', False)
+        if success:
+            logger.info(f"第{i+1}题AI批改完成，用时: {grading_time:.2f}秒，得分: {grading_result.get('score', '未知')}")
+        else:
+            logger.error(f"第{i+1}题AI批改失败: {grading_result.get('error', '未知错误')}")
+
+        question_time = time.time() - question_start
+        logger.info(f"第{i+1}题总处理时间: {question_time:.2f}秒")
+        self._archive_question(archive, i, question, search_result, grading_result)
+
+        return i, self._question_result(i, question, search_result, grading_result, deadline), success
+
+    async def process_question_async(self, i, question, deadline=None, archive=None):
+        """process_question的异步版本：知识库检索 + AI批改均以协程执行
+
+        Returns:
+            tuple: (序号, 题目结果, 是否批改成功)
+        """
+        question_start = time.time()
+        search_result = await self.knowledge_service.search_similar_question_async(question['text'], deadline)
+        grading_result = await self.ai_grading_service.grade_question_async(
+            question['image_path'],
+            question['text'],
+            search_result,
+            question.get('char_details', []),
+            deadline
+        )
+
+        success = grading_result.get('success', False)
+        if not success:
+            logger.error(f"第{i+1}题AI批改失败: {grading_result.get('error', '未知错误')}")
+        logger.info(f"第{i+1}题总处理时间: {time.time() - question_start:.2f}秒")
+        self._archive_question(archive, i, question, search_result, grading_result)
+
+        return i, self._question_result(i, question, search_result, grading_result, deadline), success
+
+    def _archive_question(self, archive, i, question, search_result, grading_result):
+        """把单题的检索和批改原始响应写入归档"""
+        if archive is None:
+            return
+        archive.record('retrieval', search_result.get('raw_result'), question_id=i + 1, query=question['text'])
+        archive.record('grading', grading_result.get('raw_result'), question_id=i + 1)
+
+    def _question_result(self, i, question, search_result, grading_result, deadline=None):
+        """构建单题批改结果，截止时间已到且批改未成功时标记timed_out"""
+        timed_out = not grading_result.get('success', False) and deadline is not None and deadline.expired()
+        return {
+            'question_id': i + 1,
+            'coordinates': question['coordinates'],
+            'text': question['text'],
+            'reference_answer': search_result.get('reference_answer', ''),
+            'similarity_score': search_result.get('similarity_score', 0),
+            'grading_result': grading_result,
+            'image_path': str(question['image_path']),
+            'timed_out': timed_out
+        }
+
+    def grade_questions(self, questions, progress_callback=None, deadline=None, archive=None):
+        """并发执行所有题目的原题检索和AI批改
+
+        Args:
+            questions: 题目信息列表
+            progress_callback: 进度回调（可选），每道题完成时发送question_completed事件
+            deadline: 请求的整体截止时间（可选），到期时未完成的题目以timed_out结果返回
+            archive: 原始响应归档（可选）
+
+        Returns:
+            tuple: (按题目顺序排列的结果列表, 成功批改数)
+        """
+        results = [None] * len(questions)  # 预分配结果数组
+        successful_grading = 0
+
+        # 检查是否有题目需要处理
+        if not questions:
+            logger.warning("没有检测到任何题目，跳过批改步骤")
+            return results, successful_grading
+
+        if self.engine is not None:
+            return self.engine.run(self._grade_questions_async(questions, progress_callback, deadline, archive))
+
+        # 使用进程级共享线程池并发处理所有题目，下游并发由各服务的舱壁限制
+        executor = get_executor('questions')
+        logger.info(f"提交{len(questions)}道题目到共享线程池，当前状态: {executor.stats()}")
+
+        # 提交所有任务
+        future_to_question = {executor.submit(self.process_question, i, question, deadline, archive): i
+                              for i, question in enumerate(questions)}
+
+        # 收集结果，截止时间到期后不再等待未完成的题目
+        try:
+            for future in as_completed(future_to_question, timeout=remaining_time(deadline)):
+                try:
+                    i, result, success = future.result()
+                    results[i] = result  # 按原序号放置结果
+                    if success:
+                        successful_grading += 1
+                except Exception as exc:
+                    question_idx = future_to_question[future]
+                    logger.error(f'第{question_idx+1}题处理时发生异常: {exc}')
+                    # 创建错误结果
+                    results[question_idx] = self._error_result(question_idx, questions[question_idx], str(exc))
+                    i = question_idx
+
+                _notify(progress_callback, 'question_completed', index=i, result=results[i])
+        except FutureTimeoutError:
+            # 已在执行的题目无法中断，其下游调用的超时已按截止时间收紧，结果将被丢弃
+            for future, i in future_to_question.items():
+                if results[i] is None:
+                    future.cancel()
+                    self._on_question_timed_out(i, questions[i], results, progress_callback)
+
+        return results, successful_grading
+
+    async def _grade_questions_async(self, questions, progress_callback=None, deadline=None, archive=None):
+        """grade_questions的异步实现：每道题一个协程，下游并发由各服务的舱壁限制"""
+        results = [None] * len(questions)
+        successful_grading = 0
+
+        async def run_question(i, question):
+            try:
+                return await self.process_question_async(i, question, deadline, archive)
+            except Exception as exc:
+                logger.error(f'第{i+1}题处理时发生异常: {exc}')
+                return i, self._error_result(i, question, str(exc)), False
+
+        pending = {asyncio.ensure_future(run_question(i, question)) for i, question in enumerate(questions)}
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=remaining_time(deadline), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                i, result, success = task.result()
+                results[i] = result
+                if success:
+                    successful_grading += 1
+                _notify(progress_callback, 'question_completed', index=i, result=result)
+
+        # 截止时间到期，取消未完成的题目（进行中的下游请求随之中断）
+        for task in pending:
+            task.cancel()
+        for i, question in enumerate(questions):
+            if results[i] is None:
+                self._on_question_timed_out(i, question, results, progress_callback)
+
+        return results, successful_grading
+
+    def _on_question_timed_out(self, i, question, results, progress_callback=None):
+        """截止时间到期时为未完成的题目填入timed_out结果"""
+        logger.warning(f"请求截止时间已到，第{i+1}题未完成批改")
+        results[i] = self._error_result(i, question, '请求截止时间已到', timed_out=True)
+        _notify(progress_callback, 'question_completed', index=i, result=results[i])
+
+    def _error_result(self, question_idx, question, error, timed_out=False):
+        """构建单题处理异常或超时未完成时的结果"""
+        return {
+            'question_id': question_idx + 1,
+            'coordinates': question['coordinates'],
+            'text': question['text'],
+            'reference_answer': '',
+            'similarity_score': 0,
+            'grading_result': {'success': False, 'error': error},
+            'image_path': str(question['image_path']),
+            'timed_out': timed_out
+        }
+
+    def process(self, filepath, progress_callback=None, force=False, deadline=None, archive_id=None, segmenter=None):
+        """执行完整的作业批改流程
+
+        Args:
+            filepath: 上传图片路径，或内存中的ImageBuffer
+            progress_callback: 进度回调（可选），签名为callback(event, data)，
+                事件包括stage_started、stage_completed、stage_failed、cache_hit、
+                segmentation_ready、questions_ready和question_completed
+            force: 为True时忽略结果缓存，重新执行全部远程调用
+            deadline: 请求的整体截止时间（可选，Deadline），到期时返回已完成的题目结果，
+                未完成的题目标记timed_out，结果中timed_out为True
+            archive_id: 原始响应归档ID（可选，通常为任务ID）；启用归档且写入了原始响应时，
+                结果中附带archive_id
+            segmenter: 题目分割引擎（remote、local、auto或layout，可选），默认Config.SEGMENTATION_ENGINE
+
+        Returns:
+            dict: 批改结果，失败时包含error字段
+        """
+        archive = self._create_archive(archive_id)
+        try:
+            with PIPELINE_IN_FLIGHT.track_inprogress():
+                result = self._process_page(
+                    filepath, progress_callback, force, deadline, self._page_archive(archive, 0), segmenter
+                )
+        finally:
+            if archive is not None:
+                archive.close()
+        self._record_page_metrics(result)
+        return self._with_archive_id(result, archive)
+
+    def _create_archive(self, archive_id=None):
+        """为本次任务创建原始响应归档，未启用归档时返回None"""
+        if self.response_archive is None:
+            return None
+        return self.response_archive.create(archive_id)
+
+    def _page_archive(self, archive, page):
+        """单页的归档视图，未启用归档时返回None"""
+        return archive.for_page(page) if archive is not None else None
+
+    def _with_archive_id(self, result, archive):
+        """归档写入了原始响应时，在结果中附带archive_id"""
+        if archive is None or not archive.written:
+            return result
+        return dict(result, archive_id=archive.archive_id)
+
+    def _process_page(self, filepath, progress_callback=None, force=False, deadline=None, archive=None, segmenter=None):
+        """执行单页批改：查询缓存、识别、题目处理与批改、写入缓存"""
+        start_time = time.time()
+
+        content_hash, cached_result = self._lookup_cached_result(filepath, start_time, force, progress_callback)
+        if cached_result is not None:
+            return cached_result
+
+        # 步骤1+2: 题目分割与OCR识别并发执行
+        logger.info("=== 步骤1+2: 并发执行题目分割与OCR识别 ===")
+        recognition = self.recognize(filepath, progress_callback, deadline, segmenter, archive)
+        if not recognition['success']:
+            return recognition
+
+        result = self.complete(filepath, recognition, start_time, progress_callback, deadline, archive)
+        self._store_result(content_hash, result)
+        return result
+
+    def _record_page_metrics(self, result):
+        """记录单页的各阶段耗时、题目数和处理结果"""
+        if result.get('cached'):
+            PAGES_PROCESSED.inc(outcome='cached')
+            return
+        if result.get('timed_out'):
+            PAGES_PROCESSED.inc(outcome='timed_out')
+
+        for stage, elapsed in result.get('stage_timings', result.get('timings', {})).items():
+            STAGE_DURATION.observe(elapsed, stage=stage)
+        if result.get('success'):
+            PAGES_PROCESSED.inc(outcome='success')
+            STAGE_DURATION.observe(result['processing_time'], stage='total')
+            QUESTIONS_PER_PAGE.observe(result['total_questions'])
+        else:
+            PAGES_PROCESSED.inc(outcome='failed')
+
+    def _lookup_cached_result(self, filepath, start_time, force, progress_callback=None):
+        """计算图片内容哈希并查询结果缓存
+
+        命中时按正常流程的顺序重放分割框和逐题结果事件，流式客户端无需区分。
+
+        Returns:
+            tuple: (内容哈希, 缓存的批改结果)；未启用缓存时均为None，未命中时结果为None
+        """
+        if self.result_cache is None:
+            return None, None
+
+        content_hash = compute_content_hash(read_image_bytes(filepath))
+
+        if force:
+            logger.info(f"请求要求跳过结果缓存，内容哈希: {content_hash[:16]}")
+            return content_hash, None
+
+        cached = self.result_cache.get(content_hash)
+        if cached is None:
+            return content_hash, None
+
+        logger.info(f"命中批改结果缓存，内容哈希: {content_hash[:16]}，跳过全部远程调用")
+        _notify(progress_callback, 'cache_hit', content_hash=content_hash)
+        _notify(progress_callback, 'segmentation_ready', coordinates=[r['coordinates'] for r in cached['results']])
+        _notify(progress_callback, 'questions_ready', questions=[
+            {'question_id': r['question_id'], 'coordinates': r['coordinates'], 'text': r['text']}
+            for r in cached['results']
+        ])
+        for i, result in enumerate(cached['results']):
+            _notify(progress_callback, 'question_completed', index=i, result=result)
+
+        return content_hash, dict(
+            cached,
+            cached=True,
+            content_hash=content_hash,
+            original_processing_time=cached.get('processing_time'),
+            processing_time=time.time() - start_time
+        )
+
+    def _store_result(self, content_hash, result):
+        """缓存完整成功的批改结果，存在失败题目或使用本地分割时不缓存，避免把临时故障和降级结果固化"""
+        if self.result_cache is None or content_hash is None:
+            return
+        if not result.get('success') or not result.get('total_questions'):
+            return
+        if result.get('segmentation_engine') == 'local':
+            logger.info("题目分割使用了本地引擎，结果不写入缓存")
+            return
+        if result.get('successful_grading') != result.get('total_questions'):
+            logger.info("存在批改失败的题目，结果不写入缓存")
+            return
+
+        self.result_cache.set(content_hash, dict(result, content_hash=content_hash))
+
+    def complete(self, filepath, recognition, start_time, progress_callback=None, deadline=None, archive=None):
+        """在识别结果基础上完成题目处理和检索批改（步骤3、4）
+
+        Args:
+            filepath: 上传图片路径
+            recognition: recognize返回的成功识别结果，其中的OCR结果在题目处理后即被释放
+            start_time: 本页处理开始时间，用于计算总耗时
+            progress_callback: 进度回调（可选）
+            deadline: 请求的整体截止时间（可选）
+            archive: 本页的原始响应归档（可选），写入检索和批改的原始响应
+
+        Returns:
+            dict: 批改结果
+        """
+        timings = recognition['timings']
+        segmentation_result = recognition['segmentation_result']
+        ocr_result = recognition.pop('ocr_result')
+
+        logger.info(f"题目分割完成，用时: {timings['segmentation']:.2f}秒，检测到{len(segmentation_result.get('coordinates', []))}个题目")
+        logger.info(f"OCR识别完成，用时: {timings['ocr']:.2f}秒，识别文本长度: {len(ocr_result.get('text_content', ''))}")
+
+        if Config.LAYOUT_AGREEMENT_CHECK and segmentation_result.get('engine') == 'remote':
+            self._check_layout_agreement(segmentation_result, ocr_result)
+
+        # 步骤3: 题目分割与处理
+        step3_start = time.time()
+        logger.info("=== 步骤3: 开始题目分割与处理 ===")
+        _notify(progress_callback, 'stage_started', stage='question_processing')
+        questions = self.prepare_questions(filepath, segmentation_result, ocr_result)
+        # 题目文字和字符表已提取，检索批改期间不再持有整页OCR结果
+        ocr_result = None
+        timings['question_processing'] = time.time() - step3_start
+        _notify(progress_callback, 'stage_completed', stage='question_processing', elapsed=timings['question_processing'])
+        _notify(progress_callback, 'questions_ready', questions=[
+            {'question_id': q['question_id'], 'coordinates': q['coordinates'], 'text': q['text']}
+            for q in questions
+        ])
+
+        logger.info(f"题目分割处理完成，用时: {timings['question_processing']:.2f}秒，处理了{len(questions)}个题目")
+
+        # 步骤4: 原题检索和批改
+        step4_start = time.time()
+        logger.info("=== 步骤4: 开始原题检索和AI批改（并发模式）===")
+        _notify(progress_callback, 'stage_started', stage='grading')
+        results, successful_grading = self.grade_questions(questions, progress_callback, deadline, archive)
+        timings['grading'] = time.time() - step4_start
+        _notify(progress_callback, 'stage_completed', stage='grading', elapsed=timings['grading'])
+
+        total_time = time.time() - start_time
+
+        logger.info(f"原题检索和批改完成，用时: {timings['grading']:.2f}秒，成功批改: {successful_grading}/{len(questions)}题")
+        logger.info(f"=== 作业处理完成，总用时: {total_time:.2f}秒 ===")
+        logger.info(
+            f"处理统计: [题目分割({timings['segmentation']:.2f}s) ∥ OCR识别({timings['ocr']:.2f}s)]"
+            f"({timings['recognition']:.2f}s) + 题目处理({timings['question_processing']:.2f}s)"
+            f" + 检索批改({timings['grading']:.2f}s)"
+        )
+
+        return {
+            'success': True,
+            'results': results,
+            'total_questions': len(results),
+            'processing_time': total_time,
+            'stage_timings': timings,
+            'successful_grading': successful_grading,
+            'segmentation_engine': segmentation_result.get('engine', 'remote'),
+            'timed_out': any(result['timed_out'] for result in results)
+        }
+
+    def _check_layout_agreement(self, segmentation_result, ocr_result):
+        """灰度验证：用OCR版面划分题目并与远程分割结果比较，不影响本次批改"""
+        try:
+            # 直接调用版面划分，不经过segment_questions_layout，灰度验证不计入题目分割次数
+            layout_result = self.image_processor.layout_segmenter.detect(ocr_result)
+            if not layout_result['success']:
+                return
+            layout_coordinates = self.image_processor._parse_coordinates(layout_result)
+            agreement = compare_segmentations(
+                segmentation_result.get('coordinates', []), layout_coordinates, Config.LAYOUT_AGREEMENT_IOU
+            )
+        except Exception as e:
+            logger.warning(f"版面分割一致性检查失败: {str(e)}")
+            return
+        for metric in ('precision', 'recall', 'mean_iou'):
+            LAYOUT_AGREEMENT.observe(agreement[metric], metric=metric)
+        logger.info(
+            f"版面分割一致性: 远程{len(segmentation_result.get('coordinates', []))}题，版面{len(layout_coordinates)}题，"
+            f"匹配{agreement['matched']}题，平均IoU: {agreement['mean_iou']:.2f}"
+        )
+
+    def process_batch(self, filepaths, progress_callback=None, force=False, deadline=None, archive_id=None, segmenter=None):
+        """批量批改多页作业，页面之间流水线执行
+
+        识别阶段使用单独的单线程通道按页顺序执行：第k页进入检索批改时，
+        第k+1页的题目分割与OCR已在后台进行，从而掩盖远程识别耗时。
+
+        Args:
+            filepaths: 按页顺序排列的图片路径列表
+            progress_callback: 进度回调（可选），事件数据中附带page字段（从0开始），
+                另有page_started和page_completed事件
+            force: 为True时忽略结果缓存
+            deadline: 整个批次的截止时间（可选）
+            archive_id: 原始响应归档ID（可选），整个批次写入同一个归档，记录中附带页码
+            segmenter: 题目分割引擎（remote、local、auto或layout，可选），默认Config.SEGMENTATION_ENGINE
+
+        Returns:
+            dict: 包含逐页结果和汇总耗时的批量批改结果
+        """
+        batch_start = time.time()
+        logger.info(f"=== 开始批量批改，共{len(filepaths)}页 ===")
+
+        def page_callback(page):
+            if progress_callback is None:
+                return None
+            return lambda event, data: progress_callback(event, dict(data, page=page))
+
+        def recognize_page(page, filepath):
+            PIPELINE_IN_FLIGHT.inc()
+            page_start = time.time()
+            _notify(progress_callback, 'page_started', page=page, filename=os.path.basename(filepath))
+            content_hash, cached_result = self._lookup_cached_result(filepath, page_start, force, page_callback(page))
+            if cached_result is not None:
+                return page_start, content_hash, {'success': True, 'cached_result': cached_result}
+            return page_start, content_hash, self.recognize(
+                filepath, page_callback(page), deadline, segmenter, self._page_archive(archive, page)
+            )
+
+        pages = []
+        archive = self._create_archive(archive_id)
+        recognition_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-recognize')
+        try:
+            recognition_futures = [
+                recognition_executor.submit(recognize_page, page, filepath)
+                for page, filepath in enumerate(filepaths)
+            ]
+
+            for page, (filepath, future) in enumerate(zip(filepaths, recognition_futures)):
+                try:
+                    page_start, content_hash, recognition = future.result()
+                    if 'cached_result' in recognition:
+                        page_result = recognition['cached_result']
+                    elif recognition['success']:
+                        logger.info(f"--- 第{page+1}页识别完成，开始题目处理与批改 ---")
+                        page_result = self.complete(
+                            filepath, recognition, page_start, page_callback(page), deadline, self._page_archive(archive, page)
+                        )
+                        self._store_result(content_hash, page_result)
+                    else:
+                        page_result = recognition
+                except Exception as exc:
+                    logger.error(f"第{page+1}页处理时发生异常: {exc}")
+                    page_result = {'success': False, 'error': f'处理失败: {str(exc)}'}
+
+                page_result = dict(page_result, page=page + 1, filename=os.path.basename(filepath))
+                if not page_result['success']:
+                    logger.error(f"第{page+1}页批改失败: {page_result.get('error')}")
+                    page_result.setdefault('stage_timings', page_result.pop('timings', {}))
+                pages.append(page_result)
+                PIPELINE_IN_FLIGHT.dec()
+                self._record_page_metrics(page_result)
+                _notify(progress_callback, 'page_completed', page=page, result=page_result)
+        finally:
+            recognition_executor.shutdown(wait=False, cancel_futures=True)
+            if archive is not None:
+                archive.close()
+
+        total_time = time.time() - batch_start
+
+        # 汇总各阶段耗时（各页之和），与实际墙钟时间对比可看出流水线节省的时间
+        stage_totals = {}
+        for page_result in pages:
+            for stage, elapsed in page_result.get('stage_timings', {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0) + elapsed
+        serial_time = sum(page_result.get('processing_time', 0) for page_result in pages)
+
+        successful_pages = sum(1 for page_result in pages if page_result['success'])
+        total_questions = sum(page_result.get('total_questions', 0) for page_result in pages)
+        successful_grading = sum(page_result.get('successful_grading', 0) for page_result in pages)
+
+        logger.info(f"=== 批量批改完成，总用时: {total_time:.2f}秒，逐页累计: {serial_time:.2f}秒 ===")
+        logger.info(f"批量统计: 成功页数{successful_pages}/{len(pages)}，成功批改{successful_grading}/{total_questions}题")
+
+        batch_result = {
+            'success': successful_pages > 0,
+            'pages': pages,
+            'total_pages': len(pages),
+            'successful_pages': successful_pages,
+            'total_questions': total_questions,
+            'successful_grading': successful_grading,
+            'processing_time': total_time,
+            'serial_processing_time': serial_time,
+            'stage_timings': stage_totals,
+            'timed_out': any(page_result.get('timed_out') for page_result in pages)
+        }
+        if not successful_pages:
+            batch_result['error'] = '所有页面批改失败'
+        return self._with_archive_id(batch_result, archive)
+
+    def replay(self, archive_path, filepaths=None):
+        """从原始响应归档离线重放解析和题目切分，不发起任何网络请求
+
+        逐页重新解析题目分割和OCR的原始响应并执行split_questions，再重新解析各题的检索和批改响应，
+        用于复现和基准测试结果异常或耗时异常的页面。
+
+        Args:
+            archive_path: 归档文件路径
+            filepaths: 页码（从0开始）到页面图片路径的映射（可选），默认使用归档中记录的原始路径
+
+        Returns:
+            dict: 逐页的题目切分结果、各题解析结果和各步骤耗时
+        """
+        pages = {}
+        for record in read_archive(archive_path):
+            page = pages.setdefault(record.get('page', 0), {'questions': {}})
+            if record['type'] in ('segmentation', 'ocr'):
+                page[record['type']] = record
+            else:
+                page['questions'].setdefault(record['question_id'], {})[record['type']] = record
+
+        filepaths = filepaths or {}
+        return {
+            'archive': archive_path,
+            'pages': [self._replay_page(page, records, filepaths.get(page)) for page, records in sorted(pages.items())]
+        }
+
+    def _replay_page(self, page, records, filepath=None):
+        """重放单页：解析识别响应 → 题目切分 → 解析各题检索和批改响应"""
+        if 'segmentation' not in records or 'ocr' not in records:
+            return {'page': page + 1, 'success': False, 'error': '归档中缺少题目分割或OCR原始响应'}
+
+        filepath = filepath or records['segmentation'].get('source')
+        if not filepath or not os.path.exists(filepath):
+            return {'page': page + 1, 'success': False, 'error': f'页面图片不存在: {filepath}'}
+
+        timings = {}
+        stage_start = time.time()
+        segmentation_raw = records['segmentation']['raw_result']
+        segmentation_result = {
+            'success': True,
+            'coordinates': self.image_processor._parse_coordinates(segmentation_raw),
+            'raw_result': segmentation_raw
+        }
+        timings['parse_segmentation'] = time.time() - stage_start
+
+        stage_start = time.time()
+        ocr_result = self.ocr_service._build_ocr_result(records['ocr']['raw_result'])
+        timings['parse_ocr'] = time.time() - stage_start
+
+        stage_start = time.time()
+        questions = self.prepare_questions(filepath, segmentation_result, ocr_result)
+        timings['question_processing'] = time.time() - stage_start
+
+        stage_start = time.time()
+        results = []
+        for question_id, question_records in sorted(records['questions'].items()):
+            result = {'question_id': question_id}
+            if 'retrieval' in question_records:
+                retrieval = question_records['retrieval']
+                parsed = self.knowledge_service._parse_search_result(retrieval['raw_result'], retrieval.get('query', ''))
+                result['query'] = retrieval.get('query', '')
+                result['reference_answer'] = parsed.get('reference_answer', '')
+                result['similarity_score'] = parsed.get('similarity_score', 0.0)
+            if 'grading' in question_records:
+                result['grading_result'] = self.ai_grading_service._parse_grading_result(question_records['grading']['raw_result'])
+            results.append(result)
+        timings['parse_responses'] = time.time() - stage_start
+
+        return {
+            'page': page + 1,
+            'success': True,
+            'filepath': filepath,
+            'questions': [
+                {
+                    'question_id': question['question_id'],
+                    'coordinates': question['coordinates'],
+                    'text': question['text'],
+                    'char_count': len(question['char_details'])
+                }
+                for question in questions
+            ],
+            'results': results,
+            'recorded_timings': {
+                'segmentation': records['segmentation'].get('elapsed'),
+                'ocr': records['ocr'].get('elapsed')
+            },
+            'stage_timings': timings
+        }
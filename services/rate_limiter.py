@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from .metrics import REGISTRY, gauge_family
+from .resilience import DownstreamError, RequestCancelledError
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    'pigai_rate_limit_wait_seconds', '下游请求等待限流令牌的时间', ['service'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    'pigai_rate_limit_rejections_total', '因限流排队超时或当日额度用完而未发出的请求数', ['service', 'reason'])
+
+
+class RateLimitError(DownstreamError):
+    """请求因限流未能发出的基类"""
+
+
+class RateLimitTimeoutError(RateLimitError):
+    """排队等待限流令牌超时"""
+
+
+class QuotaExceededError(RateLimitError):
+    """当日调用额度已用完"""
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    used_today INTEGER NOT NULL
+)
+'''
+
+
+class SharedRateLimiter:
+    """跨进程共享的令牌桶限流器，附带每日额度
+
+    令牌数和当日用量保存在SQLite文件中，每次申请在一个写事务内完成补充和扣减，
+    同一台机器上的所有gunicorn worker共用同一份限额。令牌按每次发出的请求（含重试）申请，
+    不足时请求排队等待，不直接失败；当日额度按页扣除（charge），每页只扣一次，
+    额度用完时立即失败，避免继续消耗付费或试用账号的页数。
+    """
+
+    def __init__(self, name, db_path, qps, burst, daily_budget, max_wait):
+        self.name = name
+        self.db_path = db_path
+        self.qps = qps  # 不大于0时不限速，只检查每日额度
+        self.burst = max(1, burst)
+        self.daily_budget = daily_budget  # 0为不限
+        self.max_wait = max_wait
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait_time = 0.0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(_SCHEMA)
+
+    def _connection(self):
+        """当前线程的SQLite连接（WAL模式，写事务之间互斥）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, row, now, today):
+        """根据上次状态计算当前令牌数和当日用量"""
+        if row is None:
+            return float(self.burst), 0
+        tokens, updated_at, day, used_today = row
+        if self.qps > 0:
+            tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.qps)
+        return tokens, (used_today if day == today else 0)
+
+    def _transaction(self, update):
+        """在一个写事务中补充令牌、读取当日用量，并写回update(tokens, used_today)返回的新状态
+
+        Returns:
+            update返回的第三项
+        """
+        conn = self._connection()
+        now = time.time()
+        today = time.strftime('%Y-%m-%d')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at, day, used_today FROM rate_limits WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens, used_today, result = update(*self._refill(row, now, today))
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at, day, used_today) VALUES (?, ?, ?, ?, ?)',
+                (self.name, tokens, now, today, used_today)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def _try_acquire(self, cost):
+        """扣减令牌（不计入当日用量）
+
+        Returns:
+            float: 0表示已获得令牌，否则为还需等待的秒数
+        """
+        def update(tokens, used_today):
+            if self.qps <= 0:
+                return tokens, used_today, 0.0
+            if tokens < cost:
+                return tokens, used_today, (cost - tokens) / self.qps
+            return tokens - cost, used_today, 0.0
+        return self._transaction(update)
+
+    def charge(self, cost=1):
+        """从当日额度中扣除cost页
+
+        每页识别前调用一次；重试只申请令牌（acquire），不重复扣除额度。
+
+        Raises:
+            QuotaExceededError: 当日额度不足
+        """
+        def update(tokens, used_today):
+            if self.daily_budget and used_today + cost > self.daily_budget:
+                raise QuotaExceededError(f'{self.name}今日额度已用完（{used_today}/{self.daily_budget}）')
+            return tokens, used_today + cost, None
+        try:
+            self._transaction(update)
+        except QuotaExceededError:
+            self._on_rejected('quota')
+            raise
+
+    def refund(self, cost=1):
+        """退还charge扣除的额度（请求最终未能发出时调用）"""
+        self._transaction(lambda tokens, used_today: (tokens, max(0, used_today - cost), None))
+
+    def _max_wait(self, deadline):
+        if deadline is None:
+            return self.max_wait
+        return min(self.max_wait, deadline.remaining())
+
+    def _on_rejected(self, reason):
+        with self._lock:
+            self.rejected += 1
+        RATE_LIMIT_REJECTIONS.inc(service=self.name, reason=reason)
+
+    def _on_acquired(self, waited):
+        with self._lock:
+            self.acquired += 1
+            self.total_wait_time += waited
+        RATE_LIMIT_WAIT.observe(waited, service=self.name)
+        if waited > 0:
+            logger.info(f"{self.name}限流排队{waited:.2f}秒后获得令牌")
+
+    def _next_wait(self, cost, start, max_wait):
+        """申请令牌，返回还需等待的秒数；已获得令牌时返回0，无法在max_wait内获得时抛出异常"""
+        wait = self._try_acquire(cost)
+        if wait == 0:
+            self._on_acquired(time.monotonic() - start)
+            return 0.0
+        if time.monotonic() - start + wait > max_wait:
+            self._on_rejected('timeout')
+            raise RateLimitTimeoutError(f'{self.name}请求过多，排队{max_wait:.0f}秒仍未获得限流令牌')
+        return wait
+
+    def acquire(self, cost=1, deadline=None, cancel_event=None):
+        """为一次请求（含重试）申请cost个令牌，不足时排队等待；不扣除当日额度（见charge）
+
+        Args:
+            cost: 本次请求消耗的令牌数
+            deadline: 请求的整体截止时间（可选），排队时间不超过剩余时间
+            cancel_event: 取消事件（可选），排队期间被设置时放弃
+
+        Raises:
+            RateLimitTimeoutError: 排队超过max_wait或截止时间
+            RequestCancelledError: 排队期间请求被取消
+        """
+        start = time.monotonic()
+        max_wait = self._max_wait(deadline)
+        wait = self._next_wait(cost, start, max_wait)
+        if wait == 0:
+            return
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            while wait > 0:
+                if cancel_event is not None:
+                    if cancel_event.wait(wait):
+                        raise RequestCancelledError(f'{self.name}请求已取消')
+                else:
+                    time.sleep(wait)
+                wait = self._next_wait(cost, start, max_wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    async def acquire_async(self, cost=1, deadline=None):
+        """acquire的协程版本，数据库操作在线程中执行，排队期间不阻塞事件循环"""
+        start = time.monotonic()
+        max_wait = self._max_wait(deadline)
+        wait = await asyncio.to_thread(self._next_wait, cost, start, max_wait)
+        if wait == 0:
+            return
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = await asyncio.to_thread(self._next_wait, cost, start, max_wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def stats(self):
+        """返回当前令牌数、当日用量和剩余额度（跨进程汇总），以及本进程的排队统计"""
+        row = self._connection().execute(
+            'SELECT tokens, updated_at, day, used_today FROM rate_limits WHERE name = ?', (self.name,)
+        ).fetchone()
+        tokens, used_today = self._refill(row, time.time(), time.strftime('%Y-%m-%d'))
+        with self._lock:
+            return {
+                'qps': self.qps,
+                'burst': self.burst,
+                'tokens': round(tokens, 2),
+                'daily_budget': self.daily_budget,
+                'used_today': used_today,
+                'remaining_today': max(0, self.daily_budget - used_today) if self.daily_budget else None,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'rejected': self.rejected,
+                'total_wait_time': round(self.total_wait_time, 3)
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name):
+    """获取指定下游服务的限流器，参数来自Config.RATE_LIMITS，未配置时返回None"""
+    if name not in Config.RATE_LIMITS:
+        return None
+    with _limiters_lock:
+        if name not in _limiters:
+            limits = Config.RATE_LIMITS[name]
+            _limiters[name] = SharedRateLimiter(
+                name,
+                Config.RATE_LIMIT_DB,
+                qps=limits['qps'],
+                burst=limits['burst'],
+                daily_budget=limits['daily_budget'],
+                max_wait=Config.RATE_LIMIT_MAX_WAIT
+            )
+        return _limiters[name]
+
+def get_rate_limit_stats():
+    """汇总所有已配置下游服务的限流和额度状态"""
+    stats = {}
+    for name in Config.RATE_LIMITS:
+        try:
+            stats[name] = get_rate_limiter(name).stats()
+        except sqlite3.Error as e:
+            logger.error(f"读取{name}限流状态失败: {str(e)}")
+            stats[name] = None
+    return stats
+
+def _collect_rate_limit_metrics():
+    """把令牌数、当日用量和剩余额度导出为Prometheus指标"""
+    stats = {name: value for name, value in get_rate_limit_stats().items() if value is not None}
+    return gauge_family('pigai_rate_limit', '下游限流与每日额度状态', 'service', stats)
+
+REGISTRY.register_collector(_collect_rate_limit_metrics)
@@ -0,0 +1,419 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import aiohttp
+import requests
+from config import Config
+from .concurrency import BulkheadFullError, get_bulkhead
+from .deadline import remaining_time
+from .metrics import DOWNSTREAM_RETRIES, REGISTRY, gauge_family, timed_request, timed_request_async
+
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码：超时、限流和服务端临时故障；其余4xx为请求本身的问题，重试无意义
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+RETRY_BUDGET_EXHAUSTED = REGISTRY.counter(
+    'pigai_retry_budget_exhausted_total', '因全局重试预算耗尽而放弃的重试次数', ['service'])
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    'pigai_circuit_rejections_total', '熔断期间被直接拒绝的下游请求数', ['service'])
+
+
+class DownstreamError(Exception):
+    """下游调用失败（未得到HTTP响应）的基类"""
+
+
+class CircuitOpenError(DownstreamError):
+    """下游服务处于熔断状态，请求被直接拒绝"""
+
+
+class RequestCancelledError(DownstreamError):
+    """请求在发出前已被取消"""
+
+
+class DeadlineExceededError(DownstreamError):
+    """请求的整体截止时间已到，不再发起下游调用"""
+
+
+class DownstreamRequestError(DownstreamError):
+    """异步下游请求在全部重试后仍因网络异常或超时失败"""
+
+
+def is_retryable_status(status_code):
+    """HTTP状态码是否值得重试"""
+    return status_code in RETRYABLE_STATUS_CODES
+
+def is_retryable_exception(exc):
+    """请求异常是否为可重试的临时故障（连接失败、超时、连接中断），证书错误等不重试"""
+    if isinstance(exc, (requests.exceptions.SSLError, aiohttp.ClientSSLError)):
+        return False
+    return isinstance(exc, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        asyncio.TimeoutError
+    ))
+
+def _retry_after(response):
+    """解析响应中的Retry-After秒数，无法解析时返回0"""
+    try:
+        return max(0.0, float(response.headers.get('Retry-After', 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RetryPolicy:
+    """指数退避 + 全抖动重试策略"""
+
+    def __init__(self, max_attempts, base_delay, max_delay):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        """第attempt次失败后的等待时间（attempt从0开始），在[0, base*2^attempt]内随机以打散重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """进程级重试预算（令牌桶）
+
+    每个新请求存入ratio个令牌，每次重试取出一个；另按min_per_second持续补充，
+    保证低流量时也能重试。下游整体故障时，重试量被限制在正常请求量的ratio倍左右，
+    不会因为每个请求都重试多次而形成重试风暴。
+    """
+
+    def __init__(self, ratio, min_per_second, max_tokens):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def on_request(self):
+        """记录一个新请求（不含重试）"""
+        with self._lock:
+            self._refill()
+            self.requests += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        """为一次重试申请令牌，预算不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        """返回预算使用统计"""
+        with self._lock:
+            self._refill()
+            return {
+                'tokens': round(self.tokens, 2),
+                'max_tokens': self.max_tokens,
+                'requests': self.requests,
+                'retries': self.retries,
+                'exhausted': self.exhausted
+            }
+
+
+class CircuitBreaker:
+    """单个下游服务的熔断器
+
+    连续failure_threshold次可重试故障（超时、连接失败、5xx/429）后进入open状态，
+    此后recovery_timeout秒内的请求直接失败；到期后进入half_open，只放行一个探测请求，
+    成功则恢复closed，失败则重新open。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold, recovery_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    def before_call(self):
+        """请求前检查熔断状态
+
+        Raises:
+            CircuitOpenError: 熔断中，或半开状态下已有探测请求在进行
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                logger.info(f"{self.name}熔断恢复期已到，放行探测请求")
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected_calls += 1
+        CIRCUIT_REJECTIONS.inc(service=self.name)
+        raise CircuitOpenError(f'{self.name}服务暂时不可用（熔断中），请稍后重试')
+
+    def is_open(self):
+        """是否处于熔断中且恢复期未到（不改变状态），调用方可据此直接走降级路径"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.recovery_timeout
+
+    def after_call(self, success):
+        """记录请求结果
+
+        Args:
+            success: True为成功，False为可重试故障，None为与下游健康无关的结果（如舱壁排队超时）
+        """
+        with self._lock:
+            was_probe = self._probe_in_flight
+            self._probe_in_flight = False
+            if success is None:
+                return
+            if success:
+                if self.state != self.CLOSED:
+                    logger.info(f"{self.name}探测请求成功，熔断恢复")
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                return
+
+            self.consecutive_failures += 1
+            if was_probe or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.error(f"{self.name}连续{self.consecutive_failures}次失败，熔断{self.recovery_timeout}秒")
+
+    def stats(self):
+        """返回熔断状态统计"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'state_code': self.STATE_CODES[self.state],
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls
+            }
+
+
+_retry_budget = RetryBudget(
+    Config.RETRY_BUDGET_RATIO,
+    Config.RETRY_BUDGET_MIN_PER_SECOND,
+    Config.RETRY_BUDGET_MAX_TOKENS
+)
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name):
+    """获取指定下游服务的熔断器"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                Config.CIRCUIT_FAILURE_THRESHOLD,
+                Config.CIRCUIT_RECOVERY_TIMEOUT
+            )
+        return _breakers[name]
+
+def get_resilience_stats():
+    """汇总重试预算和各熔断器状态"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        'retry_budget': _retry_budget.stats(),
+        'circuit_breakers': {name: breaker.stats() for name, breaker in breakers.items()}
+    }
+
+def _retry_policy(max_attempts):
+    return RetryPolicy(
+        max_attempts if max_attempts is not None else Config.MAX_RETRIES,
+        Config.RETRY_DELAY,
+        Config.RETRY_MAX_DELAY
+    )
+
+def _should_retry(service, attempt, policy, delay, deadline):
+    if attempt + 1 >= policy.max_attempts:
+        return False
+    if deadline is not None and deadline.remaining() - delay < Config.DEADLINE_MIN_ATTEMPT_TIME:
+        logger.warning(f"请求剩余时间不足，{service}请求不再重试")
+        return False
+    if not _retry_budget.try_acquire():
+        logger.warning(f"全局重试预算已用尽，{service}请求不再重试")
+        RETRY_BUDGET_EXHAUSTED.inc(service=service)
+        return False
+    return True
+
+def _retry_delay_after_exception(service, exc, attempt, policy, breaker, deadline):
+    """请求异常后决定是否重试，返回等待秒数，不重试时返回None"""
+    retryable = is_retryable_exception(exc)
+    # 因请求剩余时间不足而超时不代表下游故障，不计入熔断
+    breaker.after_call(False if retryable and (deadline is None or not deadline.expired()) else None)
+    logger.error(f"{service}请求异常（{'可重试' if retryable else '不可重试'}）: {type(exc).__name__} {str(exc)}")
+    if not retryable:
+        return None
+    delay = policy.backoff(attempt)
+    return delay if _should_retry(service, attempt, policy, delay, deadline) else None
+
+def _retry_delay_after_response(service, response, attempt, policy, breaker, deadline):
+    """收到响应后决定是否重试，返回等待秒数，不重试时返回None"""
+    if not is_retryable_status(response.status_code):
+        # 4xx等请求本身的错误说明下游是健康的
+        breaker.after_call(True)
+        return None
+    breaker.after_call(False)
+    logger.error(f"{service}请求失败，状态码: {response.status_code}，响应内容: {response.text[:500]}")
+    delay = min(policy.max_delay, max(policy.backoff(attempt), _retry_after(response)))
+    return delay if _should_retry(service, attempt, policy, delay, deadline) else None
+
+def _check_deadline(service, deadline):
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceededError(f'请求截止时间已到，未发起{service}请求')
+
+def _with_deadline(kwargs, deadline):
+    """按剩余时间收紧本次请求的超时"""
+    if deadline is None:
+        return kwargs
+    return dict(kwargs, timeout=deadline.clamp_timeout(kwargs.get('timeout')))
+
+def call_downstream(service, send, *args, max_attempts=None, cancel_event=None, deadline=None, rate_limiter=None, **kwargs):
+    """通过弹性层调用下游服务
+
+    每次尝试都在该服务的舱壁名额内执行；连接失败、超时和5xx/429按指数退避加抖动重试，
+    其余4xx不重试；重试受全局重试预算限制；下游连续故障时熔断器直接拒绝请求。
+    传入截止时间时，每次请求的超时和舱壁排队时间不超过剩余时间，剩余时间不足时不再重试。
+    传入限流器时，每次尝试（含重试）在熔断和舱壁放行后申请一个令牌；当日额度由调用方按页扣除（charge）。
+
+    Args:
+        service: 下游服务名称，舱壁、熔断器和指标均按此区分
+        send: 发送请求的函数，如get_http_client('ocr').post
+        *args, **kwargs: 传给send的参数
+        max_attempts: 最多尝试次数，默认Config.MAX_RETRIES
+        cancel_event: 取消事件（可选），被设置后不再发起后续重试
+        deadline: 请求的整体截止时间（可选，Deadline）
+        rate_limiter: 限流器（可选，SharedRateLimiter）
+
+    Returns:
+        requests.Response: 成功响应，或不可重试、重试耗尽后的最后一个响应
+
+    Raises:
+        CircuitOpenError: 下游服务熔断中
+        RequestCancelledError: 请求已被取消
+        DeadlineExceededError: 截止时间已到
+        RateLimitError: 限流排队超时或当日额度用完
+        BulkheadFullError: 等待并发名额超时
+        requests.exceptions.RequestException: 最后一次请求异常
+    """
+    policy = _retry_policy(max_attempts)
+    breaker = get_circuit_breaker(service)
+    bulkhead = get_bulkhead(service)
+    _retry_budget.on_request()
+
+    attempt = 0
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelledError(f'{service}请求已取消')
+        _check_deadline(service, deadline)
+        breaker.before_call()
+        try:
+            with bulkhead.slot(remaining_time(deadline)):
+                # 熔断和舱壁放行后才申请限流令牌，被拒绝的请求不消耗令牌
+                if rate_limiter is not None:
+                    rate_limiter.acquire(deadline=deadline, cancel_event=cancel_event)
+                response = timed_request(service, send, *args, **_with_deadline(kwargs, deadline))
+        except (BulkheadFullError, DownstreamError):
+            # 舱壁或限流排队超时、排队期间取消，请求未发出，不计入熔断统计
+            breaker.after_call(None)
+            raise
+        except Exception as e:
+            delay = _retry_delay_after_exception(service, e, attempt, policy, breaker, deadline)
+            if delay is None:
+                raise
+        except BaseException:
+            # 中断等非Exception退出不代表下游健康状况，但必须释放半开状态的探测名额，否则熔断器永远拒绝请求
+            breaker.after_call(None)
+            raise
+        else:
+            delay = _retry_delay_after_response(service, response, attempt, policy, breaker, deadline)
+            if delay is None:
+                return response
+
+        attempt += 1
+        DOWNSTREAM_RETRIES.inc(service=service)
+        logger.info(f"等待{delay:.2f}秒后重试{service}请求，尝试次数: {attempt + 1}/{policy.max_attempts}")
+        if cancel_event is not None:
+            cancel_event.wait(delay)
+        else:
+            time.sleep(delay)
+
+async def call_downstream_async(service, send, *args, max_attempts=None, deadline=None, rate_limiter=None, **kwargs):
+    """call_downstream的协程版本，send为协程函数；网络异常最终以DownstreamRequestError抛出"""
+    policy = _retry_policy(max_attempts)
+    breaker = get_circuit_breaker(service)
+    bulkhead = get_bulkhead(service)
+    _retry_budget.on_request()
+
+    attempt = 0
+    while True:
+        _check_deadline(service, deadline)
+        breaker.before_call()
+        try:
+            async with bulkhead.async_slot(remaining_time(deadline)):
+                if rate_limiter is not None:
+                    await rate_limiter.acquire_async(deadline=deadline)
+                response = await timed_request_async(service, send, *args, **_with_deadline(kwargs, deadline))
+        except (BulkheadFullError, DownstreamError):
+            breaker.after_call(None)
+            raise
+        except Exception as e:
+            delay = _retry_delay_after_exception(service, e, attempt, policy, breaker, deadline)
+            if delay is None:
+                if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                    raise DownstreamRequestError(f'{type(e).__name__} {str(e)}') from e
+                raise
+        except BaseException:
+            # 对冲落败、截止时间到期等取消（CancelledError）同样需要释放半开状态的探测名额
+            breaker.after_call(None)
+            raise
+        else:
+            delay = _retry_delay_after_response(service, response, attempt, policy, breaker, deadline)
+            if delay is None:
+                return response
+
+        attempt += 1
+        DOWNSTREAM_RETRIES.inc(service=service)
+        logger.info(f"等待{delay:.2f}秒后重试{service}请求，尝试次数: {attempt + 1}/{policy.max_attempts}")
+        await asyncio.sleep(delay)
+
+def _collect_resilience_metrics():
+    """把熔断器状态和重试预算导出为Prometheus指标"""
+    stats = get_resilience_stats()
+    return (
+        gauge_family('pigai_circuit', '下游熔断器状态（state_code: 0关闭 1半开 2打开）', 'service', stats['circuit_breakers'])
+        + gauge_family('pigai_retry_budget', '全局重试预算', 'scope', {'global': stats['retry_budget']})
+    )
+
+REGISTRY.register_collector(_collect_resilience_metrics)
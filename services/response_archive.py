@@ -0,0 +1,173 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+
+class ResponseArchive:
+    """单个批改任务的下游原始响应归档
+
+    每条记录占一行JSON，type为segmentation、ocr、retrieval或grading，附带页码、题号和raw_result，
+    整个文件gzip压缩。首次写入时才创建文件，缓存命中等没有远程调用的任务不产生归档。
+    写入失败只记录日志，不影响批改。
+    """
+
+    def __init__(self, archive_id, path, compresslevel):
+        self.archive_id = archive_id
+        self.path = path
+        self.compresslevel = compresslevel
+        self.records = 0
+        self._file = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def record(self, kind, raw_result, **fields):
+        """追加一条原始响应记录，raw_result为空时忽略
+
+        Args:
+            kind: 记录类型（segmentation、ocr、retrieval、grading）
+            raw_result: 下游服务返回的原始JSON
+            **fields: 页码、题号、查询文本、耗时等附加字段
+        """
+        if raw_result is None:
+            return
+        try:
+            line = json.dumps(
+                dict(fields, type=kind, recorded_at=time.time(), raw_result=raw_result),
+                ensure_ascii=False, separators=(',', ':'), default=str
+            )
+        except (TypeError, ValueError) as e:
+            logger.warning(f"原始响应归档记录序列化失败: {self.archive_id}，类型: {kind}，原因: {str(e)}")
+            return
+
+        with self._lock:
+            if self._failed:
+                return
+            try:
+                if self._file is None:
+                    self._file = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=self.compresslevel)
+                self._file.write(line)
+                self._file.write('\n')
+                self.records += 1
+            except OSError as e:
+                logger.error(f"原始响应归档写入失败，本任务不再归档: {self.path}，原因: {str(e)}")
+                self._failed = True
+
+    def for_page(self, page):
+        """返回写入时自动附带页码的归档视图（页码从0开始）"""
+        return PageArchive(self, page)
+
+    def close(self):
+        """关闭归档文件"""
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError as e:
+                    logger.error(f"原始响应归档关闭失败: {self.path}，原因: {str(e)}")
+                self._file = None
+
+    @property
+    def written(self):
+        """是否已写入至少一条记录"""
+        return self.records > 0
+
+
+class PageArchive:
+    """批量任务中单页的归档视图"""
+
+    def __init__(self, archive, page):
+        self.archive = archive
+        self.page = page
+
+    def record(self, kind, raw_result, **fields):
+        self.archive.record(kind, raw_result, page=self.page, **fields)
+
+
+class ResponseArchiveStore:
+    """原始响应归档目录
+
+    每个批改任务一个归档文件，以任务ID命名。超过保留期的归档在创建新归档时清理（最多每小时扫描一次）。
+    """
+
+    CLEANUP_INTERVAL = 3600
+
+    def __init__(self, directory, compresslevel, ttl):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.created = 0
+        self.removed = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, archive_id):
+        """归档文件路径"""
+        return os.path.join(self.directory, f"{archive_id}{ARCHIVE_SUFFIX}")
+
+    def create(self, archive_id=None):
+        """为一个批改任务创建归档
+
+        Args:
+            archive_id: 归档ID（可选，通常为任务ID），默认生成新的ID
+
+        Returns:
+            ResponseArchive: 归档写入器，任务结束后需调用close()
+        """
+        archive_id = archive_id or uuid.uuid4().hex
+        self._cleanup_expired()
+        with self._lock:
+            self.created += 1
+        return ResponseArchive(archive_id, self.path(archive_id), self.compresslevel)
+
+    def _cleanup_expired(self):
+        """删除超过保留期的归档"""
+        now = time.time()
+        with self._lock:
+            if not self.ttl or now - self._last_cleanup < self.CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(ARCHIVE_SUFFIX):
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            with self._lock:
+                self.removed += removed
+            logger.info(f"清理{removed}个过期原始响应归档")
+
+    def stats(self):
+        """返回归档统计"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'created': self.created,
+                'removed': self.removed
+            }
+
+
+def read_archive(path):
+    """按写入顺序逐条读取归档记录，进程中途退出导致文件不完整时返回已写入的部分"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            logger.warning(f"原始响应归档不完整，只读取到中断前的记录: {path}")
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class CharGridIndex:
+    """字符框的均匀网格索引
+
+    每页建立一次：每个字符按外接矩形左上角登记到一个网格单元中，查询时把区域向左、向上扩展最大字符尺寸，
+    只检查扩展后区域覆盖的单元中的字符。整页分配的耗时与字符数近似线性，不再是题目数×字符数。
+    查询结果为整页字符表的视图，保持字符在表中的原始顺序。
+    """
+
+    def __init__(self, char_table, cell_size=0):
+        """
+        Args:
+            char_table: 整页字符表（CharTable）
+            cell_size: 网格单元边长（像素），不大于0时按字符高度中位数的4倍自动选择
+        """
+        self.char_table = char_table
+        coordinates = char_table.coordinates
+        xs = coordinates[:, 0::2]
+        ys = coordinates[:, 1::2]
+        boxes = np.stack([xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)], axis=1)
+        self._points = coordinates[:, :2].tolist()  # 每个字符的第一个坐标点，与原有的左上角分配逻辑一致
+        self._boxes = boxes.tolist()
+
+        widths = boxes[:, 2] - boxes[:, 0]
+        heights = boxes[:, 3] - boxes[:, 1]
+        self._max_width = int(widths.max(initial=0))
+        self._max_height = int(heights.max(initial=0))
+
+        if cell_size <= 0:
+            positive = heights[heights > 0]
+            cell_size = 4 * float(np.median(positive)) if len(positive) else 64
+        self.cell_size = max(1.0, float(cell_size))
+
+        self._cells = {}
+        size = self.cell_size
+        for slot, box in enumerate(self._boxes):
+            key = (int(box[0] // size), int(box[1] // size))
+            cell = self._cells.get(key)
+            if cell is None:
+                self._cells[key] = [slot]
+            else:
+                cell.append(slot)
+
+    def _candidates(self, x1, y1, x2, y2):
+        """左上角落在扩展区域内的字符槽位（扩展量为最大字符宽高，保证与区域相交的字符都被覆盖）"""
+        size = self.cell_size
+        cx1 = int((x1 - self._max_width) // size)
+        cy1 = int((y1 - self._max_height) // size)
+        cx2 = int(x2 // size)
+        cy2 = int(y2 // size)
+        candidates = []
+        # 区域覆盖的单元数多于已登记的单元数时，直接遍历已登记单元
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            for (cx, cy), slots in self._cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    candidates.extend(slots)
+        else:
+            cells = self._cells
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    slots = cells.get((cx, cy))
+                    if slots:
+                        candidates.extend(slots)
+        return candidates
+
+    def query(self, x1, y1, x2, y2, rule='top_left', min_overlap=0.5):
+        """查询归属于指定区域的字符
+
+        Args:
+            x1, y1, x2, y2: 区域坐标（左上角和右下角）
+            rule: 判定规则：top_left为字符第一个坐标点在区域内，center为字符中心点在区域内，
+                overlap为字符框与区域的相交面积不低于字符面积的min_overlap
+            min_overlap: overlap规则的面积比例阈值
+
+        Returns:
+            CharTable: 归属于该区域的字符（整页字符表的视图），保持原始顺序
+        """
+        candidates = self._candidates(x1, y1, x2, y2)
+        if rule == 'top_left':
+            points = self._points
+            slots = [slot for slot in candidates
+                     if x1 <= points[slot][0] <= x2 and y1 <= points[slot][1] <= y2]
+        elif rule == 'center':
+            boxes = self._boxes
+            slots = [slot for slot in candidates
+                     if x1 <= (boxes[slot][0] + boxes[slot][2]) / 2 <= x2
+                     and y1 <= (boxes[slot][1] + boxes[slot][3]) / 2 <= y2]
+        elif rule == 'overlap':
+            slots = [slot for slot in candidates if self._overlaps(self._boxes[slot], x1, y1, x2, y2, min_overlap)]
+        else:
+            raise ValueError(f'未知的字符分配规则: {rule}')
+
+        slots.sort()
+        return self.char_table.view(slots)
+
+    @staticmethod
+    def _overlaps(box, x1, y1, x2, y2, min_overlap):
+        """字符框与区域的相交面积占字符框面积的比例是否不低于min_overlap"""
+        bx1, by1, bx2, by2 = box
+        overlap_w = min(bx2, x2) - max(bx1, x1)
+        overlap_h = min(by2, y2) - max(by1, y1)
+        if overlap_w < 0 or overlap_h < 0:
+            return False
+        area = (bx2 - bx1) * (by2 - by1)
+        if area <= 0:
+            return True
+        return overlap_w * overlap_h >= min_overlap * area
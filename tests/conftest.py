@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试从仓库根目录导入config和services，与app.py的运行方式一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.async_engine import AsyncEngine, AsyncResponse
+from services.resilience import _retry_after
+
+
+class _RetryAfterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(503)
+        self.send_header('retry-after', '3')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _RetryAfterHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/'
+    httpd.shutdown()
+
+
+def test_response_headers_are_case_insensitive():
+    response = AsyncResponse(503, {'retry-after': '2'}, b'')
+    assert response.headers['Retry-After'] == '2'
+    assert _retry_after(response) == 2.0
+
+
+def test_send_keeps_lowercase_retry_after(server):
+    engine = AsyncEngine(4)
+    response = engine.run(engine._send('GET', server, timeout=5), timeout=10)
+    assert response.status_code == 503
+    assert _retry_after(response) == 3.0
@@ -0,0 +1,58 @@
+import json
+
+from services.char_table import CharTable, char_detail_dicts
+
+
+def _quad(x, y, size=10):
+    return [x, y, x + size, y, x + size, y + size, x, y + size]
+
+
+def _items():
+    return [
+        {'text': '1+1', 'char_coordinates': [_quad(0, 0), _quad(10, 0), _quad(20, 0)]},
+        {'text': '', 'char_coordinates': []},
+        {'text': '答案2', 'char_coordinates': [_quad(0, 20), _quad(10.4, 20), _quad(20.6, 20)]},
+    ]
+
+
+def test_from_text_items_matches_dict_format():
+    table = CharTable.from_text_items(_items())
+    assert len(table) == 6
+    assert table.text == '1+1答案2'
+    assert list(table.block_offsets) == [0, 3, 6]
+    assert table[4] == {'character': '案', 'coordinates': _quad(10, 20), 'index': 1}
+    assert table[5]['coordinates'] == _quad(21, 20)
+    assert list(table) == table.to_dicts()
+    json.dumps(char_detail_dicts(table))
+
+
+def test_mismatched_and_malformed_coordinates():
+    table = CharTable.from_text_items([
+        {'text': 'abcd', 'char_coordinates': [_quad(0, 0), _quad(10, 0)]},
+        {'text': 'xyz', 'char_coordinates': [_quad(0, 20), [1, 2, 3], _quad(20, 20)]},
+    ])
+    assert table.text == 'abxz'
+    assert [char['index'] for char in table] == [0, 1, 0, 2]
+
+
+def test_view_shares_storage_and_nests():
+    table = CharTable.from_text_items(_items())
+    view = table.view([5, 0, 3])
+    assert view.text == '21答'
+    assert view.coordinates.tolist() == [_quad(21, 20), _quad(0, 0), _quad(0, 20)]
+    assert view._coordinates is table._coordinates
+    nested = view.view([2, 0])
+    assert nested.text == '答2'
+    assert [char['index'] for char in nested] == [0, 2]
+
+
+def test_empty_table():
+    table = CharTable.from_text_items([{'text': 'a', 'char_coordinates': [[1, 2]]}])
+    assert len(table) == 0
+    assert table.to_dicts() == []
+    assert table.view([]).text == ''
+
+
+def test_char_detail_dicts_passes_lists_through():
+    details = [{'character': 'a', 'coordinates': _quad(0, 0), 'index': 0}]
+    assert char_detail_dicts(details) is details
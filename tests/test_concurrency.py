@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.concurrency import Bulkhead, BulkheadFullError
+
+
+def test_sync_and_async_calls_share_the_limit():
+    bulkhead = Bulkhead('test', 2)
+    release_threads = threading.Event()
+    threads_holding = threading.Barrier(3)
+
+    def hold_slot():
+        with bulkhead.slot():
+            threads_holding.wait()
+            release_threads.wait(5)
+
+    threads = [threading.Thread(target=hold_slot) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    threads_holding.wait()
+
+    async def call():
+        async with bulkhead.async_slot():
+            await asyncio.sleep(0.01)
+
+    async def run():
+        task = asyncio.ensure_future(call())
+        await asyncio.sleep(0.05)
+        # 两个线程占满名额，协程只能排队
+        assert not task.done()
+        assert bulkhead.in_flight == 2
+        release_threads.set()
+        await asyncio.wait_for(task, 2)
+
+    asyncio.run(run())
+    for thread in threads:
+        thread.join()
+    assert bulkhead.peak_in_flight == 2
+    assert bulkhead.saturated_calls == 1
+    assert bulkhead.in_flight == 0
+
+
+def test_async_waiter_is_woken_by_thread_release():
+    bulkhead = Bulkhead('test', 1)
+    bulkhead.ASYNC_POLL_INTERVAL = 10  # 只能靠释放名额时的唤醒
+
+    def hold_slot():
+        with bulkhead.slot():
+            time.sleep(0.1)
+
+    async def run():
+        thread = threading.Thread(target=hold_slot)
+        thread.start()
+        await asyncio.sleep(0.02)
+        start = time.monotonic()
+        async with bulkhead.async_slot():
+            waited = time.monotonic() - start
+        thread.join()
+        return waited
+
+    assert asyncio.run(run()) < 1
+
+
+def test_async_wait_timeout_rejects():
+    bulkhead = Bulkhead('test', 1, wait_timeout=0.05)
+
+    async def run():
+        with bulkhead.slot():
+            with pytest.raises(BulkheadFullError):
+                async with bulkhead.async_slot():
+                    pass
+
+    asyncio.run(run())
+    assert bulkhead.rejected_calls == 1
+    assert bulkhead.in_flight == 0
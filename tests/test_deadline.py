@@ -0,0 +1,43 @@
+import pytest
+
+from services import deadline as deadline_module
+from services.deadline import Deadline, remaining_time
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(deadline_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_from_ms(clock):
+    assert Deadline.from_ms(None) is None
+    assert Deadline.from_ms(0) is None
+    assert Deadline.from_ms(-5) is None
+    assert Deadline.from_ms(1500).remaining() == 1.5
+
+
+def test_remaining_and_expired(clock):
+    deadline = Deadline(2)
+    clock[0] += 1.5
+    assert deadline.remaining() == 0.5
+    assert not deadline.expired()
+    clock[0] += 1
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+
+
+def test_clamp_timeout(clock):
+    deadline = Deadline(3)
+    assert deadline.clamp_timeout(None) == 3
+    assert deadline.clamp_timeout(10) == 3
+    assert deadline.clamp_timeout(1) == 1
+    assert deadline.clamp_timeout((5, 2)) == (3, 2)
+    clock[0] += 3
+    assert deadline.clamp_timeout((5, 2)) == (0, 0)
+
+
+def test_remaining_time_default(clock):
+    assert remaining_time(None, 7) == 7
+    assert remaining_time(Deadline(4)) == 4
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from services import disk_cache as disk_cache_module
+from services.disk_cache import DiskCache
+
+
+def _cache(directory, **kwargs):
+    params = dict(max_entries=3, ttl=0)
+    params.update(kwargs)
+    return DiskCache('测试', str(directory), **params)
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get('a') is None
+    assert cache.set('a', {'text': '题目', 'pos': [1, 2]})
+    assert cache.get('a') == {'text': '题目', 'pos': [1, 2]}
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = _cache(tmp_path)
+    for key in 'abc':
+        cache.set(key, key)
+    cache.get('a')
+    cache.set('d', 'd')
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == ['a', 'c', 'd']
+    assert not os.path.exists(os.path.join(tmp_path, 'b.json'))
+    assert cache.evictions == 1
+
+
+def test_evicts_by_total_bytes(tmp_path):
+    cache = _cache(tmp_path, max_entries=100, max_bytes=250)
+    for key in 'abcd':
+        cache.set(key, 'x' * 80)
+    stats = cache.stats()
+    assert stats['bytes'] <= 250
+    assert stats['entries'] < 4
+    assert cache.get('d') == 'x' * 80
+    assert cache.get('a') is None
+
+
+def test_expired_entry_is_dropped(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, ttl=10)
+    cache.set('a', 1)
+    now = time.time()
+    monkeypatch.setattr(disk_cache_module.time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+    assert not os.path.exists(os.path.join(tmp_path, 'a.json'))
+
+
+@pytest.mark.parametrize('compresslevel', [0, 6])
+def test_index_restored_in_access_order(tmp_path, compresslevel):
+    cache = _cache(tmp_path, compresslevel=compresslevel)
+    for key in 'abc':
+        cache.set(key, key)
+    # 文件修改时间记录访问顺序：a最近被访问
+    for offset, key in enumerate('bca'):
+        path = cache._path(key)
+        os.utime(path, (1000 + offset, 1000 + offset))
+
+    reopened = _cache(tmp_path, compresslevel=compresslevel)
+    assert reopened.stats()['bytes'] == cache.stats()['bytes']
+    reopened.set('d', 'd')
+    assert reopened.get('b') is None
+    assert reopened.get('a') == 'a'
+
+
+def test_corrupt_entry_is_discarded(tmp_path):
+    cache = _cache(tmp_path, compresslevel=6)
+    cache.set('a', 1)
+    with open(cache._path('a'), 'wb') as f:
+        f.write(b'not gzip')
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+from services import hedging
+from services.concurrency import SharedExecutor
+from services.hedging import HedgePolicy, hedged_call, hedged_call_async
+
+
+def _policy(**overrides):
+    params = dict(service='test', percentile=90, initial_delay=0.5, min_delay=0.05,
+                  max_ratio=0.1, max_burst=2, window=100, min_samples=10)
+    params.update(overrides)
+    return HedgePolicy(**params)
+
+
+def test_initial_delay_until_enough_samples():
+    policy = _policy()
+    for _ in range(9):
+        policy.observe(2.0)
+    assert policy.delay() == 0.5
+    policy.observe(2.0)
+    assert policy.delay() == 2.0
+
+
+def test_delay_is_percentile_of_recent_latencies():
+    policy = _policy()
+    for i in range(1, 101):
+        policy.observe(i / 100)
+    assert policy.delay() == 0.91
+    # 窗口只保留最近的样本
+    for _ in range(100):
+        policy.observe(0.2)
+    assert policy.delay() == 0.2
+
+
+def test_delay_not_below_min_delay():
+    policy = _policy()
+    for _ in range(20):
+        policy.observe(0.001)
+    assert policy.delay() == 0.05
+
+
+def test_hedge_budget_limits_ratio():
+    policy = _policy(max_ratio=0.5)
+    assert policy.try_hedge() and policy.try_hedge()
+    assert not policy.try_hedge()
+    for _ in range(2):
+        policy.on_request()
+    assert policy.try_hedge()
+    assert not policy.try_hedge()
+    assert policy.hedges == 3
+    assert policy.budget_exhausted == 2
+
+
+def test_async_hedge_wins_and_cancels_primary():
+    policy = _policy(initial_delay=0.02)
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+            return 'primary'
+        return 'hedge'
+
+    async def run():
+        return await asyncio.wait_for(hedged_call_async(policy, call, lambda result: True), 2)
+
+    assert asyncio.run(run()) == 'hedge'
+    assert policy.hedge_wins == 1
+
+
+def test_async_unaccepted_result_waits_for_the_other_attempt():
+    policy = _policy(initial_delay=0.02)
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(0.1)
+            return 'primary'
+        return None
+
+    result = asyncio.run(hedged_call_async(policy, call, lambda result: result is not None))
+    assert result == 'primary'
+    assert policy.hedge_wins == 0
+
+
+def test_queue_time_in_saturated_pool_does_not_trigger_hedge(monkeypatch):
+    executor = SharedExecutor('hedge-test', 1)
+    monkeypatch.setattr(hedging, 'get_executor', lambda name: executor)
+    policy = _policy(initial_delay=0.1)
+    release = threading.Event()
+    executor.submit(release.wait, 5)  # 占满线程池，原请求需要排队
+
+    def call():
+        time.sleep(0.05)
+        return 'primary'
+
+    threading.Timer(0.3, release.set).start()
+    assert hedged_call(policy, call, lambda result: True) == 'primary'
+    assert policy.hedges == 0
+    # 记录的是执行耗时，不含排队时间
+    assert max(policy._latencies) < 0.2
+
+
+def test_no_hedge_while_pool_has_backlog(monkeypatch):
+    executor = SharedExecutor('hedge-test', 1)
+    monkeypatch.setattr(hedging, 'get_executor', lambda name: executor)
+    policy = _policy(initial_delay=0.02)
+    queued = []
+
+    def call():
+        if not queued:
+            queued.append(executor.submit(time.sleep, 0))  # 原请求执行期间线程池出现积压
+        time.sleep(0.1)
+        return 'primary'
+
+    assert hedged_call(policy, call, lambda result: True) == 'primary'
+    assert policy.hedges == 0
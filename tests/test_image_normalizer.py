@@ -0,0 +1,80 @@
+import io
+
+import pytest
+from PIL import Image
+
+from config import Config
+from services.image_buffer import ImageBuffer
+from services.image_normalizer import (
+    EXIF_ORIENTATION, NormalizedImage, normalize_image, rescale_ocr_response, rescale_segmentation_response
+)
+
+
+def _jpeg(size, orientation=1):
+    image = Image.new('RGB', size, 'white')
+    exif = Image.Exif()
+    if orientation != 1:
+        exif[EXIF_ORIENTATION] = orientation
+    output = io.BytesIO()
+    image.save(output, 'JPEG', exif=exif)
+    return ImageBuffer(output.getvalue(), 'page.jpg')
+
+
+@pytest.fixture(autouse=True)
+def normalize_config(monkeypatch):
+    monkeypatch.setattr(Config, 'IMAGE_NORMALIZE_ENABLED', True)
+    monkeypatch.setattr(Config, 'IMAGE_MAX_SIDE', {'ocr': 1000})
+
+
+def test_small_upright_image_is_sent_as_is():
+    image = _jpeg((800, 600))
+    normalized = normalize_image(image, 'ocr')
+    assert normalized.data is image.data
+    assert not normalized.rescaled
+
+
+def test_large_image_is_downscaled():
+    normalized = normalize_image(_jpeg((3000, 1500)), 'ocr')
+    assert Image.open(io.BytesIO(normalized.data)).size == (1000, 500)
+    assert normalized.scale_x == normalized.scale_y == 3
+    assert normalized.size == (3000, 1500)
+
+
+def test_rotated_image_is_transposed_before_scaling():
+    # 方向6：存储为横向，显示为竖向
+    normalized = normalize_image(_jpeg((2000, 1000), orientation=6), 'ocr')
+    assert Image.open(io.BytesIO(normalized.data)).size == (500, 1000)
+    assert normalized.size == (1000, 2000)
+    assert normalized.scale_x == normalized.scale_y == 2
+
+
+def test_disabled_normalization_keeps_bytes(monkeypatch):
+    monkeypatch.setattr(Config, 'IMAGE_NORMALIZE_ENABLED', False)
+    image = _jpeg((3000, 1500))
+    assert normalize_image(image, 'ocr').data == image.data
+
+
+def test_rescale_ocr_response_maps_back_to_original_space():
+    result = {'result': {'pages': [{
+        'width': 1000, 'height': 500,
+        'content': [{'text': '1+1', 'pos': [10, 20, 30, 20, 30, 40, 10, 40],
+                     'char_pos': [[10, 20, 15, 20, 15, 40, 10, 40]]}],
+        'lines': [{'text': '1+1', 'position': [1, 2, 3, 2, 3, 4, 1, 4]}]
+    }]}}
+    rescale_ocr_response(result, NormalizedImage(b'', 3.0, 2.0, (3000, 1000)))
+    page = result['result']['pages'][0]
+    assert (page['width'], page['height']) == (3000, 1000)
+    assert page['content'][0]['pos'] == [30, 40, 90, 40, 90, 80, 30, 80]
+    assert page['content'][0]['char_pos'] == [[30, 40, 45, 40, 45, 80, 30, 80]]
+    assert page['lines'][0]['position'] == [3, 4, 9, 4, 9, 8, 3, 8]
+
+
+def test_rescale_segmentation_response():
+    result = {'detection_boxes': [[10, 20, 30, 40]]}
+    rescale_segmentation_response(result, NormalizedImage(b'', 2.0, 3.0))
+    assert result['detection_boxes'] == [[20, 60, 60, 120]]
+
+
+def test_unscaled_response_is_untouched():
+    result = {'detection_boxes': [[10, 20, 30, 40]]}
+    assert rescale_segmentation_response(result, NormalizedImage(b'')) == {'detection_boxes': [[10, 20, 30, 40]]}
@@ -0,0 +1,88 @@
+from services.layout_segmenter import LayoutSegmenter, compare_segmentations
+
+
+def _line(x, y, text, width=600, height=40):
+    return {'text': text, 'pos': [x, y, x + width, y, x + width, y + height, x, y + height]}
+
+
+def _ocr_result(*lines, width=2000):
+    return {'result': {'pages': [{'width': width, 'height': 3000, 'content': list(lines)}]}}
+
+
+def _detect(*lines):
+    result = LayoutSegmenter(gap_ratio=1.5).detect(_ocr_result(*lines))
+    assert result['success']
+    return result['detection_boxes'], result['detection_scores']
+
+
+def test_questions_split_at_numbers_and_extend_over_answer_space():
+    boxes, scores = _detect(
+        _line(100, 100, '1. 计算 1+1=?'),
+        _line(150, 400, '答案 2'),
+        _line(100, 700, '2. 计算 2+2=?'),
+        _line(100, 1000, '3. 计算 3+3=?')
+    )
+    assert len(boxes) == 3
+    assert scores == [0.7, 0.7, 0.7]
+    assert boxes[0][1] < 100 and 440 < boxes[0][3] < 700  # 包含作答行，延伸到第2题之前
+
+
+def test_page_title_before_first_number_is_dropped():
+    boxes, _ = _detect(
+        _line(300, 20, '七年级数学同步测试'),
+        _line(100, 100, '1. 计算 1+1=?'),
+        _line(100, 400, '2. 计算 2+2=?')
+    )
+    assert len(boxes) == 2
+    assert boxes[0][1] > 60
+
+
+def test_section_instructions_are_not_questions():
+    boxes, _ = _detect(
+        _line(100, 100, '一、选择题'),
+        _line(100, 160, '本大题共2小题，每小题3分'),
+        _line(100, 300, '1. 下列各数中最小的是'),
+        _line(100, 600, '2. 下列计算正确的是'),
+        _line(100, 900, '二、填空题'),
+        _line(100, 960, '请把答案填在横线上'),
+        _line(100, 1100, '3. 计算 3+3='),
+    )
+    assert len(boxes) == 3
+    tops = [box[1] for box in boxes]
+    assert tops == sorted(tops) and tops[0] > 200 and tops[2] > 1000
+    # 第2题的作答留白止于下一个分部标题
+    assert boxes[1][3] < 900
+
+
+def test_indented_lines_do_not_shift_margin():
+    # 作答内容比题号缩进且行数多，10%分位数会落在缩进位置；缩进的"1."不应被当作题号
+    lines = [_line(100, 100, '1. 解方程组')]
+    lines += [_line(400, 160 + 40 * i, f'第{i}步 x+y={i}') for i in range(20)]
+    lines += [_line(400, 1000, '1. 代入得 x=1')]
+    lines += [_line(100, 1100, '2. 化简')]
+    boxes, _ = _detect(*lines)
+    assert len(boxes) == 2
+
+
+def test_gap_split_without_numbers():
+    boxes, scores = _detect(
+        _line(100, 100, '计算'),
+        _line(100, 150, '继续'),
+        _line(100, 500, '另一题'),
+    )
+    assert len(boxes) == 2
+    assert scores == [0.4, 0.4]
+
+
+def test_non_pages_result_is_rejected():
+    assert not LayoutSegmenter().detect({'result': {'detail': []}})['success']
+
+
+def test_compare_segmentations():
+    reference = [{'x1': 0, 'y1': 0, 'x2': 100, 'y2': 100}, {'x1': 0, 'y1': 200, 'x2': 100, 'y2': 300}]
+    candidate = [{'x1': 0, 'y1': 0, 'x2': 100, 'y2': 90}, {'x1': 500, 'y1': 500, 'x2': 600, 'y2': 600}]
+    agreement = compare_segmentations(reference, candidate, 0.5)
+    assert agreement['matched'] == 1
+    assert agreement['precision'] == 0.5 and agreement['recall'] == 0.5
+    assert abs(agreement['mean_iou'] - 0.9) < 1e-9
+    assert compare_segmentations([], [])['precision'] == 1.0
@@ -0,0 +1,38 @@
+import pytest
+
+from config import Config
+from services import image_normalizer
+from services.ocr_service import OCRService
+
+
+@pytest.fixture
+def ocr():
+    return OCRService()
+
+
+def test_same_image_and_params_share_key(ocr):
+    assert ocr._cache_key(b'image') == ocr._cache_key(b'image')
+    assert ocr._cache_key(b'image') != ocr._cache_key(b'other')
+
+
+@pytest.mark.parametrize('name, value', [
+    ('IMAGE_NORMALIZE_JPEG_QUALITY', 50),
+    ('IMAGE_NORMALIZE_ENABLED', False),
+    ('IMAGE_MAX_SIDE', {'ocr': 1234}),
+])
+def test_normalizer_params_change_key(ocr, monkeypatch, name, value):
+    before = ocr._cache_key(b'image')
+    monkeypatch.setattr(Config, name, value)
+    assert ocr._cache_key(b'image') != before
+
+
+def test_normalizer_version_changes_key(ocr, monkeypatch):
+    before = ocr._cache_key(b'image')
+    monkeypatch.setattr(image_normalizer, 'NORMALIZER_VERSION', image_normalizer.NORMALIZER_VERSION + 1)
+    assert ocr._cache_key(b'image') != before
+
+
+def test_api_url_changes_key(ocr):
+    before = ocr._cache_key(b'image')
+    ocr.api_url = ocr.api_url + '&char_details=0'
+    assert ocr._cache_key(b'image') != before
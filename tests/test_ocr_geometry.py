@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from services.image_processor import ImageProcessor
+from services.ocr_geometry import PageGeometry
+
+
+def _quad(x, y, w, h):
+    return [x, y, x + w, y, x + w, y + h, x, y + h]
+
+
+def _random_page(seed, blocks=40):
+    rng = random.Random(seed)
+    content = []
+    for _ in range(blocks):
+        x, y = rng.randint(0, 1800), rng.randint(0, 2400)
+        size = rng.randint(10, 60)
+        text = ''.join(rng.choice('甲乙丙丁12+=?') for _ in range(rng.randint(1, 8)))
+        char_pos = [_quad(x + i * size, y + rng.randint(-3, 3), size, size) for i in range(len(text))]
+        content.append({'text': text, 'pos': _quad(x, y, size * len(text), size), 'char_pos': char_pos})
+    return {'result': {'pages': [{'width': 2000, 'height': 2500, 'content': content}]}}
+
+
+def _random_regions(seed, count=15):
+    rng = random.Random(seed)
+    regions = []
+    for _ in range(count):
+        x1, y1 = rng.randint(-50, 1800), rng.randint(-50, 2300)
+        regions.append((x1, y1, x1 + rng.randint(0, 900), y1 + rng.randint(0, 700)))
+    return regions
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_region_texts_match_reference_extraction(seed):
+    page = _random_page(seed)
+    regions = _random_regions(seed)
+    geometry = PageGeometry.from_ocr_result(page)
+    processor = ImageProcessor()
+    expected = [processor._extract_region_text(page, *region) for region in regions]
+    assert geometry.region_texts(regions) == expected
+
+
+def test_geometry_without_pages_is_none():
+    assert PageGeometry.from_ocr_result({'result': {'lines': []}}) is None
+    assert PageGeometry.from_ocr_result(None) is None
+
+
+def test_empty_geometry_returns_empty_texts():
+    geometry = PageGeometry.from_ocr_result({'result': {'pages': [{'content': []}]}})
+    assert geometry.region_texts([(0, 0, 10, 10)]) == ['']
+    assert geometry.region_texts([]) == []
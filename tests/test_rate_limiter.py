@@ -0,0 +1,105 @@
+import io
+
+import pytest
+from PIL import Image
+
+from config import Config
+from services import ocr_service, resilience
+from services.concurrency import BulkheadFullError
+from services.image_buffer import ImageBuffer
+from services.ocr_service import OCRService
+from services.rate_limiter import QuotaExceededError, SharedRateLimiter
+from services.resilience import CircuitBreaker, CircuitOpenError, call_downstream
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = ''
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return SharedRateLimiter('test', str(tmp_path / 'limits.sqlite3'), qps=0, burst=1, daily_budget=3, max_wait=1)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(Config, 'RETRY_DELAY', 0)
+    monkeypatch.setattr(Config, 'RETRY_MAX_DELAY', 0)
+
+
+def _open_breaker(monkeypatch, service):
+    breaker = CircuitBreaker(service, failure_threshold=1, recovery_timeout=3600)
+    monkeypatch.setitem(resilience._breakers, service, breaker)
+    breaker.before_call()
+    breaker.after_call(False)
+    return breaker
+
+
+def test_charge_and_refund(limiter):
+    for _ in range(3):
+        limiter.charge()
+    with pytest.raises(QuotaExceededError):
+        limiter.charge()
+    limiter.refund()
+    assert limiter.stats()['used_today'] == 2
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_retries_take_tokens_but_not_daily_budget(limiter, monkeypatch):
+    monkeypatch.setitem(resilience._breakers, 'ocr', CircuitBreaker('ocr', failure_threshold=5, recovery_timeout=60))
+    responses = [_Response(503), _Response(503), _Response(200)]
+    response = call_downstream('ocr', lambda: responses.pop(0), max_attempts=3, rate_limiter=limiter)
+    assert response.status_code == 200
+    stats = limiter.stats()
+    assert stats['acquired'] == 3
+    assert stats['used_today'] == 0
+
+
+def test_breaker_rejected_call_takes_no_token(limiter, monkeypatch):
+    _open_breaker(monkeypatch, 'ocr')
+    with pytest.raises(CircuitOpenError):
+        call_downstream('ocr', lambda: _Response(200), rate_limiter=limiter)
+    assert limiter.stats()['acquired'] == 0
+    assert limiter.stats()['used_today'] == 0
+
+
+def _page():
+    output = io.BytesIO()
+    Image.new('RGB', (100, 100), 'white').save(output, 'JPEG')
+    return ImageBuffer(output.getvalue(), 'page.jpg')
+
+
+def test_ocr_charges_page_once(limiter, monkeypatch):
+    calls = []
+
+    def fake_call_downstream(*args, rate_limiter=None, **kwargs):
+        calls.append(rate_limiter)
+        return _Response(500)
+
+    monkeypatch.setattr(ocr_service, 'get_rate_limiter', lambda name: limiter)
+    monkeypatch.setattr(ocr_service, 'call_downstream', fake_call_downstream)
+    assert not OCRService().extract_text(_page())['success']
+    assert calls == [limiter]
+    assert limiter.stats()['used_today'] == 1
+
+
+@pytest.mark.parametrize('error', [BulkheadFullError('full'), CircuitOpenError('open')])
+def test_ocr_refunds_page_that_was_not_sent(limiter, monkeypatch, error):
+    def fake_call_downstream(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(ocr_service, 'get_rate_limiter', lambda name: limiter)
+    monkeypatch.setattr(ocr_service, 'call_downstream', fake_call_downstream)
+    assert not OCRService().extract_text(_page())['success']
+    assert limiter.stats()['used_today'] == 0
+
+
+def test_ocr_open_breaker_does_not_charge(limiter, monkeypatch):
+    _open_breaker(monkeypatch, 'ocr')
+    monkeypatch.setattr(ocr_service, 'get_rate_limiter', lambda name: limiter)
+    result = OCRService().extract_text(_page())
+    assert '熔断' in result['error']
+    assert limiter.stats()['used_today'] == 0
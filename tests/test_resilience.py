@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy
+
+
+def _half_open_breaker(monkeypatch, service):
+    """替换指定服务的熔断器为已熔断且恢复期已到的熔断器"""
+    breaker = CircuitBreaker(service, failure_threshold=1, recovery_timeout=0)
+    monkeypatch.setitem(resilience._breakers, service, breaker)
+    breaker.before_call()
+    breaker.after_call(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_recovers_after_probe():
+    breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=0)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.after_call(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_call()  # 恢复期已到，放行探测请求
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 探测请求进行中，其余请求被拒绝
+
+    breaker.after_call(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0)
+    breaker.before_call()
+    breaker.after_call(False)
+    breaker.before_call()
+    breaker.after_call(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_cancelled_half_open_probe_releases_slot(monkeypatch):
+    breaker = _half_open_breaker(monkeypatch, 'ocr')
+
+    async def never_returns(*args, **kwargs):
+        await asyncio.sleep(3600)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(resilience.call_downstream_async('ocr', never_returns, max_attempts=1))
+        await asyncio.sleep(0.05)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+
+    breaker.before_call()  # 探测名额已释放，下一个请求可以作为新的探测请求
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_interrupted_sync_probe_releases_slot(monkeypatch):
+    breaker = _half_open_breaker(monkeypatch, 'ocr')
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        resilience.call_downstream('ocr', interrupted, max_attempts=1)
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_retry_budget_limits_retries_to_ratio():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    budget.tokens = 0
+    for _ in range(4):
+        budget.on_request()
+    assert [budget.try_acquire() for _ in range(3)] == [True, False, False]
+    assert budget.exhausted == 2
+
+
+def test_retry_policy_backoff_is_capped():
+    policy = RetryPolicy(max_attempts=0, base_delay=1, max_delay=3)
+    assert policy.max_attempts == 1
+    assert all(0 <= policy.backoff(10) <= 3 for _ in range(100))
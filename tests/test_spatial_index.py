@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from services.char_table import CharTable
+from services.spatial_index import CharGridIndex
+
+
+def _quad(x, y, w, h):
+    return [x, y, x + w, y, x + w, y + h, x, y + h]
+
+
+def _random_table(seed, blocks=80):
+    rng = random.Random(seed)
+    text_items = []
+    for _ in range(blocks):
+        x, y = rng.randint(0, 1800), rng.randint(0, 2400)
+        size = rng.randint(10, 60)
+        text = ''.join(rng.choice('甲乙丙丁12+=?') for _ in range(rng.randint(1, 8)))
+        char_coordinates = [_quad(x + i * size, y + rng.randint(-3, 3), size, size) for i in range(len(text))]
+        text_items.append({'text': text, 'char_coordinates': char_coordinates})
+    return CharTable.from_text_items(text_items)
+
+
+def _random_regions(seed, count=30):
+    rng = random.Random(seed)
+    regions = []
+    for _ in range(count):
+        x1, y1 = rng.randint(-50, 1800), rng.randint(-50, 2300)
+        regions.append((x1, y1, x1 + rng.randint(0, 900), y1 + rng.randint(0, 700)))
+    return regions
+
+
+def _brute_force(table, region, rule, min_overlap=0.5):
+    x1, y1, x2, y2 = region
+    rows = []
+    for row, coords in enumerate(table.coordinates.tolist()):
+        xs, ys = coords[0::2], coords[1::2]
+        bx1, by1, bx2, by2 = min(xs), min(ys), max(xs), max(ys)
+        if rule == 'top_left':
+            inside = x1 <= coords[0] <= x2 and y1 <= coords[1] <= y2
+        elif rule == 'center':
+            inside = x1 <= (bx1 + bx2) / 2 <= x2 and y1 <= (by1 + by2) / 2 <= y2
+        else:
+            inside = CharGridIndex._overlaps([bx1, by1, bx2, by2], x1, y1, x2, y2, min_overlap)
+        if inside:
+            rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize('rule', ['top_left', 'center', 'overlap'])
+@pytest.mark.parametrize('cell_size', [0, 7, 500])
+def test_grid_index_matches_brute_force(rule, cell_size):
+    table = _random_table(42)
+    index = CharGridIndex(table, cell_size=cell_size)
+    for region in _random_regions(7):
+        expected = _brute_force(table, region, rule)
+        assert index.query(*region, rule=rule).to_dicts() == [table[row] for row in expected]
+
+
+def test_grid_index_rejects_unknown_rule():
+    table = _random_table(1)
+    with pytest.raises(ValueError):
+        CharGridIndex(table).query(0, 0, 10, 10, rule='nearest')